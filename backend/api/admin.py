@@ -1,9 +1,70 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.postgres.search import SearchQuery
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
 from django.contrib.auth.admin import UserAdmin
 from .models import (
     User, Subreddit, Post, Comment,
     Notification, Subscription, Keyword, CrawlHistory
 )
+from .keywords import matcher_cache, schedule_keyword_sync
+from .caching import KEYWORDS, invalidate_responses
+from .notifications import mark_unread, recount_unread
+from .pagination import EstimatedCountPaginator
+from .search import build_tsquery, post_search_vector, comment_search_vector
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables too large to count or scan on every page:
+    no unfiltered COUNT(*) (estimated on PostgreSQL, see EstimatedCountPaginator)
+    and searches answered from indexes.
+
+    On PostgreSQL the search term is matched against the full-text index
+    given by ``search_vector`` and exactly against ``exact_search_fields``;
+    other databases fall back to the usual ``search_fields`` lookups.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_vector = None
+    exact_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term or connections[queryset.db].vendor != 'postgresql':
+            return super().get_search_results(request, queryset, search_term)
+        condition = Q()
+        for field in self.exact_search_fields:
+            condition |= Q(**{field: term})
+        raw_query = build_tsquery(term) if self.search_vector else None
+        if raw_query is not None:
+            queryset = queryset.alias(search_document=self.search_vector())
+            condition |= Q(search_document=SearchQuery(raw_query, search_type='raw', config=settings.SEARCH_CONFIG))
+        if not condition:
+            return queryset.none(), False
+        return queryset.filter(condition), False
+
+
+class NotificationTypeFilter(admin.SimpleListFilter):
+    """Notification type filter whose choices are cached rather than read with a DISTINCT scan per page"""
+    title = 'type'
+    parameter_name = 'type'
+
+    def lookups(self, request, model_admin):
+        types = cache.get_or_set(
+            'admin:notification-types',
+            lambda: list(Notification.objects.order_by().values_list('type', flat=True).distinct()),
+            3600,
+        )
+        return [(notification_type, notification_type) for notification_type in sorted(types)]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(type=self.value())
+        return queryset
 
 
 # Customize the User admin display
@@ -32,20 +93,25 @@ class SubredditAdmin(admin.ModelAdmin):
 
 
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(LargeTableAdmin):
     list_display = ('title', 'author', 'subreddit_name', 'upvotes', 'comments_count', 'submission_date', 'manually_added')
-    list_filter = ('subreddit_name', 'manually_added', 'submission_date')
+    # By subreddit rather than subreddit_name, and no date_hierarchy: both need a DISTINCT over the whole table
+    list_filter = ('subreddit', 'manually_added', 'submission_date')
     search_fields = ('title', 'body', 'author', 'reddit_id')
-    date_hierarchy = 'submission_date'
+    search_vector = staticmethod(post_search_vector)
+    exact_search_fields = ('reddit_id', 'author')
     readonly_fields = ('created_at', 'updated_at')
     list_per_page = 25
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = ('get_short_body', 'author', 'post', 'parent_comment', 'upvotes', 'submission_date')
+    list_select_related = ('post', 'parent_comment')
     list_filter = ('submission_date',)
     search_fields = ('body', 'author', 'reddit_id')
+    search_vector = staticmethod(comment_search_vector)
+    exact_search_fields = ('reddit_id', 'author')
     raw_id_fields = ('post', 'parent_comment')
     readonly_fields = ('created_at', 'updated_at')
 
@@ -55,25 +121,31 @@ class CommentAdmin(admin.ModelAdmin):
 
 
 @admin.register(Notification)
-class NotificationAdmin(admin.ModelAdmin):
+class NotificationAdmin(LargeTableAdmin):
     list_display = ('user', 'type', 'read_status', 'created_at')
-    list_filter = ('type', 'read_status', 'created_at')
-    search_fields = ('content', 'user__username', 'user__email')
+    list_select_related = ('user',)
+    list_filter = (NotificationTypeFilter, 'read_status', 'created_at')
+    # Exact lookups served by the user indexes; searching the content would scan the whole table
+    search_fields = ('user__username__exact', 'user__email__exact')
     readonly_fields = ('created_at', 'updated_at')
     actions = ['mark_as_read', 'mark_as_unread']
 
     def mark_as_read(self, request, queryset):
+        # Before the update: a changelist filtered on read_status would select nothing after it
+        user_ids = set(queryset.values_list('user_id', flat=True))
         queryset.update(read_status=True)
+        recount_unread(user_ids)
     mark_as_read.short_description = "Mark selected notifications as read"
 
     def mark_as_unread(self, request, queryset):
-        queryset.update(read_status=False)
+        mark_unread(queryset)
     mark_as_unread.short_description = "Mark selected notifications as unread"
 
 
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     list_display = ('user', 'status', 'created_at', 'expires_at')
+    list_select_related = ('user',)
     list_filter = ('status', 'created_at', 'expires_at')
     search_fields = ('user__username', 'user__email', 'stripe_subscription_id')
     readonly_fields = ('created_at', 'updated_at')
@@ -87,19 +159,31 @@ class KeywordAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at', 'updated_at')
     actions = ['activate_keywords', 'deactivate_keywords']
 
+    # updated_at is bumped explicitly so other processes notice the change (see api.keywords)
     def activate_keywords(self, request, queryset):
-        queryset.update(active=True)
+        keyword_ids = list(queryset.filter(active=False).values_list('id', flat=True))
+        queryset.update(active=True, updated_at=timezone.now())
+        matcher_cache.invalidate()
+        invalidate_responses(KEYWORDS)
+        schedule_keyword_sync(keyword_ids, True)
     activate_keywords.short_description = "Activate selected keywords"
 
     def deactivate_keywords(self, request, queryset):
-        queryset.update(active=False)
+        keyword_ids = list(queryset.filter(active=True).values_list('id', flat=True))
+        queryset.update(active=False, updated_at=timezone.now())
+        matcher_cache.invalidate()
+        invalidate_responses(KEYWORDS)
+        schedule_keyword_sync(keyword_ids, False)
     deactivate_keywords.short_description = "Deactivate selected keywords"
 
 
 @admin.register(CrawlHistory)
-class CrawlHistoryAdmin(admin.ModelAdmin):
+class CrawlHistoryAdmin(LargeTableAdmin):
     list_display = ('subreddit', 'start_time', 'end_time', 'posts_found', 'comments_found', 'status')
+    list_select_related = ('subreddit',)
+    # No date_hierarchy: its date drill-down reads the distinct dates of the whole table
     list_filter = ('status', 'start_time', 'subreddit')
-    search_fields = ('subreddit__name', 'error_message')
-    date_hierarchy = 'start_time'
+    # Exact subreddit name, served by its unique index; searching error_message would scan every row
+    search_fields = ('subreddit__name__exact',)
+    exact_search_fields = ('subreddit__name',)
     readonly_fields = ('created_at',)
\ No newline at end of file
@@ -0,0 +1,295 @@
+import datetime
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DateTimeField, Q
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from .models import (
+    Post, Comment, PostKeywordMatch, CommentKeywordMatch, SubredditDailyStats, KeywordDailyStats,
+    AnalyticsWatermark
+)
+from .caching import STATS, invalidate_responses
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - the pure Python paths below are used instead
+    np = None
+
+logger = logging.getLogger('api')
+
+WATERMARK = 'daily-rollups'
+# Upvote histogram buckets: 0 holds posts with no (or negative) upvotes, bucket k >= 1 those with
+# 2**(k-1) <= upvotes < 2**k, i.e. the bit length of the upvote count; the last bucket is open ended
+HISTOGRAM_BUCKETS = 21
+
+# Daily rollups:
+#   SubredditDailyStats   posts, comments and upvote statistics per subreddit and day
+#   KeywordDailyStats     post and comment matches per keyword, subreddit and day
+# `manage.py refresh_stats` finds the days touched by rows changed since the
+# watermark and recomputes those days from scratch, so a refresh costs in
+# proportion to what changed rather than to the size of the corpus.
+
+
+def bucket_bounds():
+    """``(low, high)`` upvote bounds of each histogram bucket; ``high`` is None for the open-ended last one"""
+    bounds = [(None, 0)]
+    for bucket in range(1, HISTOGRAM_BUCKETS):
+        bounds.append((2 ** (bucket - 1), None if bucket == HISTOGRAM_BUCKETS - 1 else 2 ** bucket - 1))
+    return bounds
+
+
+def day_of(prefix=''):
+    """Expression for the UTC day a post or comment counts towards: its submission date, else its creation"""
+    return TruncDate(Coalesce(f'{prefix}submission_date', f'{prefix}created_at', output_field=DateTimeField()),
+                     tzinfo=datetime.timezone.utc)
+
+
+def in_days(days, prefix=''):
+    """Q matching the rows that fall on one of ``days``, in a form the submission_date indexes can serve"""
+    condition = Q()
+    for start, end in day_ranges(days):
+        start = datetime.datetime.combine(start, datetime.time(), datetime.timezone.utc)
+        end = datetime.datetime.combine(end, datetime.time(), datetime.timezone.utc)
+        condition |= Q(**{f'{prefix}submission_date__gte': start, f'{prefix}submission_date__lt': end})
+        condition |= Q(**{f'{prefix}submission_date__isnull': True, f'{prefix}created_at__gte': start,
+                          f'{prefix}created_at__lt': end})
+    return condition
+
+
+def day_ranges(days):
+    """Collapse dates into half-open ``(start, end)`` ranges of consecutive days"""
+    ranges = []
+    for day in sorted(days):
+        if ranges and ranges[-1][1] == day:
+            ranges[-1][1] = day + datetime.timedelta(days=1)
+        else:
+            ranges.append([day, day + datetime.timedelta(days=1)])
+    return [tuple(day_range) for day_range in ranges]
+
+
+def summarise_posts(rows):
+    """
+    Aggregate ``(subreddit_id, day, upvotes)`` rows into
+    ``{(subreddit_id, day): (posts, upvotes_total, upvotes_max, histogram)}``.
+    """
+    if np is not None:
+        return _summarise_posts_numpy(rows)
+    summaries = {}
+    for subreddit_id, day, upvotes in rows:
+        key = (subreddit_id, day)
+        summary = summaries.get(key)
+        if summary is None:
+            summary = summaries[key] = [0, 0, upvotes, [0] * HISTOGRAM_BUCKETS]
+        summary[0] += 1
+        summary[1] += upvotes
+        summary[2] = max(summary[2], upvotes)
+        summary[3][min(upvotes.bit_length(), HISTOGRAM_BUCKETS - 1) if upvotes > 0 else 0] += 1
+    return {key: tuple(summary) for key, summary in summaries.items()}
+
+
+def _summarise_posts_numpy(rows):
+    if not rows:
+        return {}
+    subreddit_ids, days, upvotes = zip(*rows)
+    ordinals = np.fromiter((day.toordinal() for day in days), dtype=np.int64, count=len(days))
+    keys = np.asarray(subreddit_ids, dtype=np.int64) * 1_000_000 + ordinals
+    upvotes = np.asarray(upvotes, dtype=np.int64)
+    unique, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse)
+    totals = np.zeros(len(unique), dtype=np.int64)
+    np.add.at(totals, inverse, upvotes)
+    maxima = np.full(len(unique), np.iinfo(np.int64).min)
+    np.maximum.at(maxima, inverse, upvotes)
+    # frexp's exponent of a positive integer is its bit length
+    buckets = np.where(upvotes > 0, np.frexp(np.maximum(upvotes, 1).astype(np.float64))[1], 0)
+    buckets = np.minimum(buckets, HISTOGRAM_BUCKETS - 1)
+    histograms = np.bincount(inverse * HISTOGRAM_BUCKETS + buckets,
+                             minlength=len(unique) * HISTOGRAM_BUCKETS).reshape(len(unique), HISTOGRAM_BUCKETS)
+    return {
+        (int(key // 1_000_000), datetime.date.fromordinal(int(key % 1_000_000))):
+            (int(count), int(total), int(maximum), histogram.tolist())
+        for key, count, total, maximum, histogram in zip(unique, counts, totals, maxima, histograms)
+    }
+
+
+@dataclass
+class RefreshResult:
+    """Counters for one rollup refresh"""
+    days: int = 0
+    subreddit_rows: int = 0
+    keyword_rows: int = 0
+    full: bool = False
+    duration: float = 0.0
+
+    def as_dict(self):
+        return {
+            'days': self.days,
+            'subreddit_rows': self.subreddit_rows,
+            'keyword_rows': self.keyword_rows,
+            'full': self.full,
+            'duration': round(self.duration, 3),
+        }
+
+
+def changed_days(since):
+    """Days touched by posts, comments or keyword matches changed after ``since`` (every day if None)"""
+    sources = [
+        (Post.objects, '', 'updated_at'),
+        (Comment.objects, '', 'updated_at'),
+        (PostKeywordMatch.objects, 'post__', 'created_at'),
+        (CommentKeywordMatch.objects, 'comment__', 'created_at'),
+    ]
+    days = set()
+    for manager, prefix, changed_field in sources:
+        queryset = manager.all()
+        if since is not None:
+            queryset = queryset.filter(**{f'{changed_field}__gt': since})
+        elif prefix:
+            # Every matched row is a post or comment counted on its own
+            continue
+        days.update(queryset.annotate(day=day_of(prefix)).order_by().values_list('day', flat=True).distinct())
+    return days
+
+
+def rollup_days(days):
+    """Recompute the subreddit and keyword rollups of ``days``, replacing their rows; returns the row counts"""
+    posts = list(Post.objects.filter(in_days(days)).annotate(day=day_of())
+                 .values_list('subreddit_id', 'day', 'upvotes').iterator(chunk_size=settings.STATS_CHUNK_SIZE))
+    summaries = summarise_posts(posts)
+    del posts
+    comments = (Comment.objects.filter(in_days(days)).annotate(day=day_of())
+                .order_by().values_list('post__subreddit_id', 'day').annotate(count=Count('id')))
+    comment_counts = {(subreddit_id, day): count for subreddit_id, day, count in comments}
+
+    subreddit_rows = []
+    for key in summaries.keys() | comment_counts.keys():
+        subreddit_id, day = key
+        posts_count, upvotes_total, upvotes_max, histogram = summaries.get(
+            key, (0, 0, 0, [0] * HISTOGRAM_BUCKETS))
+        subreddit_rows.append(SubredditDailyStats(
+            subreddit_id=subreddit_id, day=day, posts=posts_count, comments=comment_counts.get(key, 0),
+            upvotes_total=upvotes_total, upvotes_max=upvotes_max, upvote_histogram=histogram,
+        ))
+
+    keyword_counts = defaultdict(lambda: [0, 0])
+    for position, (manager, prefix, subreddit) in enumerate([
+            (PostKeywordMatch.objects, 'post__', 'post__subreddit_id'),
+            (CommentKeywordMatch.objects, 'comment__', 'comment__post__subreddit_id')]):
+        matches = (manager.filter(in_days(days, prefix), keyword__active=True).annotate(day=day_of(prefix))
+                   .order_by().values_list('keyword_id', subreddit, 'day').annotate(count=Count('id')))
+        for keyword_id, subreddit_id, day, count in matches:
+            keyword_counts[keyword_id, subreddit_id, day][position] = count
+    keyword_rows = [
+        KeywordDailyStats(keyword_id=keyword_id, subreddit_id=subreddit_id, day=day,
+                          posts=counts[0], comments=counts[1])
+        for (keyword_id, subreddit_id, day), counts in keyword_counts.items()
+    ]
+
+    with transaction.atomic():
+        SubredditDailyStats.objects.filter(day__in=days).delete()
+        KeywordDailyStats.objects.filter(day__in=days).delete()
+        SubredditDailyStats.objects.bulk_create(subreddit_rows, batch_size=1000)
+        KeywordDailyStats.objects.bulk_create(keyword_rows, batch_size=1000)
+    return len(subreddit_rows), len(keyword_rows)
+
+
+def refresh_rollups(full=False, days_per_batch=None):
+    """
+    Bring the daily rollups up to date with the rows changed since the last
+    refresh (or rebuild every day with ``full``), a batch of days at a time.
+    """
+    started = time.perf_counter()
+    days_per_batch = days_per_batch or settings.STATS_DAYS_PER_BATCH
+    now = timezone.now()
+    watermark = None if full else AnalyticsWatermark.objects.filter(name=WATERMARK).first()
+    # Re-read a margin before the watermark: rows saved just before the last
+    # refresh may have committed after it looked
+    since = watermark.value - datetime.timedelta(seconds=settings.STATS_WATERMARK_OVERLAP) if watermark else None
+    result = RefreshResult(full=since is None)
+
+    days = sorted(changed_days(since))
+    if result.full:
+        # Days left with no rows at all still have to lose their old rollups
+        days = sorted(set(days) | set(SubredditDailyStats.objects.values_list('day', flat=True))
+                      | set(KeywordDailyStats.objects.values_list('day', flat=True)))
+    for start in range(0, len(days), days_per_batch):
+        subreddit_rows, keyword_rows = rollup_days(days[start:start + days_per_batch])
+        result.subreddit_rows += subreddit_rows
+        result.keyword_rows += keyword_rows
+    result.days = len(days)
+
+    AnalyticsWatermark.objects.update_or_create(name=WATERMARK, defaults={'value': now})
+    if days:
+        invalidate_responses(STATS)
+    result.duration = time.perf_counter() - started
+    logger.info('Daily rollups refreshed: %s', result.as_dict())
+    return result
+
+
+# Reading the rollups
+
+def sum_histograms(histograms):
+    if np is not None:
+        matrix = np.asarray([histogram or [0] * HISTOGRAM_BUCKETS for histogram in histograms], dtype=np.int64)
+        return matrix.sum(axis=0).tolist() if len(matrix) else [0] * HISTOGRAM_BUCKETS
+    totals = [0] * HISTOGRAM_BUCKETS
+    for histogram in histograms:
+        for bucket, count in enumerate(histogram):
+            totals[bucket] += count
+    return totals
+
+
+def histogram_percentiles(histogram, percentiles=(50, 90, 99)):
+    """Approximate percentiles from a histogram, as the lower bound of the bucket each one falls in"""
+    total = sum(histogram)
+    if not total:
+        return {f'p{percentile}': None for percentile in percentiles}
+    if np is not None:
+        cumulative = np.cumsum(histogram)
+        positions = np.searchsorted(cumulative, [total * percentile / 100 for percentile in percentiles])
+    else:
+        positions = []
+        for percentile in percentiles:
+            target, running = total * percentile / 100, 0
+            for bucket, count in enumerate(histogram):
+                running += count
+                if running >= target:
+                    positions.append(bucket)
+                    break
+    bounds = bucket_bounds()
+    return {f'p{percentile}': bounds[int(position)][0] or 0 for percentile, position in zip(percentiles, positions)}
+
+
+def subreddit_series(stats):
+    """
+    Per-subreddit totals and day-by-day series from SubredditDailyStats rows
+    (dicts with subreddit name, day, posts, comments, upvotes_total, upvotes_max).
+    """
+    by_subreddit = defaultdict(list)
+    for row in stats:
+        by_subreddit[row['subreddit__name']].append(row)
+    results = []
+    for name, rows in sorted(by_subreddit.items()):
+        rows.sort(key=lambda row: row['day'])
+        if np is not None:
+            columns = np.asarray([(row['posts'], row['comments'], row['upvotes_total']) for row in rows],
+                                 dtype=np.int64)
+            posts, comments, upvotes = (int(total) for total in columns.sum(axis=0))
+        else:
+            posts = sum(row['posts'] for row in rows)
+            comments = sum(row['comments'] for row in rows)
+            upvotes = sum(row['upvotes_total'] for row in rows)
+        results.append({
+            'subreddit': name,
+            'posts': posts,
+            'comments': comments,
+            'upvotes_total': upvotes,
+            'upvotes_mean': round(upvotes / posts, 2) if posts else None,
+            'upvotes_max': max(row['upvotes_max'] for row in rows),
+            'days': [{'day': row['day'], 'posts': row['posts'], 'comments': row['comments']} for row in rows],
+        })
+    return results
@@ -6,4 +6,6 @@ class ApiConfig(AppConfig):
     name = 'api'
 
     def ready(self):
-        import api.signals
\ No newline at end of file
+        import api.signals
+        from api.instrumentation import install_serializer_timing
+        install_serializer_timing()
\ No newline at end of file
@@ -0,0 +1,165 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+
+
+# Seconds of clock difference tolerated between the processes comparing change times
+CLOCK_SKEW = 1
+
+
+def changed_key(user_id):
+    return f'auth-user-changed:{user_id}'
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of token key -> Token (with its user), each entry
+    expiring after ``ttl`` seconds.
+
+    The cache is per process. Revoking a token or saving a user invalidates
+    the entries in the current process right away (see signals), and records
+    the time of the change in the shared cache once it commits. Every process
+    checks that time on a hit and drops entries looked up before the change.
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size or settings.AUTH_TOKEN_CACHE_SIZE
+        self.ttl = settings.AUTH_TOKEN_CACHE_TTL if ttl is None else ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.user_keys = {}
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                self._remove(key)
+                entry = None
+        # Revoked or changed by another process since it was looked up
+        if entry is not None and self.changed_since(entry[0].user_id, entry[2]):
+            self.discard(key)
+            entry = None
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            if key in self.entries:
+                self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, token, looked_up_at=None):
+        """Cache a token; ``looked_up_at`` is the (wall clock) time its database lookup started"""
+        if not self.ttl:
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (token, time.monotonic() + self.ttl,
+                                 time.time() if looked_up_at is None else looked_up_at)
+            self.user_keys.setdefault(token.user_id, set()).add(key)
+            while len(self.entries) > self.max_size:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        token, _, _ = self.entries.pop(key)
+        keys = self.user_keys.get(token.user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.user_keys[token.user_id]
+
+    def changed_since(self, user_id, looked_up_at):
+        changed_at = cache.get(changed_key(user_id))
+        return changed_at is not None and changed_at >= looked_up_at - CLOCK_SKEW
+
+    def mark_changed(self, *user_ids):
+        """Record in the shared cache, once the transaction commits, that the users' tokens changed"""
+        if self.ttl and user_ids:
+            # No entry outlives the TTL, so neither does the mark
+            transaction.on_commit(lambda: cache.set_many(
+                dict.fromkeys(map(changed_key, user_ids), time.time()), self.ttl + CLOCK_SKEW))
+
+    def discard(self, key):
+        """Drop a key from this process's cache only"""
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def invalidate_key(self, key, user_id):
+        self.discard(key)
+        self.mark_changed(user_id)
+
+    def invalidate_user(self, user_id):
+        self.invalidate_users([user_id])
+
+    def invalidate_users(self, user_ids):
+        """Drop the cached tokens of users changed with ``QuerySet.update()``, which sends no signals"""
+        user_ids = list(user_ids)
+        with self.lock:
+            for user_id in user_ids:
+                for key in list(self.user_keys.get(user_id, ())):
+                    self._remove(key)
+        self.mark_changed(*user_ids)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.user_keys.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else None,
+            }
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication backed by ``token_cache``, so repeat requests with
+    the same token do not query the ``authtoken_token``/``user`` tables.
+    Accepts both ``Token <key>`` and ``Bearer <key>`` headers.
+    """
+    keywords = ('Token', 'Bearer')
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() not in {keyword.lower().encode() for keyword in self.keywords}:
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token header. Token string should not contain invalid characters.')
+        return self.authenticate_credentials(key)
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            looked_up_at = time.time()
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token, looked_up_at)
+        # Hand out a copy so per-request state set on the user never leaks into the cache
+        token = copy.copy(token)
+        token.user = copy.copy(token.user)
+        return token.user, token
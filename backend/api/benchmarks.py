@@ -0,0 +1,458 @@
+import datetime
+import platform
+import random
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import django
+import requests
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from . import caching
+from .comment_tree import get_comment_tree
+from .fastpath import get_values_serializer
+from .instrumentation import percentile
+from .pagination import FeedPagination
+from .renderers import ORJSONRenderer
+from .models import (User, Subreddit, Post, Comment, Notification, CrawlHistory,
+                     PostKeywordMatch, CommentKeywordMatch)
+from .serializers import PostListSerializer, PostSerializer, CommentSerializer, NotificationSerializer
+
+# Everything generated is named with this prefix, so it can be found and removed again
+PREFIX = 'bench'
+
+
+class Rollback(Exception):
+    pass
+
+
+@dataclass
+class Volumes:
+    """Row counts of a synthetic corpus"""
+    subreddits: int = 20
+    users: int = 200
+    premium_share: float = 0.1
+    posts: int = 10_000
+    comments_per_post: int = 5
+    notifications_per_user: int = 50
+
+    @classmethod
+    def scaled(cls, scale):
+        base = cls()
+        return cls(
+            subreddits=max(1, round(base.subreddits * scale)),
+            users=max(1, round(base.users * scale)),
+            premium_share=base.premium_share,
+            posts=max(1, round(base.posts * scale)),
+            comments_per_post=base.comments_per_post,
+            notifications_per_user=base.notifications_per_user,
+        )
+
+
+def generated_subreddits():
+    return Subreddit.objects.filter(name__startswith=f'{PREFIX}_')
+
+
+def generated_users():
+    return User.objects.filter(username__startswith=f'{PREFIX}-user-')
+
+
+def generate(volumes, seed=0, batch_size=5000, days=90):
+    """
+    Create a deterministic synthetic corpus of ``volumes`` with bulk inserts:
+    users (a share of them premium, each with a token), subreddits, posts,
+    two-level comment threads and notifications. The denormalised counters
+    are filled in directly, since bulk inserts do not send signals.
+    Returns the number of rows created per model.
+    """
+    rng = random.Random(seed)
+    now = timezone.now()
+    start = now - datetime.timedelta(days=days)
+    password = make_password(None)
+
+    premium = round(volumes.users * volumes.premium_share)
+    users = User.objects.bulk_create([
+        User(username=f'{PREFIX}-user-{i}', password=password,
+             membership_status='Premium' if i < premium else 'Free')
+        for i in range(volumes.users)
+    ], batch_size=batch_size)
+    Token.objects.bulk_create([Token(user=user, key=Token.generate_key()) for user in users],
+                              batch_size=batch_size)
+
+    subreddits = Subreddit.objects.bulk_create(
+        [Subreddit(name=f'{PREFIX}_{i}') for i in range(volumes.subreddits)], batch_size=batch_size)
+
+    posts = []
+    for i in range(volumes.posts):
+        subreddit = subreddits[i % len(subreddits)]
+        comments = rng.randint(0, volumes.comments_per_post * 2)
+        posts.append(Post(
+            reddit_id=f'{PREFIX}-p{i}', title=f'Benchmark post {i}', body=' '.join(rng.choices(WORDS, k=40)),
+            upvotes=int(rng.paretovariate(1.2)) - 1, comments_count=comments, author=f'{PREFIX}-author-{i % 500}',
+            submission_date=start + datetime.timedelta(seconds=rng.uniform(0, days * 86400)),
+            subreddit=subreddit, subreddit_name=subreddit.name,
+        ))
+    posts = Post.objects.bulk_create(posts, batch_size=batch_size)
+
+    for subreddit in subreddits:
+        own = [post for post in posts if post.subreddit_id == subreddit.pk]
+        subreddit.posts_count = len(own)
+        subreddit.last_post_at = max((post.submission_date for post in own), default=None)
+        subreddit.max_upvotes = max((post.upvotes for post in own), default=0)
+    Subreddit.objects.bulk_update(subreddits, ['posts_count', 'last_post_at', 'max_upvotes'])
+
+    # Top-level comments first, then replies to them on the same post
+    comment_count = 0
+    for offset in range(0, len(posts), batch_size):
+        top_level, replies = [], []
+        for post in posts[offset:offset + batch_size]:
+            split = (post.comments_count + 1) // 2
+            for j in range(post.comments_count):
+                comment = Comment(
+                    reddit_id=f'{PREFIX}-c{post.pk}-{j}', post=post, body=' '.join(rng.choices(WORDS, k=20)),
+                    author=f'{PREFIX}-author-{rng.randrange(500)}', upvotes=int(rng.paretovariate(1.5)) - 1,
+                    submission_date=post.submission_date + datetime.timedelta(minutes=j + 1),
+                )
+                (top_level if j < split else replies).append(comment)
+        Comment.objects.bulk_create(top_level, batch_size=batch_size)
+        parents = {}
+        for comment in top_level:
+            parents.setdefault(comment.post_id, []).append(comment.pk)
+        for comment in replies:
+            comment.parent_comment_id = rng.choice(parents[comment.post_id])
+        Comment.objects.bulk_create(replies, batch_size=batch_size)
+        comment_count += len(top_level) + len(replies)
+
+    notifications = []
+    unread = dict.fromkeys((user.pk for user in users), 0)
+    for user in users:
+        for j in range(volumes.notifications_per_user):
+            read = rng.random() < 0.7
+            unread[user.pk] += not read
+            notifications.append(Notification(user=user, type='New Post', read_status=read,
+                                              content=f'New post: Benchmark post {rng.randrange(len(posts))}'))
+    Notification.objects.bulk_create(notifications, batch_size=batch_size)
+    for user in users:
+        user.unread_notifications = unread[user.pk]
+    User.objects.bulk_update(users, ['unread_notifications'], batch_size=batch_size)
+
+    caching.invalidate_responses(caching.POSTS, caching.COMMENTS, caching.SUBREDDITS)
+    return {'users': len(users), 'subreddits': len(subreddits), 'posts': len(posts),
+            'comments': comment_count, 'notifications': len(notifications)}
+
+
+def delete_rows(queryset, batch_size=5000):
+    """
+    Delete the rows of ``queryset`` with plain DELETEs by id, a batch at a time,
+    without the ORM's per-row signals (they would dominate on large corpora)
+    """
+    meta = queryset.model._meta
+    table, pk = connection.ops.quote_name(meta.db_table), connection.ops.quote_name(meta.pk.column)
+    while ids := list(queryset.values_list('pk', flat=True)[:batch_size]):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table} WHERE {pk} IN ({", ".join(["%s"] * len(ids))})', ids)
+
+
+def cleanup():
+    """Delete everything ``generate()`` (or a benchmark run) created, with bulk deletes"""
+    subreddits = generated_subreddits()
+    posts = Post.objects.filter(subreddit__in=subreddits)
+    comments = Comment.objects.filter(post__in=posts)
+    users = generated_users()
+    with transaction.atomic():
+        for queryset in [
+            CommentKeywordMatch.objects.filter(comment__in=comments),
+            PostKeywordMatch.objects.filter(post__in=posts),
+            comments, posts, CrawlHistory.objects.filter(subreddit__in=subreddits),
+            Notification.objects.filter(user__in=users), Token.objects.filter(user__in=users),
+        ]:
+            delete_rows(queryset)
+        users.delete()
+        subreddits.delete()
+    caching.invalidate_responses(caching.POSTS, caching.COMMENTS, caching.SUBREDDITS)
+
+
+# Micro-benchmarks
+
+def summarise(durations, queries=None):
+    """Latency percentiles (in ms) and throughput of a list of durations in seconds"""
+    durations = sorted(durations)
+    total = sum(durations)
+    result = {
+        'runs': len(durations),
+        'mean_ms': round(total / len(durations) * 1000, 3),
+        **{f'p{p}_ms': round(percentile(durations, p) * 1000, 3) for p in (50, 95, 99)},
+        'ops_per_s': round(len(durations) / total, 1) if total else None,
+    }
+    if queries is not None:
+        result['queries_per_op'] = round(queries / len(durations), 2)
+    return result
+
+
+def measure(function, repeat, warmup=3):
+    """Run ``function(i)`` ``repeat`` times and summarise its latency and queries"""
+    for i in range(warmup):
+        function(-1 - i)
+    durations = []
+    with CaptureQueriesContext(connection) as captured:
+        for i in range(repeat):
+            start = time.perf_counter()
+            function(i)
+            durations.append(time.perf_counter() - start)
+    return summarise(durations, len(captured))
+
+
+def serializer_benchmarks(repeat, page_size=20):
+    """
+    Time serializing the main read responses from rows already loaded; any
+    queries the serializers run themselves are counted.
+    """
+    request = Request(APIRequestFactory().get('/api/'))
+    context = {'request': request}
+    posts = list(Post.objects.filter(subreddit__in=generated_subreddits()).order_by('-submission_date')[:page_size])
+    post = max(posts, key=lambda post: post.comments_count)
+    tree = get_comment_tree(post)
+    notifications = list(Notification.objects.filter(user__in=generated_users()).order_by('-id')[:page_size])
+    return {
+        'serialize post list page': measure(
+            lambda i: PostListSerializer(posts, many=True, context=context).data, repeat),
+        'serialize post detail': measure(lambda i: PostSerializer(post, context=context).data, repeat),
+        'serialize comment tree': measure(
+            lambda i: CommentSerializer(tree, many=True, context=context).data, repeat),
+        'serialize notifications page': measure(
+            lambda i: NotificationSerializer(notifications, many=True, context=context).data, repeat),
+    }
+
+
+def fast_list_benchmarks(repeat, page_size=20):
+    """
+    Compare fetching and serializing a post list page through model instances
+    and DRF fields with the ``.values()`` fast path (FAST_LIST_SERIALIZATION),
+    and rendering it with JSONRenderer and with orjson (ORJSON_ENABLED).
+    """
+    request = Request(APIRequestFactory().get('/api/'))
+    context = {'request': request}
+    queryset = Post.objects.filter(subreddit__in=generated_subreddits()).order_by('-submission_date')
+    values_serializer = get_values_serializer(PostListSerializer)
+    page = PostListSerializer(list(queryset[:page_size]), many=True, context=context).data
+    rows = values_serializer.rows(values_serializer.values(queryset)[:page_size], context)
+    return {
+        'post list page (DRF)': measure(
+            lambda i: PostListSerializer(list(queryset[:page_size]), many=True, context=context).data, repeat),
+        'post list page (fast path)': measure(
+            lambda i: values_serializer.rows(values_serializer.values(queryset)[:page_size], context), repeat),
+        'render post list page (JSONRenderer)': measure(lambda i: JSONRenderer().render(page), repeat),
+        'render post list page (orjson)': measure(lambda i: ORJSONRenderer().render(rows), repeat),
+    }
+
+
+def signal_benchmarks(repeat):
+    """
+    Time the writes whose signal handlers do the most work, including the
+    tasks they defer until commit (keyword matching, the New Post fan-out to
+    premium users, counters, cache invalidation). Runs inside a transaction
+    that is rolled back.
+    """
+    results = {}
+    try:
+        with transaction.atomic(), override_settings(DEFERRED_TASKS_ASYNC=False):
+            subreddit = generated_subreddits().first()
+            post = Post.objects.filter(subreddit=subreddit).first()
+            user = generated_users().first()
+
+            def committed(function):
+                def run(i):
+                    # Executes the on-commit callbacks inline; the outer rollback discards them
+                    with TestCase.captureOnCommitCallbacks(execute=True):
+                        function(i)
+                return run
+
+            results['create post'] = measure(committed(lambda i: Post.objects.create(
+                reddit_id=f'{PREFIX}-signal-p{i}', title=f'Signal benchmark {i}', subreddit=subreddit)), repeat)
+            results['update post'] = measure(committed(lambda i: Post.objects.filter(pk=post.pk).first().save()),
+                                             repeat)
+            results['create comment'] = measure(committed(lambda i: Comment.objects.create(
+                reddit_id=f'{PREFIX}-signal-c{i}', post=post, body=f'Signal benchmark comment {i}')), repeat)
+            results['create notification'] = measure(committed(lambda i: Notification.objects.create(
+                user=user, type='New Post', content=f'Signal benchmark {i}')), repeat)
+            raise Rollback
+    except Rollback:
+        pass
+    return results
+
+
+# HTTP load harness
+
+# Endpoints that have an async counterpart under /api/async/
+ASYNC_TARGETS = ('post-list', 'post-list (subreddit)', 'post-list (keyset)', 'post-detail', 'post-comments',
+                 'subreddit-list')
+
+
+def load_targets(seed=0, count=50, async_views=False):
+    """
+    Endpoints exercised by ``load_test()``: ``{name: (paths, authenticated)}``,
+    with paths spread over the generated data so the response cache is not
+    the only thing measured. With ``async_views``, only the endpoints with an
+    async counterpart, under the same names so runs can be compared.
+    """
+    rng = random.Random(seed)
+    subreddits = list(generated_subreddits().values_list('pk', flat=True))
+    posts = list(Post.objects.filter(subreddit__in=subreddits).values_list('pk', flat=True)[:1000])
+    post_ids = rng.choices(posts, k=count)
+    pages = min(20, max(1, Post.objects.count() // FeedPagination.page_size))
+    targets = {
+        'post-list': ([f'/api/posts/?page={rng.randint(1, pages)}' for _ in range(count)], False),
+        'post-list (subreddit)': ([f'/api/posts/?subreddit={rng.choice(subreddits)}' for _ in range(count)], False),
+        'post-list (keyset)': (['/api/posts/?cursor='], False),
+        'post-detail': ([f'/api/posts/{pk}/' for pk in post_ids], False),
+        'post-comments': ([f'/api/posts/{pk}/comments/' for pk in post_ids], False),
+        'comment-list': ([f'/api/comments/?post={pk}' for pk in post_ids], False),
+        'subreddit-list': (['/api/subreddits/'], False),
+        'notification-list': (['/api/notifications/'], True),
+        'notification-unread-count': (['/api/notifications/unread-count/'], True),
+    }
+    if async_views:
+        targets = {name: ([path.replace('/api/', '/api/async/', 1) for path in paths], authenticated)
+                   for name, (paths, authenticated) in targets.items() if name in ASYNC_TARGETS}
+    return targets
+
+
+class ConnectionSampler:
+    """
+    Peak number of server connections to this database while the block runs,
+    sampled from pg_stat_activity by a background thread (PostgreSQL only,
+    None elsewhere). The sampler's own connection is not counted.
+    """
+    SQL = 'SELECT count(*) FROM pg_stat_activity WHERE datname = current_database() AND pid <> pg_backend_pid()'
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        if connection.vendor == 'postgresql':
+            self.peak = 0
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+
+    def run(self):
+        try:
+            with connection.cursor() as cursor:
+                while True:
+                    cursor.execute(self.SQL)
+                    self.peak = max(self.peak, cursor.fetchone()[0])
+                    if self.stopped.wait(self.interval):
+                        break
+        finally:
+            connection.close()
+
+
+def load_test(base_url, targets, tokens, count=500, concurrency=8, timeout=30):
+    """
+    Send ``count`` GETs to each target from ``concurrency`` threads and
+    report latency percentiles, throughput, errors and the peak number of
+    database connections per endpoint. Authenticated targets rotate over the
+    given tokens.
+    """
+    local = threading.local()
+
+    def get(i, paths, authenticated):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        headers = {'Authorization': f'Token {tokens[i % len(tokens)]}'} if authenticated else {}
+        start = time.perf_counter()
+        try:
+            ok = session.get(base_url + paths[i % len(paths)], headers=headers, timeout=timeout).status_code < 400
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for name, (paths, authenticated) in targets.items():
+            with ConnectionSampler() as sampler:
+                start = time.perf_counter()
+                outcomes = list(pool.map(lambda i: get(i, paths, authenticated), range(count)))
+                elapsed = time.perf_counter() - start
+            result = summarise([duration for duration, _ in outcomes])
+            del result['ops_per_s'], result['mean_ms']
+            result['errors'] = sum(not ok for _, ok in outcomes)
+            result['throughput_rps'] = round(count / elapsed, 1)
+            result['db_connections'] = sampler.peak
+            results[name] = result
+    return results
+
+
+# Results
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': timezone.now().isoformat(),
+        'commit': commit,
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'machine': platform.machine(),
+        'debug': settings.DEBUG,
+    }
+
+
+# Metrics compared between runs, and whether a higher value is an improvement
+COMPARED_METRICS = {'p50_ms': False, 'p95_ms': False, 'p99_ms': False, 'throughput_rps': True,
+                    'queries_per_op': False}
+
+
+def compare(before, after):
+    """
+    Return ``(section, benchmark, metric, before, after, change)`` for every
+    metric present in both result documents, ``change`` being the relative
+    difference in percent.
+    """
+    rows = []
+    for section in ('micro', 'http'):
+        for name, metrics in after.get(section, {}).items():
+            previous = before.get(section, {}).get(name)
+            if previous is None:
+                continue
+            for metric in COMPARED_METRICS:
+                old, new = previous.get(metric), metrics.get(metric)
+                if old is None or new is None:
+                    continue
+                change = round((new - old) / old * 100, 1) if old else None
+                rows.append((section, name, metric, old, new, change))
+    return rows
+
+
+def is_regression(metric, change, threshold):
+    if change is None:
+        return False
+    return -change > threshold if COMPARED_METRICS[metric] else change > threshold
+
+
+WORDS = ('python django react bounty hiring remote contract freelance developer backend frontend '
+         'budget paid task help need looking build fix bug feature api website app design data '
+         'scraper bot script automation deadline urgent simple quick project experience').split()
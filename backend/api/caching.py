@@ -0,0 +1,224 @@
+import functools
+import hashlib
+import json
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from . import replicas
+
+# Data namespaces cached responses depend on; a namespace's version is bumped
+# whenever the data behind it changes, which orphans every response cached under it
+POSTS = 'posts'
+COMMENTS = 'comments'
+SUBREDDITS = 'subreddits'
+KEYWORDS = 'keywords'
+KEYWORD_MATCHES = 'keyword-matches'
+STATS = 'stats'
+
+
+def get_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def version_key(namespace):
+    return f'{settings.RESPONSE_CACHE_PREFIX}:version:{namespace}'
+
+
+def get_versions(namespaces):
+    """Return the current version of each namespace, initialising missing ones"""
+    cache = get_cache()
+    keys = [version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start from the clock so a version evicted from the cache never comes back
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(namespaces):
+    """``get_versions`` for async views, through the cache's async API"""
+    cache = get_cache()
+    keys = [version_key(namespace) for namespace in namespaces]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+def changed_key(namespace):
+    return f'{settings.RESPONSE_CACHE_PREFIX}:changed:{namespace}'
+
+
+def bump_versions(*namespaces):
+    cache = get_cache()
+    if settings.DATABASE_REPLICAS:
+        # When the data last changed, see replica_may_be_stale()
+        cache.set_many({changed_key(namespace): time.time() for namespace in namespaces}, timeout=None)
+    for namespace in namespaces:
+        key = version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def invalidate_responses(*namespaces):
+    """
+    Invalidate the cached responses that depend on ``namespaces``.
+
+    Versions are bumped right away and, inside a transaction, once more after
+    the commit: a response cached from the pre-commit data in between would
+    otherwise be served until it expires.
+    """
+    bump_versions(*namespaces)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: bump_versions(*namespaces))
+
+
+def changed_within(changed, seconds):
+    return any(at is not None and time.time() - at < seconds for at in changed.values())
+
+
+def replica_may_be_stale(request, namespaces):
+    """
+    Whether the request read from a replica that may not have replayed the
+    latest change to ``namespaces`` yet. Its response is then not cached, as
+    it would be stored under the new versions.
+    """
+    if getattr(request, 'read_replica', None) is None:
+        return False
+    changed = get_cache().get_many([changed_key(namespace) for namespace in namespaces])
+    return changed_within(changed, replicas.pin_seconds())
+
+
+async def areplica_may_be_stale(request, namespaces):
+    if getattr(request, 'read_replica', None) is None:
+        return False
+    changed = await get_cache().aget_many([changed_key(namespace) for namespace in namespaces])
+    return changed_within(changed, replicas.pin_seconds())
+
+
+def normalize_query(query_params):
+    """Query string with keys and values sorted and empty values dropped, so equivalent URLs share an entry"""
+    return '&'.join(
+        f'{key}={value}'
+        for key in sorted(query_params)
+        for value in sorted(query_params.getlist(key))
+        if value != ''
+    )
+
+
+def compute_etag(data):
+    encoded = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'))
+    return 'W/"%s"' % hashlib.md5(encoded.encode('utf-8')).hexdigest()
+
+
+def response_cache_key(view_name, action, request, query_params, versions):
+    raw = '|'.join([
+        view_name,
+        action or '',
+        request.build_absolute_uri(request.path),
+        normalize_query(query_params),
+        *map(str, versions),
+    ])
+    return f'{settings.RESPONSE_CACHE_PREFIX}:response:{hashlib.md5(raw.encode("utf-8")).hexdigest()}'
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    return header.strip() == '*' or etag in (tag.strip() for tag in header.split(','))
+
+
+def cache_response(method):
+    """Serve a view method through ``CachedResponseMixin.cached_response``"""
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        return self.cached_response(method, request, *args, **kwargs)
+    return wrapper
+
+
+class CachedResponseMixin:
+    """
+    Caches the serialized data of read-only viewset actions.
+
+    Entries are keyed on the view, action, URL and normalised query string,
+    plus the current version of every namespace in ``cache_namespaces``, so
+    bumping a namespace (see ``invalidate_responses``) invalidates them all.
+    Responses carry a weak ETag and ``If-None-Match`` gets a 304.
+    """
+    cache_namespaces = ()
+    cache_timeout = None
+
+    def get_cache_timeout(self):
+        return settings.RESPONSE_CACHE_TIMEOUT if self.cache_timeout is None else self.cache_timeout
+
+    def get_response_cache_key(self, request):
+        return response_cache_key(type(self).__name__, self.action, request, request.query_params,
+                                  get_versions(self.cache_namespaces))
+
+    def cached_response(self, method, request, *args, **kwargs):
+        if not settings.RESPONSE_CACHE_ENABLED or request.method != 'GET':
+            return method(self, request, *args, **kwargs)
+
+        cache = get_cache()
+        key = self.get_response_cache_key(request)
+        cached = cache.get(key)
+        if cached is not None:
+            etag, data = cached
+            cache_status = 'HIT'
+        else:
+            response = method(self, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            etag, data = compute_etag(response.data), response.data
+            if not replica_may_be_stale(request, self.cache_namespaces):
+                cache.set(key, (etag, data), self.get_cache_timeout())
+            cache_status = 'MISS'
+
+        if etag_matches(request, etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        response['X-Cache'] = cache_status
+        return response
+
+    @cache_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+
+async def acached_data(request, view_name, namespaces, timeout, get_data):
+    """
+    ``CachedResponseMixin.cached_response`` for plain async views: return
+    ``(etag, data, cache status)`` for a GET, awaiting ``get_data()`` on a miss
+    (``(None, data, None)`` with the cache disabled). The views share cache
+    entries with each other, not with the viewsets.
+    """
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return None, await get_data(), None
+
+    cache = get_cache()
+    key = response_cache_key(view_name, '', request, request.GET, await aget_versions(namespaces))
+    cached = await cache.aget(key)
+    if cached is not None:
+        return (*cached, 'HIT')
+    data = await get_data()
+    etag = compute_etag(data)
+    if not await areplica_may_be_stale(request, namespaces):
+        await cache.aset(key, (etag, data), settings.RESPONSE_CACHE_TIMEOUT if timeout is None else timeout)
+    return etag, data, 'MISS'
@@ -0,0 +1,62 @@
+from django.conf import settings
+from .models import Comment
+
+
+def build_comment_tree(comments, max_depth=None):
+    """
+    Assemble a flat list of comments into a reply tree in memory.
+
+    Every comment gets a ``tree_replies`` list holding its direct replies, and the
+    top-level comments are returned. Replies below ``max_depth`` are dropped, as are
+    replies whose parent is not part of ``comments`` (e.g. cut off by a size cap).
+    """
+    if max_depth is None:
+        max_depth = settings.COMMENT_TREE_MAX_DEPTH
+
+    comments_by_id = {}
+    for comment in comments:
+        comment.tree_replies = []
+        comments_by_id[comment.id] = comment
+
+    roots = []
+    for comment in comments:
+        if comment.parent_comment_id is None:
+            roots.append(comment)
+            continue
+        parent = comments_by_id.get(comment.parent_comment_id)
+        if parent is not None:
+            parent.tree_replies.append(comment)
+
+    # Walk the tree level by level and cut it off at the configured depth
+    level = roots
+    depth = 0
+    while level:
+        if depth >= max_depth:
+            for comment in level:
+                comment.tree_replies = []
+            break
+        level = [reply for comment in level for reply in comment.tree_replies]
+        depth += 1
+
+    return roots
+
+
+def get_comment_tree(post, max_depth=None, max_comments=None):
+    """
+    Fetch every comment of a post in a single query and return the top-level
+    comments with their replies attached (see ``build_comment_tree``).
+    """
+    comments = list(comment_tree_queryset(post, max_comments))
+    return build_comment_tree(comments, max_depth=max_depth)
+
+
+async def aget_comment_tree(post, max_depth=None, max_comments=None):
+    """``get_comment_tree`` for async views, using the async ORM"""
+    comments = [comment async for comment in comment_tree_queryset(post, max_comments)]
+    return build_comment_tree(comments, max_depth=max_depth)
+
+
+def comment_tree_queryset(post, max_comments=None):
+    if max_comments is None:
+        max_comments = settings.COMMENT_TREE_MAX_COMMENTS
+    return Comment.objects.filter(post=post).order_by('id')[:max_comments]
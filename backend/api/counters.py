@@ -0,0 +1,121 @@
+from collections import defaultdict
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from .models import Subreddit, Post, Comment
+from .caching import POSTS, SUBREDDITS, invalidate_responses
+
+# Denormalised counters:
+#   Post.comments_count   number of stored comments of the post
+#   Subreddit.posts_count number of stored posts of the subreddit
+#   Subreddit.last_post_at / max_upvotes   latest submission date / highest upvotes among them
+# They are maintained with atomic F() updates as rows come and go, and
+# `manage.py reconcile_counters` repairs any drift.
+
+
+def add_comments(post_counts):
+    """Apply ``{post_id: delta}`` to Post.comments_count, one UPDATE per distinct delta"""
+    by_delta = defaultdict(list)
+    for post_id, delta in post_counts.items():
+        if delta:
+            by_delta[delta].append(post_id)
+    for delta, post_ids in by_delta.items():
+        Post.objects.filter(pk__in=post_ids).update(comments_count=F('comments_count') + delta)
+
+
+def add_posts(subreddit_id, delta=1, last_post_at=None, max_upvotes=None):
+    """
+    Add ``delta`` to a subreddit's post count and raise its last_post_at and
+    max_upvotes to the given values if they are higher.
+    """
+    updates = {}
+    if delta:
+        updates['posts_count'] = F('posts_count') + delta
+    if last_post_at is not None:
+        # Coalesce because GREATEST is NULL as soon as one argument is on some backends
+        updates['last_post_at'] = Greatest(Coalesce('last_post_at', Value(last_post_at)), Value(last_post_at))
+    if max_upvotes is not None:
+        updates['max_upvotes'] = Greatest('max_upvotes', Value(max_upvotes))
+    if updates:
+        Subreddit.objects.filter(pk=subreddit_id).update(**updates)
+        invalidate_responses(SUBREDDITS)
+
+
+def add_post_batch(posts, created):
+    """Update subreddit counters for a batch of upserted posts; ``created`` holds the reddit ids of the new ones"""
+    by_subreddit = defaultdict(list)
+    for post in posts:
+        by_subreddit[post.subreddit_id].append(post)
+    for subreddit_id, subreddit_posts in by_subreddit.items():
+        dates = [post.submission_date for post in subreddit_posts if post.submission_date is not None]
+        add_posts(
+            subreddit_id,
+            delta=sum(1 for post in subreddit_posts if post.reddit_id in created),
+            last_post_at=max(dates, default=None),
+            max_upvotes=max(post.upvotes for post in subreddit_posts),
+        )
+
+
+def remove_post(post):
+    """Account for a deleted post; the subreddit's maxima are recomputed only if this post may have held them"""
+    subreddit = Subreddit.objects.filter(pk=post.subreddit_id).values('last_post_at', 'max_upvotes').first()
+    if subreddit is None:
+        return
+    updates = {'posts_count': F('posts_count') - 1}
+    posts = Post.objects.filter(subreddit_id=post.subreddit_id)
+    if post.submission_date is not None and post.submission_date >= (subreddit['last_post_at'] or post.submission_date):
+        updates['last_post_at'] = Subquery(posts.order_by('-submission_date').values('submission_date')[:1])
+    if post.upvotes >= subreddit['max_upvotes']:
+        updates['max_upvotes'] = Coalesce(Subquery(posts.order_by('-upvotes').values('upvotes')[:1]), 0)
+    Subreddit.objects.filter(pk=post.subreddit_id).update(**updates)
+    invalidate_responses(SUBREDDITS)
+
+
+def reconcile_post_counts(batch_size=1000):
+    """Fix drifted Post.comments_count values, walking posts in id order. Returns the number of posts fixed."""
+    actual = Subquery(
+        Comment.objects.filter(post=OuterRef('pk')).order_by().values('post')
+        .annotate(count=Count('id')).values('count'),
+        output_field=IntegerField(),
+    )
+    fixed = 0
+    last_id = 0
+    while True:
+        ids = list(Post.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return fixed
+        last_id = ids[-1]
+        drifted = (Post.objects.filter(pk__in=ids).annotate(actual=Coalesce(actual, 0))
+                   .exclude(comments_count=F('actual')).values_list('pk', 'actual'))
+        by_count = defaultdict(list)
+        for post_id, count in drifted:
+            by_count[count].append(post_id)
+        for count, post_ids in by_count.items():
+            fixed += Post.objects.filter(pk__in=post_ids).update(comments_count=count)
+        if by_count:
+            invalidate_responses(POSTS)
+
+
+def reconcile_subreddit_counters(batch_size=1000):
+    """Recompute every subreddit's counters, saving those that drifted. Returns the number of subreddits fixed."""
+    fixed = 0
+    last_id = 0
+    while True:
+        subreddits = list(
+            Subreddit.objects.filter(pk__gt=last_id).order_by('pk')
+            .annotate(actual_count=Count('posts'), actual_last=Max('posts__submission_date'),
+                      actual_max=Coalesce(Max('posts__upvotes'), 0))[:batch_size]
+        )
+        if not subreddits:
+            break
+        last_id = subreddits[-1].pk
+        drifted = []
+        for subreddit in subreddits:
+            actual = (subreddit.actual_count, subreddit.actual_last, subreddit.actual_max)
+            if actual != (subreddit.posts_count, subreddit.last_post_at, subreddit.max_upvotes):
+                subreddit.posts_count, subreddit.last_post_at, subreddit.max_upvotes = actual
+                drifted.append(subreddit)
+        Subreddit.objects.bulk_update(drifted, ['posts_count', 'last_post_at', 'max_upvotes'])
+        fixed += len(drifted)
+    if fixed:
+        invalidate_responses(SUBREDDITS)
+    return fixed
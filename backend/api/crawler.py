@@ -0,0 +1,279 @@
+import asyncio
+import datetime
+import logging
+import random
+from dataclasses import dataclass, field
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from .ingestion import ingest_crawl
+from .models import Subreddit, CrawlHistory
+
+logger = logging.getLogger('api')
+
+
+class CrawlError(Exception):
+    """Raised when Reddit keeps failing or answers with a non-retryable status"""
+
+
+@dataclass
+class HttpResponse:
+    status: int
+    data: object = None
+    headers: dict = field(default_factory=dict)
+
+
+class RequestsTransport:
+    """
+    Default HTTP transport: a pooled ``requests`` session driven from a thread
+    pool, sized to the crawler's connection limit.
+
+    Any object with ``async get(url, params)`` returning an ``HttpResponse``
+    (and optionally ``async close()``) can be used instead, e.g. a fake Reddit
+    server in tests.
+    """
+
+    def __init__(self, max_connections=None, user_agent=None, timeout=30):
+        import requests
+        from concurrent.futures import ThreadPoolExecutor
+        from requests.adapters import HTTPAdapter
+
+        max_connections = max_connections or settings.CRAWLER_MAX_CONNECTIONS
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = user_agent or settings.REDDIT_USER_AGENT
+        adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix='crawler-http')
+
+    def _get(self, url, params):
+        response = self.session.get(url, params=params, timeout=self.timeout)
+        try:
+            data = response.json()
+        except ValueError:
+            data = None
+        headers = {name.lower(): value for name, value in response.headers.items()}
+        return HttpResponse(status=response.status_code, data=data, headers=headers)
+
+    async def get(self, url, params=None):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._get, url, params)
+
+    async def close(self):
+        self.session.close()
+        self.executor.shutdown(wait=False)
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every request of a crawl.
+
+    Tokens refill at ``rate`` per second up to ``capacity``. Reddit's
+    ``X-Ratelimit-Remaining``/``X-Ratelimit-Reset`` headers slow the refill
+    down to what is left of the current window, and pause the bucket entirely
+    once the window is used up.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = None
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now):
+        if self.updated is not None:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        async with self.lock:
+            while True:
+                now = loop.time()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for ``seconds``"""
+        now = asyncio.get_running_loop().time()
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def update_from_headers(self, headers):
+        try:
+            remaining = float(headers['x-ratelimit-remaining'])
+            reset = float(headers['x-ratelimit-reset'])
+        except (KeyError, TypeError, ValueError):
+            return
+        if remaining < 1:
+            self.pause(reset)
+            return
+        # Spread what is left of the window evenly over the time until it resets
+        self.rate = min(self.max_rate, remaining / max(reset, 1.0))
+        self.tokens = min(self.tokens, remaining)
+
+
+def flatten_comments(listing):
+    """Collect every comment from a (nested) Reddit comment listing"""
+    comments = []
+    stack = [listing]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        for child in node.get('data', {}).get('children', []):
+            if child.get('kind') != 't1':
+                # "more" stubs and anything that is not a comment
+                continue
+            comments.append(child['data'])
+            stack.append(child['data'].get('replies'))
+    return comments
+
+
+def get_crawl_cursor(subreddit):
+    """
+    Return the time from which new posts must be fetched: the start of the last
+    completed crawl of the subreddit, minus a safety overlap. ``None`` means the
+    subreddit was never crawled successfully.
+    """
+    last_crawl = (CrawlHistory.objects.filter(subreddit=subreddit, status='completed')
+                  .order_by('-start_time').values_list('start_time', flat=True).first())
+    if last_crawl is None:
+        return None
+    return last_crawl - datetime.timedelta(seconds=settings.CRAWLER_CURSOR_OVERLAP)
+
+
+class RedditCrawler:
+    """
+    Crawls subreddits concurrently and hands the results to the ingestion pipeline.
+
+    Every subreddit is crawled in its own task. All requests share one rate
+    limiter and a semaphore that bounds the number of connections in flight.
+    Retryable failures (429, 5xx, network errors) are retried with exponential
+    backoff. Each subreddit crawl is recorded in CrawlHistory, including failures.
+    """
+
+    def __init__(self, transport=None, base_url=None, max_connections=None, requests_per_minute=None,
+                 max_retries=None, max_pages=None, crawl_comments=True, backoff_base=1.0):
+        self.max_connections = max_connections or settings.CRAWLER_MAX_CONNECTIONS
+        self.transport = transport or RequestsTransport(max_connections=self.max_connections)
+        self.base_url = (base_url or settings.REDDIT_BASE_URL).rstrip('/')
+        self.rate_limiter = RateLimiter((requests_per_minute or settings.CRAWLER_REQUESTS_PER_MINUTE) / 60)
+        self.max_retries = settings.CRAWLER_MAX_RETRIES if max_retries is None else max_retries
+        self.max_pages = max_pages or settings.CRAWLER_MAX_PAGES
+        self.crawl_comments = crawl_comments
+        self.backoff_base = backoff_base
+        self.connections = None
+
+    async def crawl(self, names=None):
+        """Crawl the given subreddit names (all subreddits by default) and return their CrawlHistory rows"""
+        self.connections = asyncio.Semaphore(self.max_connections)
+        subreddits = Subreddit.objects.order_by('name')
+        if names:
+            subreddits = subreddits.filter(name__in=names)
+        subreddits = await sync_to_async(list)(subreddits)
+        try:
+            return await asyncio.gather(*(self.crawl_subreddit(subreddit) for subreddit in subreddits))
+        finally:
+            close = getattr(self.transport, 'close', None)
+            if close is not None:
+                await close()
+
+    async def crawl_subreddit(self, subreddit):
+        since = await sync_to_async(get_crawl_cursor)(subreddit)
+        crawl = await sync_to_async(CrawlHistory.objects.create)(
+            subreddit=subreddit, start_time=timezone.now(), status='running')
+        try:
+            posts = await self.fetch_new_posts(subreddit.name, since)
+            comments = []
+            if self.crawl_comments and posts:
+                threads = await asyncio.gather(*(self.fetch_comments(post['id']) for post in posts))
+                comments = [comment for thread in threads for comment in thread]
+        except Exception as exc:
+            logger.warning('Crawl of r/%s failed: %s', subreddit.name, exc)
+            crawl.status = 'failed'
+            crawl.error_message = str(exc)
+            crawl.end_time = timezone.now()
+            await sync_to_async(crawl.save)()
+            return crawl
+
+        try:
+            await sync_to_async(ingest_crawl)(posts, comments, subreddit=subreddit.name, crawl=crawl)
+        except Exception:
+            # The ingestor has already marked the crawl as failed
+            logger.exception('Ingesting r/%s failed', subreddit.name)
+        return crawl
+
+    async def fetch_new_posts(self, name, since=None):
+        """Page through /r/<name>/new until reaching posts older than ``since``"""
+        posts = []
+        after = None
+        for _ in range(self.max_pages):
+            params = {'limit': 100, 'raw_json': 1}
+            if after:
+                params['after'] = after
+            listing = await self.request(f'/r/{name}/new.json', params)
+            data = (listing or {}).get('data', {})
+
+            reached_cursor = False
+            for child in data.get('children', []):
+                post = child.get('data', {})
+                created = post.get('created_utc')
+                if since is not None and created is not None and created < since.timestamp():
+                    reached_cursor = True
+                    break
+                posts.append(post)
+
+            after = data.get('after')
+            if reached_cursor or not after:
+                break
+        return posts
+
+    async def fetch_comments(self, post_id):
+        try:
+            response = await self.request(f'/comments/{post_id}.json', {'limit': 500, 'raw_json': 1})
+        except CrawlError as exc:
+            # A single unavailable thread (e.g. deleted post) should not fail the whole subreddit
+            logger.warning('Skipping comments of post %s: %s', post_id, exc)
+            return []
+        if not isinstance(response, list) or len(response) < 2:
+            return []
+        return flatten_comments(response[1])
+
+    async def request(self, path, params=None):
+        """GET a Reddit JSON endpoint, honouring rate limits and retrying transient failures"""
+        url = f'{self.base_url}{path}'
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            try:
+                async with self.connections:
+                    response = await self.transport.get(url, params)
+            except (OSError, asyncio.TimeoutError) as exc:
+                error = f'{url}: {exc}'
+            else:
+                self.rate_limiter.update_from_headers(response.headers)
+                if response.status == 200:
+                    return response.data
+                if response.status != 429 and response.status < 500:
+                    raise CrawlError(f'{url} returned HTTP {response.status}')
+                error = f'{url} returned HTTP {response.status}'
+                retry_after = response.headers.get('retry-after')
+                if retry_after:
+                    try:
+                        self.rate_limiter.pause(float(retry_after))
+                    except ValueError:
+                        pass
+
+            if attempt < self.max_retries:
+                delay = self.backoff_base * 2 ** attempt
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+        raise CrawlError(f'Giving up after {self.max_retries + 1} attempts: {error}')
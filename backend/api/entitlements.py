@@ -0,0 +1,103 @@
+import datetime
+from dataclasses import dataclass
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+from .models import User, Subscription
+from .authentication import token_cache
+
+PREMIUM = 'Premium'
+FREE = 'Free'
+
+
+@dataclass(frozen=True)
+class Entitlement:
+    """
+    What a user is entitled to. ``premium_until`` is the expiry of their
+    latest active subscription, or ``None`` for memberships granted without
+    one (e.g. by an admin), which do not expire.
+    """
+    membership_status: str
+    premium_until: datetime.datetime = None
+
+    @property
+    def is_premium(self):
+        if self.membership_status != PREMIUM:
+            return False
+        return self.premium_until is None or self.premium_until > timezone.now()
+
+
+def entitlement_key(user_id):
+    return f'entitlement:{user_id}'
+
+
+def active_subscriptions(now=None):
+    return Subscription.objects.filter(status='active', expires_at__gt=now or timezone.now())
+
+
+def compute_entitlement(user):
+    """Build a user's entitlement from their active subscriptions (one query)"""
+    premium_until = active_subscriptions().filter(user_id=user.pk).aggregate(until=Max('expires_at'))['until']
+    if premium_until is not None:
+        return Entitlement(PREMIUM, premium_until)
+    if user.membership_status == PREMIUM and Subscription.objects.filter(user_id=user.pk).exists():
+        # Paid membership whose subscriptions all lapsed; the expiry sweep has not caught up yet
+        return Entitlement(FREE)
+    return Entitlement(user.membership_status)
+
+
+def get_entitlement(user):
+    """
+    Return a user's entitlement without touching the database when possible:
+    it is memoised on the user object for the request and cached across
+    requests until the user's subscriptions change.
+    """
+    entitlement = getattr(user, '_entitlement', None)
+    if entitlement is None:
+        key = entitlement_key(user.pk)
+        entitlement = cache.get(key)
+        if entitlement is None:
+            entitlement = compute_entitlement(user)
+            cache.set(key, entitlement, settings.ENTITLEMENT_CACHE_TIMEOUT)
+        user._entitlement = entitlement
+    return entitlement
+
+
+def invalidate_entitlements(user_ids):
+    cache.delete_many([entitlement_key(user_id) for user_id in user_ids])
+
+
+def refresh_membership(user_id):
+    """
+    Bring a user's membership_status in line with their subscriptions after a
+    subscription change. Only that column is written, and only if it changed.
+    """
+    now = timezone.now()
+    status = PREMIUM if active_subscriptions(now).filter(user_id=user_id).exists() else FREE
+    if User.objects.filter(pk=user_id).exclude(membership_status=status).update(
+            membership_status=status, updated_at=now):
+        # Token-authenticated requests read the user from the token cache
+        token_cache.invalidate_user(user_id)
+    invalidate_entitlements([user_id])
+
+
+def expire_memberships(batch_size=None):
+    """
+    Downgrade premium users whose subscriptions have all expired, one UPDATE
+    per batch. Memberships granted without a subscription are left alone.
+    Returns the number of users downgraded.
+    """
+    batch_size = batch_size or settings.MEMBERSHIP_EXPIRY_BATCH_SIZE
+    now = timezone.now()
+    expired = (User.objects.filter(membership_status=PREMIUM)
+               .filter(Exists(Subscription.objects.filter(user=OuterRef('pk'))))
+               .exclude(Exists(active_subscriptions(now).filter(user=OuterRef('pk')))))
+    total = 0
+    while True:
+        user_ids = list(expired.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not user_ids:
+            return total
+        total += User.objects.filter(pk__in=user_ids).update(membership_status=FREE, updated_at=now)
+        invalidate_entitlements(user_ids)
+        token_cache.invalidate_users(user_ids)
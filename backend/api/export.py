@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+import zlib
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import Post, Comment
+from .filters import PostExportFilter, CommentExportFilter
+
+# Exportable datasets: model, filterset and the columns written, in order
+EXPORTS = {
+    'posts': (Post, PostExportFilter, (
+        'id', 'reddit_id', 'subreddit_id', 'subreddit_name', 'title', 'body', 'author', 'upvotes',
+        'comments_count', 'submission_date', 'post_url', 'manually_added', 'created_at', 'updated_at',
+    )),
+    'comments': (Comment, CommentExportFilter, (
+        'id', 'reddit_id', 'post_id', 'parent_comment_id', 'author', 'body', 'upvotes',
+        'submission_date', 'created_at', 'updated_at',
+    )),
+}
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def export_queryset(dataset, params, after_id=None):
+    """
+    Filtered rows of ``dataset`` as value tuples in id order, starting after
+    ``after_id`` so an interrupted export can resume where it stopped.
+    """
+    try:
+        model, filterset_class, columns = EXPORTS[dataset]
+    except KeyError:
+        raise ExportError(f'Unknown dataset "{dataset}", expected one of: {", ".join(EXPORTS)}')
+    filterset = filterset_class(params, queryset=model.objects.all())
+    if not filterset.is_valid():
+        raise ExportError(json.dumps(filterset.errors))
+    queryset = filterset.qs
+    if after_id:
+        queryset = queryset.filter(id__gt=after_id)
+    return columns, queryset.order_by('id').values_list(*columns)
+
+
+def iter_rows(queryset, chunk_size=None):
+    # A server-side cursor on PostgreSQL, so only one chunk of rows is held at a time
+    return queryset.iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE)
+
+
+def render_ndjson(columns, rows, chunk_size):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, ensure_ascii=False))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def render_csv(columns, rows, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow([value.isoformat() if hasattr(value, 'isoformat') else value for value in row])
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+RENDERERS = {
+    'ndjson': render_ndjson,
+    'csv': render_csv,
+}
+
+
+def gzip_stream(chunks, level=6):
+    """Compress an iterable of byte strings into a gzip stream, chunk by chunk"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(dataset, params, output='ndjson', after_id=None, compress=False, chunk_size=None):
+    """
+    Return ``(content_type, iterator of bytes)`` exporting ``dataset`` filtered
+    by ``params``. Rows are read through a server-side cursor and encoded one
+    chunk at a time, so memory use does not depend on the size of the export.
+    """
+    if output not in RENDERERS:
+        raise ExportError(f'Unknown output "{output}", expected one of: {", ".join(RENDERERS)}')
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    columns, queryset = export_queryset(dataset, params, after_id)
+    text = RENDERERS[output](columns, iter_rows(queryset, chunk_size), chunk_size)
+    chunks = (chunk.encode('utf-8') for chunk in text)
+    if compress:
+        chunks = gzip_stream(chunks)
+    return FORMATS[output], chunks
+
+
+async def aiter_chunks(chunks):
+    """
+    Async iterator over the chunks of ``export_stream``, for ASGI: Django would
+    read a sync iterator whole before sending any of it. Each chunk is read by a
+    thread-sensitive ``sync_to_async`` call, so the server-side cursor stays on
+    the request's database connection.
+    """
+    try:
+        while (chunk := await sync_to_async(next)(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # Closes the cursor when the client disconnects mid-export
+        await sync_to_async(chunks.close)()
@@ -0,0 +1,170 @@
+import functools
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from .fieldsets import FieldsetMixin, ordering_columns
+from .instrumentation import measure_serialization
+from .renderers import FastRows
+from .serializers import SearchResultMixin
+
+# to_representation methods that add nothing to the fields' own output (search
+# results carry annotations, which keep a queryset off the fast path)
+PLAIN_REPRESENTATIONS = (serializers.ModelSerializer.to_representation, SearchResultMixin.to_representation)
+
+
+def datetime_converter(field):
+    """``DateTimeField.to_representation`` for aware datetimes, in the current time zone"""
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if value.tzinfo is None:
+            return field.to_representation(value)
+        try:
+            value = value.astimezone(field_timezone).isoformat()
+        except OverflowError:
+            return field.to_representation(value)
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+class ValuesSerializer:
+    """
+    A read-only ModelSerializer compiled to the model columns its fields read
+    and a converter per column, so a page can be fetched with ``.values_list()``
+    and represented without model instances or DRF's per-field attribute
+    lookups. ``rows()`` returns exactly what ``serializer.data`` would.
+
+    Fields must read a concrete model column (or a foreign key's id through
+    ``PrimaryKeyRelatedField``); ``fields`` keeps only the named ones.
+    Serializers that override ``to_representation`` also define
+    ``represent_row(data, instance)``, which both paths apply to each row.
+    """
+
+    def __init__(self, serializer_class, fields=None):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.hook = getattr(serializer_class, 'represent_row', None)
+        if serializer_class.to_representation not in PLAIN_REPRESENTATIONS and self.hook is None:
+            raise ValueError(f'{serializer_class.__name__} has its own to_representation')
+        self.fields = []
+        self.float_free = True
+        for name, field in serializer_class().fields.items():
+            if not field.write_only and (fields is None or name in fields):
+                self.fields.append((name, *self.compile_field(field)))
+        self.names = [name for name, _, _, _ in self.fields]
+        self.columns = [column for _, column, _, _ in self.fields]
+
+    def compile_field(self, field):
+        """``(column, kind, field)``; the kind decides the converter, None when values are used as they are"""
+        if field.source == '*' or len(field.source_attrs) != 1 or isinstance(field, serializers.BaseSerializer):
+            raise ValueError(f'{field.field_name} does not read a model column')
+        model_field = self.model._meta.get_field(field.source)
+        if isinstance(field, PrimaryKeyRelatedField) and model_field.many_to_one and field.pk_field is None:
+            # values_list() on a foreign key returns the id, which is what the field outputs
+            return model_field.name, None, field
+        if model_field.is_relation or not model_field.concrete:
+            raise ValueError(f'{field.field_name} is not a column')
+        if isinstance(field, serializers.BooleanField) and isinstance(model_field, models.BooleanField):
+            return model_field.name, None, field
+        if isinstance(field, serializers.IntegerField) and isinstance(model_field, models.IntegerField):
+            return model_field.name, None, field
+        if (isinstance(field, serializers.CharField)
+                and isinstance(model_field, (models.CharField, models.TextField))):
+            return model_field.name, None, field
+        if isinstance(field, serializers.DateTimeField) and isinstance(model_field, models.DateTimeField):
+            return model_field.name, 'datetime', field
+        # Anything else goes through the field, and may produce floats
+        self.float_free = False
+        return model_field.name, 'field', field
+
+    def get_converters(self):
+        # Bound per call, as the current time zone can change between requests
+        return [(index, datetime_converter(field) if kind == 'datetime' else field.to_representation)
+                for index, (_, _, kind, field) in enumerate(self.fields) if kind is not None]
+
+    def values(self, queryset, extra_columns=()):
+        """
+        The queryset's rows as named tuples of the compiled columns, the id and
+        ``extra_columns`` (``getattr`` works on them, as on instances)
+        """
+        columns = list(dict.fromkeys([*self.columns, 'id', *extra_columns]))
+        return queryset.prefetch_related(None).values_list(*columns, named=True)
+
+    def rows(self, rows, context=None):
+        names = self.names
+        count = len(names)
+        converters = self.get_converters()
+        hook = self.hook and self.serializer_class(context=context or {}).represent_row
+        result = FastRows() if self.float_free else []
+        with measure_serialization():
+            for row in rows:
+                values = list(row[:count])
+                for index, convert in converters:
+                    if values[index] is not None:
+                        values[index] = convert(values[index])
+                data = dict(zip(names, values))
+                result.append(hook(data, row) if hook else data)
+        return result
+
+
+@functools.lru_cache(maxsize=1024)
+def get_values_serializer(serializer_class, fields=None):
+    """The compiled ``ValuesSerializer`` of a serializer class, or None when it cannot be compiled"""
+    try:
+        return ValuesSerializer(serializer_class, fields)
+    except (ValueError, AttributeError, FieldDoesNotExist):
+        return None
+
+
+class FastListMixin(FieldsetMixin):
+    """
+    Serves the ``list`` action of a read-only listing from ``.values_list()``
+    rows through a ``ValuesSerializer`` of ``fast_list_serializer_class``
+    (default: the list serializer) and the requested fieldset when
+    FAST_LIST_SERIALIZATION is on. The response is the same as the DRF path's;
+    querysets the fast path cannot represent take the DRF path: annotated
+    ones (search results) and ones ordered by anything but the model's columns.
+    """
+    fast_list_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        values_serializer = self.get_fast_list_serializer(queryset)
+        if values_serializer is None:
+            return self.list_queryset(queryset)
+
+        # Keyset pagination reads the ordering columns of the last row
+        rows = values_serializer.values(queryset, ordering_columns(queryset))
+        page = self.paginate_queryset(rows)
+        rows = values_serializer.rows(rows if page is None else page, self.get_serializer_context())
+        rows = self.add_fast_list_relations(rows)
+        if page is not None:
+            return self.get_paginated_response(rows)
+        return Response(rows)
+
+    def list_queryset(self, queryset):
+        # ListModelMixin.list on an already filtered queryset
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
+    def get_fast_list_serializer(self, queryset):
+        if (not settings.FAST_LIST_SERIALIZATION or queryset.query.annotations
+                or ordering_columns(queryset) is None):
+            return None
+        return get_values_serializer(self.fast_list_serializer_class or self.get_serializer_class(),
+                                     self.get_fieldset())
+
+    def add_fast_list_relations(self, rows):
+        """Hook adding the related data the fast list serializer leaves out"""
+        return rows
@@ -0,0 +1,127 @@
+import functools
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.permissions import SAFE_METHODS
+from .serializers import SparseFieldsMixin
+
+FIELDS_PARAM = 'fields'
+OMIT_PARAM = 'omit'
+
+
+def split_names(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+@functools.lru_cache(maxsize=None)
+def serializer_field_names(serializer_class):
+    """The names of a serializer class's readable fields, in output order"""
+    return tuple(name for name, field in serializer_class().fields.items() if not field.write_only)
+
+
+def requested_fields(query_params, serializer_class):
+    """
+    The fields of ``serializer_class`` asked for with ``?fields=a,b`` (only
+    these) and ``?omit=c`` (all but these), in the serializer's order; None
+    when neither is given. Unknown names are ignored.
+    """
+    fields = split_names(query_params.get(FIELDS_PARAM, ''))
+    omit = split_names(query_params.get(OMIT_PARAM, ''))
+    if not fields and not omit:
+        return None
+    return tuple(name for name in serializer_field_names(serializer_class)
+                 if (not fields or name in fields) and name not in omit)
+
+
+@functools.lru_cache(maxsize=1024)
+def serializer_columns(serializer_class, fields=None):
+    """
+    The model columns read by the given fields of a serializer (all of them
+    when None), primary key included; None when a field reads something else
+    than a model field, unless the serializer lists the columns it needs in
+    ``field_columns`` (e.g. for a SerializerMethodField).
+    """
+    model = serializer_class.Meta.model
+    declared = getattr(serializer_class, 'field_columns', {})
+    serializer_fields = serializer_class().fields
+    columns = [model._meta.pk.name]
+    for name in serializer_field_names(serializer_class) if fields is None else fields:
+        if name in declared:
+            columns.extend(declared[name])
+            continue
+        field = serializer_fields[name]
+        if field.source == '*' or len(field.source_attrs) != 1:
+            return None
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        # Reverse relations are looked up by the instance's primary key
+        if model_field.concrete:
+            columns.append(model_field.name)
+    return tuple(dict.fromkeys(columns))
+
+
+def ordering_columns(queryset):
+    """The columns a queryset is ordered by; None when it is ordered by anything else (relations, annotations)"""
+    columns = []
+    for ordering in queryset.query.order_by or queryset.model._meta.ordering:
+        if not isinstance(ordering, str):
+            return None
+        name = ordering.lstrip('-')
+        try:
+            field = queryset.model._meta.pk if name == 'pk' else queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        if not field.concrete or field.is_relation:
+            return None
+        columns.append(field.name)
+    return columns
+
+
+def defer_columns(queryset, serializer_class, fields=None):
+    """
+    ``queryset`` loading only the columns the serializer's fields read, plus
+    its ordering (keyset pagination reads it from the last row)
+    """
+    columns = serializer_columns(serializer_class, fields)
+    if columns is None:
+        return queryset
+    return queryset.only(*columns, *(ordering_columns(queryset) or ()))
+
+
+class FieldsetMixin:
+    """
+    Serves ``?fields=`` / ``?omit=`` on read requests: the serializer only
+    outputs the fields asked for (see ``SparseFieldsMixin``), and list and
+    detail querysets only load the columns those fields read. Without either
+    parameter, lists still skip the columns their serializer does not output.
+    Prefetches listed in ``field_prefetches`` only run when their field is output.
+    """
+    # Field name: the prefetch_related() lookups serializing it needs
+    field_prefetches = {}
+
+    def get_fieldset(self):
+        """The fields asked for, or None for all of them"""
+        serializer_class = self.get_serializer_class()
+        if self.request.method not in SAFE_METHODS or not issubclass(serializer_class, SparseFieldsMixin):
+            return None
+        return requested_fields(self.request.query_params, serializer_class)
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_fieldset()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_fieldset()
+        for name, lookups in self.field_prefetches.items():
+            if fields is None or name in fields:
+                queryset = queryset.prefetch_related(*lookups)
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method not in SAFE_METHODS or self.action not in ('list', 'retrieve'):
+            return queryset
+        return defer_columns(queryset, self.get_serializer_class(), self.get_fieldset())
@@ -0,0 +1,45 @@
+import django_filters
+from .models import Post, Comment
+
+
+class KeywordMatchFilterSet(django_filters.FilterSet):
+    """
+    Adds ``?keyword=<id>``, answered from the stored keyword matches.
+    Matches of inactive (or deleted) keywords are ignored until they are pruned.
+    """
+    keyword = django_filters.NumberFilter(method='filter_keyword')
+
+    def filter_keyword(self, queryset, name, value):
+        return queryset.filter(keyword_matches__keyword_id=value, keyword_matches__keyword__active=True)
+
+
+class PostFilter(KeywordMatchFilterSet):
+    class Meta:
+        model = Post
+        fields = ['subreddit', 'author', 'manually_added', 'keyword']
+
+
+class AsyncPostFilter(PostFilter):
+    """``PostFilter`` for async views: the subreddit is not looked up while validating"""
+    subreddit = django_filters.NumberFilter(field_name='subreddit_id')
+
+
+class CommentFilter(KeywordMatchFilterSet):
+    class Meta:
+        model = Comment
+        fields = ['post', 'author', 'keyword']
+
+
+class PostExportFilter(PostFilter):
+    """Filters accepted by the post export: subreddit (id or name), submission date range and keyword"""
+    subreddit_name = django_filters.CharFilter(field_name='subreddit__name', lookup_expr='iexact')
+    since = django_filters.IsoDateTimeFilter(field_name='submission_date', lookup_expr='gte')
+    until = django_filters.IsoDateTimeFilter(field_name='submission_date', lookup_expr='lt')
+
+
+class CommentExportFilter(CommentFilter):
+    """Filters accepted by the comment export: the post's subreddit, submission date range and keyword"""
+    subreddit = django_filters.NumberFilter(field_name='post__subreddit_id')
+    subreddit_name = django_filters.CharFilter(field_name='post__subreddit__name', lookup_expr='iexact')
+    since = django_filters.IsoDateTimeFilter(field_name='submission_date', lookup_expr='gte')
+    until = django_filters.IsoDateTimeFilter(field_name='submission_date', lookup_expr='lt')
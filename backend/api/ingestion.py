@@ -0,0 +1,354 @@
+import datetime
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import islice
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import Subreddit, Post, Comment, CrawlHistory
+from .notifications import coalesce_post_notifications, queue_new_post_notification
+from .keywords import get_matcher, record_matches
+from .caching import POSTS, COMMENTS, SUBREDDITS, invalidate_responses
+from . import counters
+
+logger = logging.getLogger('api')
+
+# comments_count is not taken from Reddit: it counts the stored comments (see api.counters)
+POST_UPDATE_FIELDS = ['title', 'body', 'upvotes', 'author', 'submission_date', 'post_url', 'updated_at']
+COMMENT_UPDATE_FIELDS = ['body', 'author', 'upvotes', 'submission_date', 'parent_comment', 'updated_at']
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def strip_fullname(value):
+    """Turn a Reddit fullname such as ``t3_abc123`` into the bare id ``abc123``"""
+    if value and len(value) > 3 and value[0] == 't' and value[2] == '_':
+        return value[3:]
+    return value
+
+
+def parse_timestamp(value):
+    """Accept either epoch seconds (Reddit's ``created_utc``) or an ISO 8601 string"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.datetime.fromtimestamp(value, tz=datetime.timezone.utc)
+    parsed = parse_datetime(value)
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, datetime.timezone.utc)
+    return parsed
+
+
+def truncate(value, length=255):
+    return value[:length] if value else value
+
+
+def normalize_post(raw, subreddit=None):
+    """
+    Map a crawled post onto Post fields. Both our own field names and the raw
+    Reddit API names (``id``, ``selftext``, ``score``, ``created_utc``,
+    ``permalink``) are understood.
+    """
+    subreddit = raw.get('subreddit') or subreddit
+    if not subreddit:
+        raise ValueError(f"Post {raw.get('reddit_id') or raw.get('id')} has no subreddit")
+    post_url = raw.get('post_url') or raw.get('url')
+    if not post_url and raw.get('permalink'):
+        post_url = f"https://reddit.com{raw['permalink']}"
+    return {
+        'reddit_id': strip_fullname(raw.get('reddit_id') or raw['id']),
+        'title': truncate(raw['title']),
+        'body': raw.get('body', raw.get('selftext')) or None,
+        'upvotes': int(raw.get('upvotes', raw.get('score')) or 0),
+        'author': truncate(raw.get('author')),
+        'submission_date': parse_timestamp(raw.get('submission_date', raw.get('created_utc'))),
+        'post_url': truncate(post_url),
+        'subreddit': subreddit,
+    }
+
+
+def normalize_comment(raw):
+    """
+    Map a crawled comment onto Comment fields. ``parent_id`` may point at the
+    post (``t3_``), which makes the comment a top-level one.
+    """
+    parent = raw.get('parent_reddit_id', raw.get('parent_id'))
+    if parent and parent.startswith('t3_'):
+        parent = None
+    return {
+        'reddit_id': strip_fullname(raw.get('reddit_id') or raw['id']),
+        'post_reddit_id': strip_fullname(raw.get('post_reddit_id') or raw['link_id']),
+        'parent_reddit_id': strip_fullname(parent) or None,
+        'body': raw.get('body') or '',
+        'author': truncate(raw.get('author')),
+        'upvotes': int(raw.get('upvotes', raw.get('score')) or 0),
+        'submission_date': parse_timestamp(raw.get('submission_date', raw.get('created_utc'))),
+    }
+
+
+@dataclass
+class IngestionResult:
+    """Counters for one ingestion run"""
+    crawl: CrawlHistory = None
+    posts_created: int = 0
+    posts_updated: int = 0
+    comments_created: int = 0
+    comments_updated: int = 0
+    comments_skipped: int = 0
+    keyword_matches: int = 0
+    duration: float = 0.0
+    batches: int = field(default=0, repr=False)
+
+    @property
+    def posts(self):
+        return self.posts_created + self.posts_updated
+
+    @property
+    def comments(self):
+        return self.comments_created + self.comments_updated
+
+    @property
+    def rows_per_second(self):
+        if not self.duration:
+            return 0.0
+        return (self.posts + self.comments) / self.duration
+
+    def as_dict(self):
+        return {
+            'crawl_id': self.crawl.id if self.crawl else None,
+            'posts_created': self.posts_created,
+            'posts_updated': self.posts_updated,
+            'comments_created': self.comments_created,
+            'comments_updated': self.comments_updated,
+            'comments_skipped': self.comments_skipped,
+            'keyword_matches': self.keyword_matches,
+            'duration': round(self.duration, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+class CrawlIngestor:
+    """
+    Upserts crawled posts and comments in batches keyed on ``reddit_id``.
+
+    Rows go through ``bulk_create(update_conflicts=True)``, so model signals do
+    not fire: the subreddit name is denormalised here, and each batch hands new
+    posts to the notification fan-out, updates the denormalised counters,
+    records keyword matches and invalidates cached API responses explicitly. Comment parents are resolved in memory,
+    inserting each batch level by level so parents exist before replies;
+    replies whose parent has not been seen yet wait for a later batch.
+    """
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or settings.INGESTION_BATCH_SIZE
+        self.subreddits = {}
+        self.post_ids = {}
+        self.comment_ids = {}
+        self.waiting = {}
+        self.matcher = None
+
+    def ingest(self, posts=(), comments=(), subreddit=None, crawl=None):
+        """
+        Ingest streams of raw posts and comments and record the run in CrawlHistory.
+        ``subreddit`` is the default subreddit name for posts that do not carry one;
+        pass ``crawl`` to complete a CrawlHistory row opened by the caller.
+        """
+        result = IngestionResult()
+        started = time.perf_counter()
+        self.matcher = get_matcher()
+        if crawl is None:
+            crawl = CrawlHistory.objects.create(
+                subreddit=self.get_subreddits([subreddit])[subreddit] if subreddit else None,
+                start_time=timezone.now(),
+                status='running',
+            )
+        result.crawl = crawl
+        try:
+            for batch in chunked((normalize_post(raw, subreddit) for raw in posts), self.batch_size):
+                self.upsert_posts(batch, result)
+            for batch in chunked((normalize_comment(raw) for raw in comments), self.batch_size):
+                self.upsert_comments(batch, result)
+            if self.waiting:
+                # Whatever is still waiting has a parent that was never crawled
+                self.upsert_comments([], result, final=True)
+        except Exception as exc:
+            crawl.status = 'failed'
+            crawl.error_message = str(exc)
+            raise
+        else:
+            crawl.status = 'completed'
+        finally:
+            result.duration = time.perf_counter() - started
+            crawl.end_time = timezone.now()
+            crawl.posts_found = result.posts
+            crawl.comments_found = result.comments
+            crawl.save()
+            logger.info(
+                'Crawl %s %s: %d posts (%d new), %d comments (%d new, %d skipped), %d keyword matches '
+                'in %.2fs (%.0f rows/s)',
+                crawl.id, crawl.status, result.posts, result.posts_created, result.comments,
+                result.comments_created, result.comments_skipped, result.keyword_matches,
+                result.duration, result.rows_per_second,
+            )
+        return result
+
+    def get_subreddits(self, names):
+        """Return a name -> Subreddit mapping, creating the subreddits that do not exist yet"""
+        missing = {name for name in names if name not in self.subreddits}
+        if missing:
+            found = {s.name: s for s in Subreddit.objects.filter(name__in=missing)}
+            new = [Subreddit(name=name) for name in missing if name not in found]
+            if new:
+                Subreddit.objects.bulk_create(new, ignore_conflicts=True)
+                invalidate_responses(SUBREDDITS)
+                found.update({s.name: s for s in Subreddit.objects.filter(name__in=[s.name for s in new])})
+            self.subreddits.update(found)
+        return {name: self.subreddits[name] for name in names}
+
+    def upsert_posts(self, rows, result):
+        # Later copies of the same post in a batch win
+        rows = list({row['reddit_id']: row for row in rows}.values())
+        reddit_ids = [row['reddit_id'] for row in rows]
+        subreddits = self.get_subreddits({row['subreddit'] for row in rows})
+        existing = set(Post.objects.filter(reddit_id__in=reddit_ids).values_list('reddit_id', flat=True))
+
+        posts = []
+        for row in rows:
+            subreddit = subreddits[row.pop('subreddit')]
+            posts.append(Post(subreddit=subreddit, subreddit_name=subreddit.name, **row))
+
+        with transaction.atomic(), coalesce_post_notifications():
+            Post.objects.bulk_create(
+                posts,
+                update_conflicts=True,
+                unique_fields=['reddit_id'],
+                update_fields=POST_UPDATE_FIELDS,
+            )
+            for post in posts:
+                if post.reddit_id not in existing:
+                    queue_new_post_notification(post)
+            counters.add_post_batch(posts, created=set(reddit_ids) - existing)
+
+        self.remember_ids(self.post_ids, Post, posts)
+        result.keyword_matches += len(record_matches(
+            Post, [(self.post_ids[post.reddit_id], post.title, post.body) for post in posts], self.matcher))
+        result.posts_created += len(rows) - len(existing)
+        result.posts_updated += len(existing)
+        result.batches += 1
+        invalidate_responses(POSTS)
+
+    def upsert_comments(self, rows, result, final=False):
+        # Replies held back by earlier batches get another chance now
+        rows = {**self.waiting, **{row['reddit_id']: row for row in rows}}
+        self.waiting = {}
+        self.load_ids(self.post_ids, Post, {row['post_reddit_id'] for row in rows.values()})
+        self.load_ids(self.comment_ids, Comment, {
+            row['parent_reddit_id'] for row in rows.values()
+            if row['parent_reddit_id'] and row['parent_reddit_id'] not in rows
+        })
+        if not final:
+            self.hold_back_orphans(rows)
+        if not rows:
+            return
+        existing = set(Comment.objects.filter(reddit_id__in=list(rows)).values_list('reddit_id', flat=True))
+
+        with transaction.atomic():
+            for level in self.comment_levels(rows):
+                comments = []
+                for row in level:
+                    post_id = self.post_ids.get(row['post_reddit_id'])
+                    if post_id is None:
+                        result.comments_skipped += 1
+                        continue
+                    comments.append(Comment(
+                        reddit_id=row['reddit_id'],
+                        post_id=post_id,
+                        # Parents that were never crawled leave the reply at the top level
+                        parent_comment_id=self.comment_ids.get(row['parent_reddit_id']),
+                        body=row['body'],
+                        author=row['author'],
+                        upvotes=row['upvotes'],
+                        submission_date=row['submission_date'],
+                    ))
+                if not comments:
+                    continue
+                Comment.objects.bulk_create(
+                    comments,
+                    update_conflicts=True,
+                    unique_fields=['reddit_id'],
+                    update_fields=COMMENT_UPDATE_FIELDS,
+                )
+                self.remember_ids(self.comment_ids, Comment, comments)
+                result.keyword_matches += len(record_matches(
+                    Comment, [(self.comment_ids[comment.reddit_id], comment.body) for comment in comments],
+                    self.matcher))
+                created = [comment for comment in comments if comment.reddit_id not in existing]
+                counters.add_comments(Counter(comment.post_id for comment in created))
+                result.comments_updated += len(comments) - len(created)
+                result.comments_created += len(created)
+        result.batches += 1
+        invalidate_responses(COMMENTS)
+
+    def hold_back_orphans(self, rows):
+        """
+        Move replies whose parent has not been seen yet (directly or through an
+        in-batch ancestor) out of ``rows``; the parent may still arrive in a later batch.
+        """
+        changed = True
+        while changed:
+            changed = False
+            for reddit_id, row in list(rows.items()):
+                parent = row['parent_reddit_id']
+                if parent and parent not in rows and parent not in self.comment_ids:
+                    self.waiting[reddit_id] = rows.pop(reddit_id)
+                    changed = True
+
+    @staticmethod
+    def comment_levels(rows):
+        """Group a batch into levels where every comment's in-batch parent is on an earlier level"""
+        depths = {}
+        for reddit_id in rows:
+            chain = []
+            current = reddit_id
+            while current in rows and current not in depths and current not in chain:
+                chain.append(current)
+                current = rows[current]['parent_reddit_id']
+            depth = depths.get(current, -1) + 1 if current in depths else 0
+            for comment_id in reversed(chain):
+                depths[comment_id] = depth
+                depth += 1
+
+        levels = {}
+        for reddit_id, depth in depths.items():
+            levels.setdefault(depth, []).append(rows[reddit_id])
+        return [levels[depth] for depth in sorted(levels)]
+
+    @staticmethod
+    def load_ids(id_map, model, reddit_ids):
+        missing = [reddit_id for reddit_id in reddit_ids if reddit_id not in id_map]
+        if missing:
+            id_map.update(model.objects.filter(reddit_id__in=missing).values_list('reddit_id', 'id'))
+
+    @staticmethod
+    def remember_ids(id_map, model, objects):
+        if all(obj.pk is not None for obj in objects):
+            id_map.update((obj.reddit_id, obj.pk) for obj in objects)
+        else:
+            # The backend could not return primary keys from the upsert
+            id_map.update(model.objects.filter(
+                reddit_id__in=[obj.reddit_id for obj in objects]).values_list('reddit_id', 'id'))
+
+
+def ingest_crawl(posts=(), comments=(), subreddit=None, batch_size=None, crawl=None):
+    """Convenience wrapper around ``CrawlIngestor().ingest()``"""
+    return CrawlIngestor(batch_size=batch_size).ingest(posts, comments, subreddit=subreddit, crawl=crawl)
@@ -0,0 +1,277 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from rest_framework import serializers
+
+logger = logging.getLogger('api.requests')
+
+# Metrics of the request being handled; a context variable so that queries run
+# by sync views under ASGI (in a worker thread) are still attributed to it
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper adding each query's count and duration to the current request"""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextlib.contextmanager
+def measure_serialization():
+    """Adds the time spent in the block, less its queries, to the current request's serialization time"""
+    metrics = _current.get()
+    if metrics is None or metrics.serializing:
+        # Nested serializers are timed by the outermost one
+        yield
+        return
+    metrics.serializing = True
+    started, db_time = time.perf_counter(), metrics.db_time
+    try:
+        yield
+    finally:
+        metrics.serializing = False
+        metrics.serialize_time += time.perf_counter() - started - (metrics.db_time - db_time)
+
+
+def timed_data(data):
+    """A serializer ``data`` property measured by ``measure_serialization``"""
+    @functools.wraps(data.fget)
+    def get_data(self):
+        with measure_serialization():
+            return data.fget(self)
+    get_data.timed = True
+    return property(get_data)
+
+
+def install_serializer_timing():
+    """Times ``serializer.data`` of every DRF serializer, which views evaluate before rendering"""
+    for serializer_class in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(serializer_class.data.fget, 'timed', False):
+            serializer_class.data = timed_data(serializer_class.data)
+
+
+class RequestMetrics:
+    """
+    What one request cost: SQL queries, database time, serialization time,
+    render time, total time and response size
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializing = False
+        self.serialize_time = 0.0
+        self.render_started = None
+        self.render_time = 0.0
+        self.duration = 0.0
+        self.size = None
+        self.view = None
+
+    def start_render(self):
+        self.render_started = time.perf_counter()
+
+    def end_render(self, response):
+        if self.render_started is not None:
+            self.render_time = time.perf_counter() - self.render_started
+
+    def finish(self, request, response):
+        self.duration = time.perf_counter() - self.started
+        match = getattr(request, 'resolver_match', None)
+        self.view = (match.view_name or match.route) if match else None
+        if not response.streaming:
+            self.size = len(response.content)
+
+    @property
+    def app_time(self):
+        return max(self.duration - self.db_time - self.serialize_time - self.render_time, 0.0)
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'app;dur={self.app_time * 1000:.1f}',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+            f'render;dur={self.render_time * 1000:.1f}',
+            f'total;dur={self.duration * 1000:.1f}',
+        ])
+
+    def as_dict(self):
+        return {
+            'view': self.view,
+            'queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            'serialize_ms': round(self.serialize_time * 1000, 2),
+            'render_ms': round(self.render_time * 1000, 2),
+            'total_ms': round(self.duration * 1000, 2),
+            'size': self.size,
+        }
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a sorted list"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values) + 0.5) - 1))]
+
+
+class RequestStats:
+    """
+    Per-view samples of the latest requests handled by this process
+    (REQUEST_METRICS_SAMPLES per view), summarised as percentiles.
+    """
+
+    def __init__(self, samples=None):
+        self.samples = samples
+        self.lock = threading.Lock()
+        self.views = defaultdict(self._new_view)
+        self.counts = defaultdict(int)
+
+    def _new_view(self):
+        return deque(maxlen=self.samples or settings.REQUEST_METRICS_SAMPLES)
+
+    def add(self, metrics):
+        with self.lock:
+            self.views[metrics.view].append(
+                (metrics.duration, metrics.db_time, metrics.queries, metrics.size or 0))
+            self.counts[metrics.view] += 1
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+            self.counts.clear()
+
+    def summary(self):
+        with self.lock:
+            views = {view: list(samples) for view, samples in self.views.items()}
+            counts = dict(self.counts)
+        result = {}
+        for view, samples in sorted(views.items(), key=lambda item: str(item[0])):
+            durations, db_times, queries, sizes = (sorted(column) for column in zip(*samples))
+            result[str(view)] = {
+                'requests': counts[view],
+                'samples': len(samples),
+                **{f'total_ms_p{p}': round(percentile(durations, p) * 1000, 2) for p in (50, 90, 99)},
+                **{f'db_ms_p{p}': round(percentile(db_times, p) * 1000, 2) for p in (50, 90, 99)},
+                **{f'queries_p{p}': percentile(queries, p) for p in (50, 90, 99)},
+                'queries_max': queries[-1],
+                'size_p50': percentile(sizes, 50),
+                'query_budget': settings.QUERY_BUDGETS.get(view),
+            }
+        return result
+
+
+request_stats = RequestStats()
+
+
+def check_budget(metrics):
+    budget = settings.QUERY_BUDGETS.get(metrics.view)
+    if budget is None or metrics.queries <= budget:
+        return
+    message = f'{metrics.view} ran {metrics.queries} queries, over its budget of {budget}'
+    if settings.QUERY_BUDGETS_STRICT:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class InstrumentationMiddleware:
+    """
+    Measures every request: SQL query count and time, serialization time,
+    render time, total time and response size. Adds a ``Server-Timing`` header (when
+    SERVER_TIMING_ENABLED), logs one JSON line per request to ``api.requests``,
+    feeds the per-view percentiles served by /api/metrics/requests/ and checks
+    the view's entry in QUERY_BUDGETS.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        request.metrics = metrics
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.process_metrics(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        request.metrics = metrics
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.process_metrics(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        # Called just before DRF responses are rendered
+        metrics = getattr(request, 'metrics', None)
+        if metrics is not None:
+            metrics.start_render()
+            response.add_post_render_callback(metrics.end_render)
+        return response
+
+    def process_metrics(self, request, response, metrics):
+        metrics.finish(request, response)
+        if settings.SERVER_TIMING_ENABLED:
+            response['Server-Timing'] = metrics.server_timing()
+        request_stats.add(metrics)
+        logger.info(json.dumps({'method': request.method, 'path': request.path,
+                                'status': response.status_code, **metrics.as_dict()}))
+        check_budget(metrics)
+        return response
+
+
+# Settings of test runs, under manage.py test (InstrumentedTestRunner) and pytest (conftest.py):
+# query budget overruns fail the test, and reads only go to the read replicas in tests that ask
+# for them with ``override_settings(DATABASE_REPLICAS=...)``
+test_settings = override_settings(QUERY_BUDGETS_STRICT=True, DATABASE_REPLICAS=[])
+
+
+class InstrumentedTestRunner(DiscoverRunner):
+    """Test runner applying ``test_settings`` and keeping request logs quiet"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        test_settings.enable()
+        logger.setLevel(logging.WARNING)
+
+    def teardown_test_environment(self, **kwargs):
+        test_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,299 @@
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from itertools import islice
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from .models import Post, Comment, Keyword, PostKeywordMatch, CommentKeywordMatch
+from .tasks import defer
+from .caching import KEYWORD_MATCHES, invalidate_responses
+
+WHITESPACE_RE = re.compile(r'\s+')
+# Typographic quotes and dashes people type instead of the ASCII ones in our phrases
+PUNCTUATION_MAP = str.maketrans({
+    '‘': "'", '’': "'", '‛': "'", '′': "'",
+    '“': '"', '”': '"', '–': '-', '—': '-',
+})
+
+
+def normalize(text):
+    """Casefold, unify quotes/dashes and collapse whitespace runs into single spaces"""
+    return WHITESPACE_RE.sub(' ', text.translate(PUNCTUATION_MAP).casefold())
+
+
+def normalized_offsets(text):
+    """
+    Return a list mapping each character of ``normalize(text)`` to the index of
+    the original character it came from (plus a final entry for the end).
+    """
+    offsets = []
+    previous_space = False
+    for index, char in enumerate(text.translate(PUNCTUATION_MAP)):
+        if char.isspace():
+            if not previous_space:
+                offsets.append(index)
+            previous_space = True
+            continue
+        previous_space = False
+        offsets.extend([index] * len(char.casefold()))
+    offsets.append(len(text))
+    return offsets
+
+
+@dataclass(frozen=True)
+class KeywordMatch:
+    keyword_id: int
+    phrase: str
+    start: int
+    end: int
+
+
+class KeywordMatcher:
+    """
+    Aho–Corasick automaton over a set of keyword phrases.
+
+    All phrases are compiled into one deterministic automaton, so a text is
+    scanned once regardless of the number of phrases. Matching is done on the
+    normalised text and only counts whole words: a phrase must not start or
+    end in the middle of a word.
+    """
+
+    def __init__(self, phrases):
+        """``phrases`` maps keyword ids to phrases"""
+        self.phrases = {}
+        transitions = [{}]
+        outputs = [[]]
+        for keyword_id, phrase in phrases.items():
+            pattern = normalize(phrase).strip()
+            if not pattern:
+                continue
+            self.phrases[keyword_id] = phrase
+            state = 0
+            for char in pattern:
+                next_state = transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(transitions)
+                    transitions[state][char] = next_state
+                    transitions.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append((keyword_id, len(pattern)))
+
+        # Breadth-first pass computing failure links, turning the trie into a
+        # full transition table (a DFA) and merging outputs along failure links
+        alphabet = {char for table in transitions for char in table}
+        failure = [0] * len(transitions)
+        queue = deque()
+        for char, state in transitions[0].items():
+            queue.append(state)
+        while queue:
+            state = queue.popleft()
+            outputs[state] = outputs[state] + outputs[failure[state]]
+            for char in alphabet:
+                next_state = transitions[state].get(char)
+                if next_state is None:
+                    fallback = transitions[failure[state]].get(char)
+                    if fallback:
+                        transitions[state][char] = fallback
+                    continue
+                failure[next_state] = transitions[failure[state]].get(char, 0)
+                queue.append(next_state)
+
+        self.transitions = transitions
+        self.outputs = outputs
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def _scan(self, normalized):
+        """Yield ``(keyword_id, start, end)`` for every whole-word match in a normalised text"""
+        transitions = self.transitions
+        outputs = self.outputs
+        state = 0
+        for index, char in enumerate(normalized):
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                end = index + 1
+                for keyword_id, length in outputs[state]:
+                    start = end - length
+                    if self._is_whole_word(normalized, start, end):
+                        yield keyword_id, start, end
+
+    @staticmethod
+    def _is_whole_word(text, start, end):
+        if start > 0 and text[start].isalnum() and text[start - 1].isalnum():
+            return False
+        if end < len(text) and text[end - 1].isalnum() and text[end].isalnum():
+            return False
+        return True
+
+    def find(self, text):
+        """Return every match in ``text`` with offsets into the original (unnormalised) text"""
+        if not text or not self.phrases:
+            return []
+        normalized = normalize(text)
+        matches = list(self._scan(normalized))
+        if not matches:
+            return []
+        offsets = normalized_offsets(text)
+        return [
+            KeywordMatch(keyword_id, self.phrases[keyword_id], offsets[start], offsets[end - 1] + 1)
+            for keyword_id, start, end in matches
+        ]
+
+    def matched_ids(self, *texts):
+        """Return the ids of the keywords found in any of ``texts``"""
+        found = set()
+        if not self.phrases:
+            return found
+        for text in texts:
+            if text:
+                found.update(keyword_id for keyword_id, _, _ in self._scan(normalize(text)))
+        return found
+
+
+class MatcherCache:
+    """
+    Keeps one compiled matcher per process.
+
+    Keyword signals invalidate it right away in the current process. Other
+    processes notice changes by comparing a cheap fingerprint of the Keyword
+    table (row count and latest ``updated_at``), checked at most every
+    ``KEYWORD_MATCHER_CHECK_INTERVAL`` seconds.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.matcher = None
+        self.fingerprint = None
+        self.checked_at = 0.0
+
+    def invalidate(self):
+        with self.lock:
+            self.matcher = None
+
+    @staticmethod
+    def get_fingerprint():
+        stats = Keyword.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+        return stats['count'], stats['updated']
+
+    def get(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.matcher is not None and now - self.checked_at < settings.KEYWORD_MATCHER_CHECK_INTERVAL:
+                return self.matcher
+            fingerprint = self.get_fingerprint()
+            if self.matcher is None or fingerprint != self.fingerprint:
+                phrases = dict(Keyword.objects.filter(active=True).values_list('id', 'phrase'))
+                self.matcher = KeywordMatcher(phrases)
+                self.fingerprint = fingerprint
+            self.checked_at = now
+            return self.matcher
+
+
+matcher_cache = MatcherCache()
+
+
+def get_matcher():
+    """Return the compiled matcher for the currently active keywords"""
+    return matcher_cache.get()
+
+
+# Where the matches of each matchable model are stored, and which of its fields are scanned
+MATCH_TABLES = {
+    Post: (PostKeywordMatch, 'post_id', ('title', 'body')),
+    Comment: (CommentKeywordMatch, 'comment_id', ('body',)),
+}
+
+
+def match_rows(matcher, rows):
+    """Yield ``(row id, keyword id)`` pairs for rows of ``(id, *texts)``"""
+    for row_id, *texts in rows:
+        for keyword_id in matcher.matched_ids(*texts):
+            yield row_id, keyword_id
+
+
+def record_matches(model, rows, matcher=None):
+    """
+    Store the keyword matches of freshly written posts or comments.
+
+    ``rows`` are ``(id, *texts)`` tuples in the order of the model's scanned
+    fields. Earlier matches of these rows for the currently active keywords
+    are replaced. Returns the ``(row id, keyword id)`` pairs stored.
+    """
+    matcher = matcher or get_matcher()
+    if not len(matcher):
+        return []
+    match_model, column, _ = MATCH_TABLES[model]
+    rows = list(rows)
+    pairs = list(match_rows(matcher, rows))
+    matches = [match_model(**{column: row_id}, keyword_id=keyword_id) for row_id, keyword_id in pairs]
+    with transaction.atomic():
+        match_model.objects.filter(**{f'{column}__in': [row[0] for row in rows]},
+                                   keyword_id__in=list(matcher.phrases)).delete()
+        match_model.objects.bulk_create(matches, ignore_conflicts=True)
+    invalidate_responses(KEYWORD_MATCHES)
+    return pairs
+
+
+def record_model_matches(model_label, rows):
+    """``record_matches`` for a model given by its label, as deferred tasks take JSON arguments"""
+    return record_matches(apps.get_model(model_label), rows)
+
+
+def rescan_keyword(keyword_id, chunk_size=None):
+    """
+    Rebuild the stored matches of one keyword by scanning every post and comment.
+    Does nothing if the keyword is gone or inactive. Returns the number of matches.
+    """
+    keyword = Keyword.objects.filter(pk=keyword_id, active=True).first()
+    if keyword is None:
+        return 0
+    matcher = KeywordMatcher({keyword.id: keyword.phrase})
+    chunk_size = chunk_size or settings.KEYWORD_SCAN_CHUNK_SIZE
+    total = 0
+    for model, (match_model, column, fields) in MATCH_TABLES.items():
+        # The phrase may have changed since the last scan
+        match_model.objects.filter(keyword_id=keyword.id).delete()
+        pairs = match_rows(matcher, model.objects.values_list('id', *fields).iterator(chunk_size=chunk_size))
+        while batch := list(islice(pairs, chunk_size)):
+            match_model.objects.bulk_create(
+                [match_model(**{column: row_id}, keyword_id=keyword_id) for row_id, keyword_id in batch],
+                ignore_conflicts=True,
+            )
+            total += len(batch)
+    invalidate_responses(KEYWORD_MATCHES)
+    return total
+
+
+def prune_keyword_matches(chunk_size=None):
+    """Delete, in chunks, the stored matches of deactivated or deleted keywords. Returns the number deleted."""
+    chunk_size = chunk_size or settings.KEYWORD_SCAN_CHUNK_SIZE
+    active = Keyword.objects.filter(active=True).values('id')
+    total = 0
+    for match_model, _, _ in MATCH_TABLES.values():
+        while True:
+            ids = list(match_model.objects.exclude(keyword_id__in=active)
+                       .values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            total += match_model.objects.filter(id__in=ids).delete()[0]
+    invalidate_responses(KEYWORD_MATCHES)
+    return total
+
+
+def schedule_keyword_sync(keyword_ids, active):
+    """
+    Bring the stored matches in line with keywords that were created, edited,
+    activated (rescan) or deactivated/deleted (prune). The work is deferred
+    until after the commit, off the request path.
+    """
+    if active:
+        for keyword_id in keyword_ids:
+            defer(rescan_keyword, keyword_id)
+    elif keyword_ids:
+        defer(prune_keyword_matches)
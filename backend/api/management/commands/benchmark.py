@@ -0,0 +1,151 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from dataclasses import asdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from api import benchmarks
+
+PHASES = ('generate', 'micro', 'http')
+
+# Default directory of the results files (ignored by git)
+RESULTS_DIR = os.path.join(settings.BASE_DIR, 'benchmark-results')
+
+
+class Command(BaseCommand):
+    help = ('Run the API benchmark suite: generate a synthetic corpus, time serializers and signal handlers, '
+            'load test the main endpoints over HTTP, and save the results as JSON. Works on SQLite and '
+            'PostgreSQL; the generated data is removed afterwards unless --keep is given.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Corpus size relative to the default (1.0: 10,000 posts, 200 users)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skip', choices=PHASES, nargs='+', default=[],
+                            help='Phases to skip (generate reuses a corpus kept by an earlier --keep run)')
+        parser.add_argument('--repeat', type=int, default=200, help='Runs per micro-benchmark')
+        parser.add_argument('--requests', type=int, default=500, help='HTTP requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent HTTP clients')
+        parser.add_argument('--async-views', action='store_true',
+                            help='Load test the async endpoints under /api/async/ instead of the DRF ones')
+        parser.add_argument('--server', choices=['uvicorn', 'runserver'], default='uvicorn',
+                            help='Server started for the load test: the ASGI app under uvicorn, or WSGI runserver')
+        parser.add_argument('--url', help='Load test this running server instead of starting uvicorn; '
+                                          'it must use the same database')
+        parser.add_argument('--port', type=int, default=8766, help='Port of the uvicorn server started')
+        parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+        parser.add_argument('--db-pool', action='store_true',
+                            help='Run the server with a connection pool (DATABASE_POOL=True, PostgreSQL only)')
+        parser.add_argument('--output', help='Results file (default: benchmark-results/benchmark-<timestamp>.json)')
+        parser.add_argument('--compare', help='Earlier results file to compare against')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='Percent change flagged as a regression by --compare')
+        parser.add_argument('--keep', action='store_true', help='Keep the generated corpus for later runs')
+
+    def handle(self, *args, **options):
+        volumes = benchmarks.Volumes.scaled(options['scale'])
+        results = {'environment': benchmarks.environment(), 'volumes': asdict(volumes),
+                   'options': {key: options[key] for key in ('scale', 'seed', 'repeat', 'requests', 'concurrency',
+                                                             'async_views', 'server', 'workers', 'db_pool')}}
+        skip = set(options['skip'])
+        try:
+            if 'generate' not in skip:
+                benchmarks.cleanup()
+                start = time.perf_counter()
+                results['generated'] = benchmarks.generate(volumes, seed=options['seed'])
+                results['generate_s'] = round(time.perf_counter() - start, 2)
+                self.stdout.write(f'generated {results["generated"]} in {results["generate_s"]}s')
+            elif not benchmarks.generated_subreddits().exists():
+                raise CommandError('No generated corpus to reuse; run without --skip generate')
+
+            if 'micro' not in skip:
+                results['micro'] = {**benchmarks.serializer_benchmarks(options['repeat']),
+                                    **benchmarks.fast_list_benchmarks(options['repeat']),
+                                    **benchmarks.signal_benchmarks(options['repeat'])}
+                self.report('micro-benchmarks', results['micro'], ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms',
+                                                                   'ops_per_s', 'queries_per_op'))
+            if 'http' not in skip:
+                results['http'] = self.load_test(options)
+                self.report('HTTP load', results['http'], ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps',
+                                                           'errors', 'db_connections'))
+        finally:
+            if not options['keep']:
+                benchmarks.cleanup()
+
+        output = options['output']
+        if not output:
+            os.makedirs(RESULTS_DIR, exist_ok=True)
+            output = os.path.join(RESULTS_DIR, f'benchmark-{timezone.now():%Y%m%d-%H%M%S}.json')
+        with open(output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+        if options['compare']:
+            try:
+                with open(options['compare']) as handle:
+                    previous = json.load(handle)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read {options["compare"]}: {exc}')
+            if previous.get('volumes') != results['volumes']:
+                self.stdout.write(self.style.WARNING('The runs used different corpus volumes'))
+            self.report_comparison(benchmarks.compare(previous, results), options['threshold'])
+
+    def load_test(self, options):
+        targets = benchmarks.load_targets(seed=options['seed'], async_views=options['async_views'])
+        tokens = list(Token.objects.filter(user__in=benchmarks.generated_users()).values_list('key', flat=True))
+        if options['url']:
+            return benchmarks.load_test(options['url'].rstrip('/'), targets, tokens, options['requests'],
+                                        options['concurrency'])
+
+        env = dict(os.environ, REQUEST_LOG_LEVEL='WARNING', DEFERRED_TASKS_ASYNC='False')
+        if options['db_pool']:
+            env['DATABASE_POOL'] = 'True'
+        if options['server'] == 'runserver':
+            command = [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{options["port"]}']
+        else:
+            command = [sys.executable, '-m', 'uvicorn', 'bountyboard.asgi:application', '--port', str(options['port']),
+                       '--workers', str(options['workers']), '--log-level', 'warning', '--no-access-log']
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env,
+                                  stderr=subprocess.DEVNULL if options['server'] == 'runserver' else None)
+        try:
+            self.wait_for_server(options['port'])
+            return benchmarks.load_test(f'http://127.0.0.1:{options["port"]}', targets, tokens,
+                                        options['requests'], options['concurrency'])
+        finally:
+            server.terminate()
+            server.wait(10)
+
+    @staticmethod
+    def wait_for_server(port, timeout=20):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError('uvicorn did not start')
+
+    def report(self, title, results, columns):
+        self.stdout.write(f'\n{title}')
+        self.stdout.write(f'{"":<32}' + ''.join(f'{column:>16}' for column in columns))
+        for name, metrics in results.items():
+            self.stdout.write(f'{name:<32}' + ''.join(f'{str(metrics.get(column, "")):>16}' for column in columns))
+
+    def report_comparison(self, rows, threshold):
+        self.stdout.write(f'\n{"benchmark":<40}{"metric":>16}{"before":>12}{"after":>12}{"change":>10}')
+        regressions = 0
+        for section, name, metric, before, after, change in rows:
+            flag = ''
+            if benchmarks.is_regression(metric, change, threshold):
+                flag = '  regression'
+                regressions += 1
+            change = '' if change is None else f'{change:+.1f}%'
+            self.stdout.write(f'{section + ": " + name:<40}{metric:>16}{before:>12}{after:>12}{change:>10}{flag}')
+        style = self.style.WARNING if regressions else self.style.SUCCESS
+        self.stdout.write(style(f'{regressions} regression(s) above {threshold}%'))
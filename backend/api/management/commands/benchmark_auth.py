@@ -0,0 +1,58 @@
+import base64
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import BasicAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from api.authentication import CachedTokenAuthentication, token_cache
+from api.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Measure per-request authentication overhead of Basic, Token and cached Token auth. '
+            'The benchmark user is created inside a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests authenticated per backend')
+        parser.add_argument('--basic-requests', type=int, default=20,
+                            help='Requests for Basic auth (a password hash each)')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(username='bench-auth', password='bench-auth-password')
+                token = Token.objects.get_or_create(user=user)[0]
+                basic = base64.b64encode(b'bench-auth:bench-auth-password').decode()
+                token_cache.clear()
+                runs = [
+                    ('basic', BasicAuthentication(), f'Basic {basic}', options['basic_requests']),
+                    ('token', TokenAuthentication(), f'Token {token.key}', options['requests']),
+                    ('cached token', CachedTokenAuthentication(), f'Token {token.key}', options['requests']),
+                ]
+                self.stdout.write(f'{"backend":>14} {"requests":>9} {"us/request":>11} {"queries/request":>16}')
+                for name, backend, header, count in runs:
+                    micros, queries = self.measure(backend, header, count)
+                    self.stdout.write(f'{name:>14} {count:>9} {micros:>11.1f} {queries:>16.3f}')
+                self.stdout.write(f'cache: {token_cache.stats()}')
+                raise Rollback
+        except Rollback:
+            pass
+        token_cache.clear()
+
+    @staticmethod
+    def measure(backend, header, count):
+        factory = APIRequestFactory()
+        requests = [Request(factory.get('/api/me/', HTTP_AUTHORIZATION=header)) for _ in range(count)]
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for request in requests:
+                backend.authenticate(request)
+            elapsed = time.perf_counter() - start
+        return elapsed * 1e6 / count, len(queries) / count
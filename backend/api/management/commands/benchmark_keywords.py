@@ -0,0 +1,59 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from api.keywords import KeywordMatcher, normalize
+
+WORDS = ('the app tool would need someone looking for help with my business website data excel '
+         'script simple monthly fee price cheap team calendar inbox email invoice client work '
+         'anyone know good way build automate spreadsheet report weekly free trial').split()
+PHRASE_STEMS = ("i'd pay", 'i would pay', 'would pay for', 'willing to pay', 'take my money',
+                'shut up and take', 'happy to pay', 'pay good money', 'is there an app', 'wish there was')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the Aho-Corasick keyword matcher against naive per-phrase matching on synthetic comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--comments', type=int, default=1_000_000, help='Synthetic comments to scan')
+        parser.add_argument('--keywords', type=int, default=100, help='Number of keyword phrases')
+        parser.add_argument('--words', type=int, default=20, help='Average words per comment')
+        parser.add_argument('--naive-sample', type=int, default=100_000,
+                            help='Comments scanned with the naive matcher (its time is extrapolated)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        phrases = {i: f'{PHRASE_STEMS[i % len(PHRASE_STEMS)]} {WORDS[i % len(WORDS)]}' if i >= len(PHRASE_STEMS)
+                   else PHRASE_STEMS[i] for i in range(options['keywords'])}
+
+        self.stdout.write(f'Generating {options["comments"]:,} comments...')
+        comments = []
+        for _ in range(options['comments']):
+            words = rng.choices(WORDS, k=max(1, int(rng.gauss(options['words'], options['words'] / 3))))
+            if rng.random() < 0.05:
+                words.insert(rng.randrange(len(words) + 1), rng.choice(list(phrases.values())).upper())
+            comments.append(' '.join(words))
+        characters = sum(len(comment) for comment in comments)
+
+        start = time.perf_counter()
+        matcher = KeywordMatcher(phrases)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        hits = sum(len(matcher.matched_ids(comment)) for comment in comments)
+        automaton = time.perf_counter() - start
+
+        sample = comments[:options['naive_sample']]
+        patterns = [normalize(phrase) for phrase in phrases.values()]
+        start = time.perf_counter()
+        for comment in sample:
+            text = normalize(comment)
+            [pattern for pattern in patterns if pattern in text]
+        naive = (time.perf_counter() - start) * len(comments) / max(len(sample), 1)
+
+        self.stdout.write(f'{len(phrases)} keywords, {len(comments):,} comments, {characters / 1e6:.1f}M characters')
+        self.stdout.write(f'automaton build:   {build * 1000:.1f} ms ({len(matcher.transitions)} states)')
+        self.stdout.write(f'automaton scan:    {automaton:.2f} s ({len(comments) / automaton:,.0f} comments/s, '
+                          f'{hits:,} matches)')
+        self.stdout.write(f'naive substring:   {naive:.2f} s (extrapolated from {len(sample):,} comments, '
+                          f'no word boundaries or offsets)')
@@ -0,0 +1,55 @@
+import time
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.models import Post, Subreddit, User
+from api.notifications import NEW_POST_NOTIFICATION, fan_out_notification
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Measure post insert latency and notification fan-out time for growing numbers '
+            'of premium users. Everything runs inside a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000, 100000],
+                            help='Premium user counts to benchmark')
+        parser.add_argument('--posts', type=int, default=20,
+                            help='Posts inserted per size to measure insert latency')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"premium users":>14} {"post insert (ms)":>17} {"fan-out (s)":>12} {"rows/s":>10}')
+        for size in options['sizes']:
+            insert_ms, fan_out_s = self.run_size(size, options['posts'])
+            rate = size / fan_out_s if fan_out_s else 0
+            self.stdout.write(f'{size:>14} {insert_ms:>17.3f} {fan_out_s:>12.3f} {rate:>10.0f}')
+
+    def run_size(self, size, posts):
+        try:
+            with transaction.atomic():
+                password = make_password(None)
+                User.objects.bulk_create(
+                    [User(username=f'bench-premium-{i}', password=password, membership_status='Premium')
+                     for i in range(size)],
+                    batch_size=5000,
+                )
+                subreddit = Subreddit.objects.create(name='bench-notifications')
+
+                # Inside the transaction the fan-out is only queued, which is exactly
+                # the work left on the request path
+                start = time.perf_counter()
+                for i in range(posts):
+                    Post.objects.create(reddit_id=f'bench-{size}-{i}', title=f'Benchmark post {i}',
+                                        subreddit=subreddit)
+                insert_ms = (time.perf_counter() - start) * 1000 / posts
+
+                start = time.perf_counter()
+                fan_out_notification(NEW_POST_NOTIFICATION, 'Benchmark notification')
+                fan_out_s = time.perf_counter() - start
+                raise Rollback
+        except Rollback:
+            pass
+        return insert_ms, fan_out_s
@@ -0,0 +1,114 @@
+import datetime
+import time
+from unittest import mock
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from api import analytics
+from api.models import Subreddit, Keyword, SubredditDailyStats, KeywordDailyStats
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Compare live GROUP BY dashboard queries with the daily rollups on a synthetic corpus '
+            '(PostgreSQL only). The data is created inside a transaction that is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000, help='Posts plus comments generated')
+        parser.add_argument('--subreddits', type=int, default=50)
+        parser.add_argument('--days', type=int, default=365, help='Days the submission dates are spread over')
+        parser.add_argument('--window', type=int, default=30, help='Days covered by the dashboard queries')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('The benchmark generates its data with PostgreSQL SQL')
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def timed(self, label, function):
+        start = time.perf_counter()
+        result = function()
+        self.stdout.write(f'{label:<48} {time.perf_counter() - start:>9.3f}s')
+        return result
+
+    def run(self, options):
+        posts = options['rows'] // 2
+        comments = options['rows'] - posts
+        now = timezone.now()
+        start = now - datetime.timedelta(days=options['days'])
+        # Generated rows predate the refreshes, outside the watermark overlap
+        generated_at = now - datetime.timedelta(hours=1)
+        subreddits = Subreddit.objects.bulk_create(
+            [Subreddit(name=f'bench_stats_{i}') for i in range(options['subreddits'])])
+        keywords = Keyword.objects.bulk_create([Keyword(phrase=f'bench stats {i}') for i in range(10)])
+        first_subreddit, first_keyword = subreddits[0].pk, keywords[0].pk
+
+        with connection.cursor() as cursor:
+            self.timed(f'generate {posts:,} posts', lambda: cursor.execute(
+                "INSERT INTO post (reddit_id, title, body, upvotes, comments_count, author, submission_date, "
+                "subreddit_id, subreddit_name, manually_added, created_at, updated_at) "
+                "SELECT 'bs' || g, 'Post ' || g, '', (random() ^ 4 * 5000)::int, 0, 'bench', "
+                "%s + (g %% %s) * interval '1 day' + random() * interval '1 day', %s + g %% %s, '', false, %s, %s "
+                "FROM generate_series(1, %s) g",
+                [start, options['days'], first_subreddit, options['subreddits'], generated_at, generated_at, posts]))
+            cursor.execute("SELECT min(id) FROM post WHERE reddit_id = 'bs1'")
+            first_post = cursor.fetchone()[0]
+            self.timed(f'generate {comments:,} comments', lambda: cursor.execute(
+                "INSERT INTO comment (reddit_id, post_id, body, upvotes, author, submission_date, created_at, "
+                "updated_at) SELECT 'bc' || g, %s + g %% %s, 'Comment', 1, 'bench', "
+                "%s + (g %% %s) * interval '1 day', %s, %s FROM generate_series(1, %s) g",
+                [first_post, posts, start, options['days'], generated_at, generated_at, comments]))
+            self.timed('generate keyword matches (2% of posts)', lambda: cursor.execute(
+                "INSERT INTO post_keyword_match (post_id, keyword_id, created_at) "
+                "SELECT %s + g, %s + g %% 10, %s FROM generate_series(0, %s - 1, 50) g",
+                [first_post, first_keyword, generated_at, posts]))
+            cursor.execute('ANALYZE post; ANALYZE comment; ANALYZE post_keyword_match')
+
+            window_start = now - datetime.timedelta(days=options['window'])
+            self.timed(f'live GROUP BY: posts/subreddit/day, {options["window"]} days', lambda: cursor.execute(
+                "SELECT subreddit_id, date_trunc('day', submission_date), count(*), sum(upvotes), max(upvotes) "
+                "FROM post WHERE submission_date >= %s GROUP BY 1, 2", [window_start]) or cursor.fetchall())
+            self.timed(f'live upvote percentiles, {options["window"]} days', lambda: cursor.execute(
+                "SELECT percentile_disc(ARRAY[0.5, 0.9, 0.99]) WITHIN GROUP (ORDER BY upvotes) "
+                "FROM post WHERE submission_date >= %s", [window_start]) or cursor.fetchall())
+            self.timed(f'live keyword hits, {options["window"]} days', lambda: cursor.execute(
+                "SELECT m.keyword_id, count(*) FROM post_keyword_match m JOIN post p ON p.id = m.post_id "
+                "WHERE p.submission_date >= %s GROUP BY 1", [window_start]) or cursor.fetchall())
+
+        # Rollups from earlier refreshes would otherwise be kept for days the benchmark does not cover
+        SubredditDailyStats.objects.all().delete()
+        KeywordDailyStats.objects.all().delete()
+        result = self.timed('full rollup refresh', lambda: analytics.refresh_rollups(full=True))
+        self.stdout.write(f'  {result.as_dict()}')
+
+        # A crawl typically re-fetches recent posts with new upvote counts
+        touched = posts // 1000
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE post SET upvotes = upvotes + 1, updated_at = %s WHERE id IN ("
+                           "SELECT id FROM post WHERE id >= %s AND submission_date >= %s LIMIT %s)",
+                           [timezone.now() + datetime.timedelta(hours=1), first_post,
+                            now - datetime.timedelta(days=2), touched])
+        result = self.timed(f'incremental refresh after {touched:,} recent post updates',
+                            lambda: analytics.refresh_rollups())
+        self.stdout.write(f'  {result.as_dict()}')
+
+        window = SubredditDailyStats.objects.filter(day__gte=window_start.date())
+        for label, patch in [('numpy', None), ('pure Python', mock.patch.object(analytics, 'np', None))]:
+            if label == 'numpy' and analytics.np is None:
+                continue
+            with patch or mock.patch.object(analytics, 'np', analytics.np):
+                self.timed(f'rollup: subreddit series ({label})', lambda: analytics.subreddit_series(
+                    window.values('subreddit__name', 'day', 'posts', 'comments', 'upvotes_total', 'upvotes_max')))
+                self.timed(f'rollup: upvote percentiles ({label})', lambda: analytics.histogram_percentiles(
+                    analytics.sum_histograms(window.values_list('upvote_histogram', flat=True))))
+        self.timed('rollup: keyword hits', lambda: list(
+            KeywordDailyStats.objects.filter(day__gte=window_start.date()).values('keyword_id')
+            .annotate(posts=Sum('posts'))))
@@ -0,0 +1,31 @@
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from api.crawler import RedditCrawler
+
+
+class Command(BaseCommand):
+    help = 'Crawl new posts (and their comments) for every subreddit, or only the given ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('subreddits', nargs='*', help='Subreddit names to crawl (default: all)')
+        parser.add_argument('--no-comments', action='store_true', help='Only crawl posts')
+        parser.add_argument('--base-url', help='Reddit base URL, e.g. a local fake server')
+        parser.add_argument('--max-connections', type=int, help='Concurrent requests in flight')
+        parser.add_argument('--requests-per-minute', type=int, help='Rate limit for all requests')
+
+    def handle(self, *args, **options):
+        crawler = RedditCrawler(
+            base_url=options['base_url'],
+            max_connections=options['max_connections'],
+            requests_per_minute=options['requests_per_minute'],
+            crawl_comments=not options['no_comments'],
+        )
+        crawls = async_to_sync(crawler.crawl)(options['subreddits'])
+
+        for crawl in crawls:
+            line = (f'r/{crawl.subreddit.name}: {crawl.status}, {crawl.posts_found} posts, '
+                    f'{crawl.comments_found} comments')
+            if crawl.error_message:
+                self.stdout.write(self.style.ERROR(f'{line} ({crawl.error_message})'))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.entitlements import expire_memberships
+
+
+class Command(BaseCommand):
+    help = 'Downgrade premium users whose subscriptions have expired (run periodically, e.g. from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Users downgraded per UPDATE')
+
+    def handle(self, *args, **options):
+        downgraded = expire_memberships(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Downgraded {downgraded} expired memberships'))
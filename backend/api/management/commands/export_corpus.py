@@ -0,0 +1,45 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+from api.export import EXPORTS, ExportError, export_stream
+
+
+class Command(BaseCommand):
+    help = ('Stream crawled posts or comments to a file (or stdout) as NDJSON or CSV. Rows are written in id order, '
+            'so an interrupted export can be resumed with --after-id.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(EXPORTS))
+        parser.add_argument('--output', choices=['ndjson', 'csv'], default='ndjson')
+        parser.add_argument('--file', help='Destination file (stdout if omitted)')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--subreddit', help='Subreddit name')
+        parser.add_argument('--since', help='Only rows submitted at or after this ISO date/time')
+        parser.add_argument('--until', help='Only rows submitted before this ISO date/time')
+        parser.add_argument('--keyword', type=int, help='Only rows matching this keyword id')
+        parser.add_argument('--after-id', type=int, help='Resume after this id')
+        parser.add_argument('--chunk-size', type=int, help='Rows fetched and written per chunk')
+
+    def handle(self, *args, **options):
+        params = QueryDict(mutable=True)
+        for option, param in [('subreddit', 'subreddit_name'), ('since', 'since'), ('until', 'until'),
+                              ('keyword', 'keyword')]:
+            if options[option] is not None:
+                params[param] = str(options[option])
+        try:
+            _, chunks = export_stream(options['dataset'], params, output=options['output'],
+                                      after_id=options['after_id'], compress=options['gzip'],
+                                      chunk_size=options['chunk_size'])
+            if options['file']:
+                with open(options['file'], 'wb') as handle:
+                    self.write(chunks, handle)
+            else:
+                self.write(chunks, sys.stdout.buffer)
+        except (ExportError, OSError) as exc:
+            raise CommandError(str(exc))
+
+    @staticmethod
+    def write(chunks, handle):
+        for chunk in chunks:
+            handle.write(chunk)
+        handle.flush()
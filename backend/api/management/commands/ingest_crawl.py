@@ -0,0 +1,32 @@
+import json
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from api.ingestion import ingest_crawl
+
+
+class Command(BaseCommand):
+    help = ('Upsert crawled posts and comments from a JSON file with "posts", "comments" and '
+            'an optional default "subreddit" (Reddit API field names are accepted).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='JSON file to ingest, or - to read from stdin')
+        parser.add_argument('--subreddit', help='Default subreddit for posts that do not name one')
+        parser.add_argument('--batch-size', type=int, help='Rows per bulk upsert')
+
+    def handle(self, *args, **options):
+        try:
+            if options['path'] == '-':
+                data = json.load(sys.stdin)
+            else:
+                with open(options['path'], encoding='utf-8') as handle:
+                    data = json.load(handle)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Could not read crawl data: {exc}')
+
+        result = ingest_crawl(
+            posts=data.get('posts', []),
+            comments=data.get('comments', []),
+            subreddit=options['subreddit'] or data.get('subreddit'),
+            batch_size=options['batch_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(json.dumps(result.as_dict())))
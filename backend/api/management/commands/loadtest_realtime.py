@@ -0,0 +1,147 @@
+import json
+import os
+import resource
+import selectors
+import socket
+import subprocess
+import sys
+import time
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.models import User, Subreddit, Post
+
+
+def rss_kb(pid):
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+class Command(BaseCommand):
+    help = ('Start the ASGI app under uvicorn, hold many idle /api/stream/ connections open and '
+            'measure server memory and new-post delivery latency. The data it creates is deleted afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000, help='Idle stream connections to open')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--posts', type=int, default=5, help='Posts created to measure delivery latency')
+
+    def handle(self, *args, **options):
+        count = options['connections']
+        port = options['port']
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = min(hard, count * 2 + 256)
+        if soft < wanted:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+        if wanted < count + 64:
+            raise CommandError(f'Open file limit {hard} is too low for {count} connections')
+
+        env = dict(os.environ, REALTIME_MAX_CONNECTIONS=str(count + 10), DEFERRED_TASKS_ASYNC='False')
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'bountyboard.asgi:application', '--port', str(port),
+             '--log-level', 'warning', '--backlog', str(count + 64)],
+            cwd=settings.BASE_DIR, env=env,
+        )
+        user = subreddit = None
+        sockets = []
+        try:
+            self.wait_for_server(port)
+            baseline = rss_kb(server.pid)
+
+            user = User.objects.create_user(username='loadtest-realtime', password='loadtest-realtime')
+            subreddit = Subreddit.objects.create(name='loadtest_realtime')
+            headers = {'Authorization': f'Token {user.auth_token.key}'}
+
+            start = time.perf_counter()
+            for _ in range(count):
+                sockets.append(self.open_stream(port))
+            opened = time.perf_counter() - start
+            # Let the server settle before sampling memory
+            time.sleep(1)
+            loaded = rss_kb(server.pid)
+            self.stdout.write(f'{count} connections opened in {opened:.2f}s')
+            self.stdout.write(f'server RSS: {baseline / 1024:.1f} MiB idle, {loaded / 1024:.1f} MiB loaded, '
+                              f'{(loaded - baseline) / max(count, 1):.1f} KiB per connection')
+
+            latencies = []
+            for i in range(options['posts']):
+                sent = time.perf_counter()
+                response = requests.post(f'http://127.0.0.1:{port}/api/posts/', headers=headers, json={
+                    'reddit_id': f'loadtest-{i}', 'title': f'Load test post {i}', 'body': '',
+                    'subreddit': subreddit.pk, 'author': 'loadtest', 'submission_date': '2026-01-01T00:00:00Z',
+                }, timeout=30)
+                if response.status_code != 201:
+                    raise CommandError(f'Creating a post failed: {response.status_code} {response.text[:200]}')
+                latencies.append(self.wait_for_event(sockets, f'loadtest-{i}', sent))
+            for i, (first, last, received) in enumerate(latencies):
+                self.stdout.write(f'post {i}: delivered to {received}/{count} clients, '
+                                  f'first after {first * 1000:.1f} ms, last after {last * 1000:.1f} ms')
+        finally:
+            for sock in sockets:
+                sock.close()
+            server.terminate()
+            server.wait(10)
+            if subreddit is not None:
+                Post.objects.filter(subreddit=subreddit).delete()
+                subreddit.delete()
+            if user is not None:
+                user.delete()
+
+    @staticmethod
+    def wait_for_server(port, timeout=20):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError('uvicorn did not start')
+
+    @staticmethod
+    def open_stream(port):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(f'GET /api/stream/ HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n'
+                     'Accept: text/event-stream\r\n\r\n'.encode())
+        head = b''
+        while b'retry:' not in head:
+            chunk = sock.recv(4096)
+            if not chunk:
+                raise CommandError('Stream closed while connecting')
+            head += chunk
+        if not head.startswith(b'HTTP/1.1 200'):
+            raise CommandError(f'Stream refused: {head.splitlines()[0].decode()}')
+        sock.setblocking(False)
+        return sock
+
+    @staticmethod
+    def wait_for_event(sockets, reddit_id, sent, timeout=30):
+        """Read every socket until it has seen the post; returns (first, last, received) latencies"""
+        needle = json.dumps(reddit_id).encode()
+        selector = selectors.DefaultSelector()
+        buffers = {}
+        for sock in sockets:
+            selector.register(sock, selectors.EVENT_READ)
+            buffers[sock] = b''
+        first = last = None
+        received = 0
+        deadline = time.monotonic() + timeout
+        while buffers and time.monotonic() < deadline:
+            for key, _ in selector.select(timeout=1):
+                sock = key.fileobj
+                try:
+                    buffers[sock] += sock.recv(65536)
+                except BlockingIOError:
+                    continue
+                if needle in buffers[sock]:
+                    elapsed = time.perf_counter() - sent
+                    first = elapsed if first is None else first
+                    last = elapsed
+                    received += 1
+                    selector.unregister(sock)
+                    del buffers[sock]
+        selector.close()
+        return first or 0, last or 0, received
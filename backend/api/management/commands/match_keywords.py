@@ -0,0 +1,39 @@
+from collections import Counter
+from itertools import islice
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.keywords import MATCH_TABLES, get_matcher, match_rows, record_matches
+from api.models import Post, Comment
+
+
+class Command(BaseCommand):
+    help = 'Match the active keywords against existing posts and comments and report the hits'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=settings.KEYWORD_SCAN_CHUNK_SIZE,
+                            help='Rows fetched per database round trip (default: KEYWORD_SCAN_CHUNK_SIZE)')
+        parser.add_argument('--skip-posts', action='store_true', help='Do not scan posts')
+        parser.add_argument('--skip-comments', action='store_true', help='Do not scan comments')
+        parser.add_argument('--store', action='store_true',
+                            help='Also (re)build the stored keyword matches used by the ?keyword= filter')
+
+    def handle(self, *args, **options):
+        matcher = get_matcher()
+        if not len(matcher):
+            self.stdout.write('There are no active keywords.')
+            return
+
+        chunk_size = options['chunk_size']
+        models = [model for model, skip in ((Post, options['skip_posts']), (Comment, options['skip_comments']))
+                  if not skip]
+        counts = Counter()
+        for model in models:
+            _, _, fields = MATCH_TABLES[model]
+            rows = model.objects.values_list('id', *fields).iterator(chunk_size=chunk_size)
+            while chunk := list(islice(rows, chunk_size)):
+                pairs = record_matches(model, chunk, matcher) if options['store'] else match_rows(matcher, chunk)
+                counts.update((model, keyword_id) for _, keyword_id in pairs)
+
+        for keyword_id, phrase in sorted(matcher.phrases.items(), key=lambda item: item[1]):
+            self.stdout.write(f'{phrase!r}: {counts[Post, keyword_id]} posts, '
+                              f'{counts[Comment, keyword_id]} comments')
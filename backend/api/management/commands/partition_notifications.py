@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from api.retention import ensure_partitions, is_partitioned, list_partitions, partition_table
+
+
+class Command(BaseCommand):
+    help = ('Range-partition the notification table by month (PostgreSQL only) so that retention can drop '
+            'whole partitions, and create upcoming partitions ahead of time; run it monthly once converted')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true',
+                            help='Convert the unpartitioned table; this locks notifications while the rows are '
+                                 'copied, so run it in a maintenance window')
+        parser.add_argument('--months-ahead', type=int, default=3, help='Future monthly partitions to keep ready')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Partitioning requires PostgreSQL')
+        if is_partitioned():
+            created = ensure_partitions(options['months_ahead'])
+        elif options['convert']:
+            created = partition_table(options['months_ahead'])
+        else:
+            raise CommandError('The notification table is not partitioned; pass --convert to convert it')
+        for partition in created:
+            self.stdout.write(f'Created {partition.name} [{partition.start:%Y-%m-%d}, {partition.end:%Y-%m-%d})')
+        self.stdout.write(self.style.SUCCESS(f'{len(list_partitions())} monthly partitions'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.keywords import prune_keyword_matches
+
+
+class Command(BaseCommand):
+    help = 'Delete stored keyword matches of deactivated or deleted keywords'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None, help='Rows deleted per statement')
+
+    def handle(self, *args, **options):
+        deleted = prune_keyword_matches(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} stale keyword matches'))
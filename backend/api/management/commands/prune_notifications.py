@@ -0,0 +1,20 @@
+import json
+from django.core.management.base import BaseCommand
+from api.retention import prune_notifications
+
+
+class Command(BaseCommand):
+    help = ('Delete notifications past their retention period (NOTIFICATION_RETENTION_DAYS, '
+            'NOTIFICATION_RETENTION_DAYS_BY_TYPE) in short batches; run periodically, e.g. from cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Notifications deleted per transaction')
+        parser.add_argument('--archive-dir', default=None,
+                            help='Archive pruned notifications here as gzipped NDJSON '
+                                 '(defaults to NOTIFICATION_ARCHIVE_DIR)')
+        parser.add_argument('--dry-run', action='store_true', help='Count what would be pruned without deleting')
+
+    def handle(self, *args, **options):
+        result = prune_notifications(batch_size=options['batch_size'], archive_dir=options['archive_dir'],
+                                     dry_run=options['dry_run'])
+        self.stdout.write(self.style.SUCCESS(json.dumps(result.as_dict())))
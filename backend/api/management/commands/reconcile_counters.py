@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from api.counters import reconcile_post_counts, reconcile_subreddit_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalised post and subreddit counters and fix any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows checked per query')
+
+    def handle(self, *args, **options):
+        posts = reconcile_post_counts(batch_size=options['batch_size'])
+        subreddits = reconcile_subreddit_counters(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Fixed {posts} post and {subreddits} subreddit counters'))
@@ -0,0 +1,16 @@
+import json
+from django.core.management.base import BaseCommand
+from api.analytics import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = ('Bring the daily analytics rollups up to date with the posts, comments and keyword matches changed '
+            'since the last refresh (run periodically, e.g. from cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild every day, e.g. after bulk deletes')
+        parser.add_argument('--days-per-batch', type=int, default=None, help='Days recomputed per transaction')
+
+    def handle(self, *args, **options):
+        result = refresh_rollups(full=options['full'], days_per_batch=options['days_per_batch'])
+        self.stdout.write(self.style.SUCCESS(json.dumps(result.as_dict())))
@@ -0,0 +1,42 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+SEARCH_CONFIG = 'english'
+
+
+def search_indexes(apps):
+    # These expressions must stay in sync with api.search so the planner can use the indexes
+    post_vector = (SearchVector('title', weight='A', config=SEARCH_CONFIG)
+                   + SearchVector('body', weight='B', config=SEARCH_CONFIG))
+    comment_vector = SearchVector('body', config=SEARCH_CONFIG)
+    return [
+        (apps.get_model('api', 'Post'), GinIndex(post_vector, name='post_search_idx')),
+        (apps.get_model('api', 'Comment'), GinIndex(comment_vector, name='comment_search_idx')),
+    ]
+
+
+def create_search_indexes(apps, schema_editor):
+    # GIN expression indexes only exist on PostgreSQL; other databases fall back to ILIKE search
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model, index in search_indexes(apps):
+        schema_editor.add_index(model, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for model, index in search_indexes(apps):
+        schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
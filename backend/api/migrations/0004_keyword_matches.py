@@ -0,0 +1,40 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_full_text_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostKeywordMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keyword_matches', to='api.post')),
+                ('keyword', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='post_matches', to='api.keyword')),
+            ],
+            options={
+                'db_table': 'post_keyword_match',
+                'indexes': [models.Index(fields=['keyword', 'post'], name='post_keyword_match_kw_idx')],
+                'constraints': [models.UniqueConstraint(fields=('post', 'keyword'), name='post_keyword_match_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='CommentKeywordMatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('comment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='keyword_matches', to='api.comment')),
+                ('keyword', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='comment_matches', to='api.keyword')),
+            ],
+            options={
+                'db_table': 'comment_keyword_match',
+                'indexes': [models.Index(fields=['keyword', 'comment'], name='comment_keyword_match_kw_idx')],
+                'constraints': [models.UniqueConstraint(fields=('comment', 'keyword'), name='comment_keyword_match_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import migrations, models
+
+
+def reconcile(apps, schema_editor):
+    # Run the same reconciliation as `manage.py reconcile_counters`, on historical models
+    from django.db.models import Count, Max, OuterRef, Subquery, IntegerField
+    from django.db.models.functions import Coalesce
+
+    Subreddit = apps.get_model('api', 'Subreddit')
+    Post = apps.get_model('api', 'Post')
+    Comment = apps.get_model('api', 'Comment')
+    Post.objects.update(comments_count=Coalesce(Subquery(
+        Comment.objects.filter(post=OuterRef('pk')).order_by().values('post')
+        .annotate(count=Count('id')).values('count'),
+        output_field=IntegerField(),
+    ), 0))
+    Subreddit.objects.update(
+        posts_count=Coalesce(Subquery(
+            Post.objects.filter(subreddit=OuterRef('pk')).order_by().values('subreddit')
+            .annotate(count=Count('id')).values('count'),
+            output_field=IntegerField(),
+        ), 0),
+        last_post_at=Subquery(
+            Post.objects.filter(subreddit=OuterRef('pk')).order_by().values('subreddit')
+            .annotate(last=Max('submission_date')).values('last'),
+        ),
+        max_upvotes=Coalesce(Subquery(
+            Post.objects.filter(subreddit=OuterRef('pk')).order_by().values('subreddit')
+            .annotate(top=Max('upvotes')).values('top'),
+            output_field=IntegerField(),
+        ), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_keyword_matches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subreddit',
+            name='posts_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='subreddit',
+            name='last_post_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='subreddit',
+            name='max_upvotes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(reconcile, migrations.RunPython.noop),
+    ]
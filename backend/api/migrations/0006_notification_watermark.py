@@ -0,0 +1,39 @@
+from django.db import migrations, models
+
+
+def count_unread(apps, schema_editor):
+    from django.db.models import Count, IntegerField, OuterRef, Subquery
+    from django.db.models.functions import Coalesce
+
+    User = apps.get_model('api', 'User')
+    Notification = apps.get_model('api', 'Notification')
+    User.objects.update(unread_notifications=Coalesce(Subquery(
+        Notification.objects.filter(user=OuterRef('pk'), read_status=False).order_by().values('user')
+        .annotate(count=Count('id')).values('count'),
+        output_field=IntegerField(),
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='notifications_read_up_to',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='unread_notifications',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'read_status', 'created_at'], name='notification_user_unread_idx'),
+        ),
+        migrations.RunPython(count_unread, migrations.RunPython.noop),
+    ]
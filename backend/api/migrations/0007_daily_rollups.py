@@ -0,0 +1,77 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_notification_watermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubredditDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('posts', models.IntegerField(default=0)),
+                ('comments', models.IntegerField(default=0)),
+                ('upvotes_total', models.BigIntegerField(default=0)),
+                ('upvotes_max', models.IntegerField(default=0)),
+                ('upvote_histogram', models.JSONField(default=list)),
+                ('subreddit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='api.subreddit')),
+            ],
+            options={
+                'db_table': 'subreddit_daily_stats',
+                'indexes': [models.Index(fields=['day'], name='subreddit_daily_stats_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('subreddit', 'day'), name='subreddit_daily_stats_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='KeywordDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('posts', models.IntegerField(default=0)),
+                ('comments', models.IntegerField(default=0)),
+                ('keyword', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='api.keyword')),
+            ],
+            options={
+                'db_table': 'keyword_daily_stats',
+                'indexes': [models.Index(fields=['day'], name='keyword_daily_stats_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('keyword', 'day'), name='keyword_daily_stats_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AnalyticsWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('value', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'analytics_watermark',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['updated_at'], name='post_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['updated_at'], name='comment_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['submission_date'], name='comment_submission_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postkeywordmatch',
+            index=models.Index(fields=['created_at'], name='post_keyword_match_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='commentkeywordmatch',
+            index=models.Index(fields=['created_at'], name='comment_kw_match_created_idx'),
+        ),
+    ]
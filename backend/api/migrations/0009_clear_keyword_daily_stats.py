@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def clear_keyword_rollups(apps, schema_editor):
+    # The keyword rollups gain a subreddit dimension (0010): drop them and the
+    # refresh watermark, so the next `refresh_stats` rebuilds every day
+    apps.get_model('api', 'KeywordDailyStats').objects.all().delete()
+    apps.get_model('api', 'AnalyticsWatermark').objects.filter(name='daily-rollups').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_author_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_keyword_rollups, migrations.RunPython.noop),
+    ]
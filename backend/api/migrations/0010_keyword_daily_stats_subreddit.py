@@ -0,0 +1,29 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_clear_keyword_daily_stats'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='keyworddailystats',
+            name='keyword_daily_stats_unique',
+        ),
+        migrations.AddField(
+            model_name='keyworddailystats',
+            name='subreddit',
+            # The table was emptied by 0009
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE,
+                                    related_name='keyword_daily_stats', to='api.subreddit'),
+            preserve_default=False,
+        ),
+        migrations.AddConstraint(
+            model_name='keyworddailystats',
+            constraint=models.UniqueConstraint(fields=('keyword', 'subreddit', 'day'),
+                                               name='keyword_daily_stats_unique'),
+        ),
+    ]
@@ -3,12 +3,50 @@ from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 
 
+class TrackedFieldsMixin:
+    """
+    Remembers the values of ``tracked_fields`` (attribute names) as last loaded
+    from or saved to the database, so signal handlers can tell what a save
+    changed without querying for the stored row
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {name: value for name, value in zip(field_names, values)
+                                   if name in cls.tracked_fields and value is not models.DEFERRED}
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        loaded = getattr(self, '_loaded_values', {})
+        for name in self.tracked_fields:
+            if update_fields is None or name in update_fields or name.removesuffix('_id') in update_fields:
+                loaded[name] = getattr(self, name)
+        self._loaded_values = loaded
+
+    def changed_fields(self, update_fields=None):
+        """
+        The tracked fields a save changed (or may have: those never loaded),
+        with their previous values (None when unknown)
+        """
+        loaded = getattr(self, '_loaded_values', {})
+        return {name: loaded.get(name) for name in self.tracked_fields
+                if (update_fields is None or name in update_fields or name.removesuffix('_id') in update_fields)
+                and (name not in loaded or loaded[name] != getattr(self, name))}
+
+
 class User(AbstractUser):
     """
     Extended user model that replaces Django's default User
     """
     oauth_provider = models.CharField(max_length=50, blank=True, null=True)
     membership_status = models.CharField(max_length=50, default='Free')
+    # Notifications with an id up to this watermark count as read (see api.notifications)
+    notifications_read_up_to = models.BigIntegerField(default=0)
+    unread_notifications = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -22,6 +60,10 @@ class Subreddit(models.Model):
     """
     name = models.CharField(max_length=255, unique=True)
     description = models.TextField(blank=True, null=True)
+    # Denormalised post aggregates, kept up to date by api.counters
+    posts_count = models.IntegerField(default=0)
+    last_post_at = models.DateTimeField(blank=True, null=True)
+    max_upvotes = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -32,14 +74,18 @@ class Subreddit(models.Model):
         db_table = 'subreddit'
 
 
-class Post(models.Model):
+class Post(TrackedFieldsMixin, models.Model):
     """
     Represents a Reddit post/submission
     """
+    # The subreddit counters follow changes to these (see api.signals)
+    tracked_fields = ('subreddit_id', 'upvotes', 'submission_date')
+
     reddit_id = models.CharField(max_length=50, unique=True)
     title = models.CharField(max_length=255)
     body = models.TextField(blank=True, null=True)
     upvotes = models.IntegerField(default=0)
+    # Number of stored comments, kept up to date by api.counters
     comments_count = models.IntegerField(default=0)
     author = models.CharField(max_length=255, blank=True, null=True)
     submission_date = models.DateTimeField(blank=True, null=True)
@@ -55,6 +101,16 @@ class Post(models.Model):
 
     class Meta:
         db_table = 'post'
+        indexes = [
+            # Keyset pagination over the orderable fields, with id as tie-breaker
+            models.Index(fields=['submission_date', 'id'], name='post_submission_date_id_idx'),
+            models.Index(fields=['upvotes', 'id'], name='post_upvotes_id_idx'),
+            models.Index(fields=['comments_count', 'id'], name='post_comments_count_id_idx'),
+            # Rows changed since the analytics watermark (see api.analytics)
+            models.Index(fields=['updated_at'], name='post_updated_at_idx'),
+            # Exact author lookups from the admin search
+            models.Index(fields=['author'], name='post_author_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -77,6 +133,12 @@ class Comment(models.Model):
 
     class Meta:
         db_table = 'comment'
+        indexes = [
+            models.Index(fields=['post', 'id'], name='comment_post_id_idx'),
+            models.Index(fields=['updated_at'], name='comment_updated_at_idx'),
+            models.Index(fields=['submission_date'], name='comment_submission_date_idx'),
+            models.Index(fields=['author'], name='comment_author_idx'),
+        ]
 
 
 class Notification(models.Model):
@@ -95,6 +157,10 @@ class Notification(models.Model):
 
     class Meta:
         db_table = 'notification'
+        indexes = [
+            models.Index(fields=['user', 'created_at', 'id'], name='notification_user_created_idx'),
+            models.Index(fields=['user', 'read_status', 'created_at'], name='notification_user_unread_idx'),
+        ]
 
 
 class Subscription(models.Model):
@@ -115,10 +181,13 @@ class Subscription(models.Model):
         db_table = 'subscription'
 
 
-class Keyword(models.Model):
+class Keyword(TrackedFieldsMixin, models.Model):
     """
     Keywords to search for in Reddit posts/comments
     """
+    # Stored matches are resynced when these change (see api.signals)
+    tracked_fields = ('phrase', 'active')
+
     phrase = models.CharField(max_length=255, unique=True)
     description = models.TextField(blank=True, null=True)
     active = models.BooleanField(default=True)
@@ -132,6 +201,47 @@ class Keyword(models.Model):
         db_table = 'keyword'
 
 
+class PostKeywordMatch(models.Model):
+    """
+    A keyword phrase found in a post. Rows of deactivated or deleted keywords
+    are left behind and pruned lazily, so queries must join on active keywords
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='keyword_matches')
+    keyword = models.ForeignKey(Keyword, on_delete=models.DO_NOTHING, db_constraint=False,
+                                related_name='post_matches')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'post_keyword_match'
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'keyword'], name='post_keyword_match_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['keyword', 'post'], name='post_keyword_match_kw_idx'),
+            models.Index(fields=['created_at'], name='post_keyword_match_created_idx'),
+        ]
+
+
+class CommentKeywordMatch(models.Model):
+    """
+    A keyword phrase found in a comment (see PostKeywordMatch)
+    """
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='keyword_matches')
+    keyword = models.ForeignKey(Keyword, on_delete=models.DO_NOTHING, db_constraint=False,
+                                related_name='comment_matches')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'comment_keyword_match'
+        constraints = [
+            models.UniqueConstraint(fields=['comment', 'keyword'], name='comment_keyword_match_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['keyword', 'comment'], name='comment_keyword_match_kw_idx'),
+            models.Index(fields=['created_at'], name='comment_kw_match_created_idx'),
+        ]
+
+
 class CrawlHistory(models.Model):
     """
     History of Reddit crawling operations
@@ -146,8 +256,73 @@ class CrawlHistory(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Crawl of {self.subreddit.name} at {self.start_time}"
+        # Ingestion runs that span several subreddits have none
+        name = self.subreddit.name if self.subreddit_id else 'all subreddits'
+        return f"Crawl of {name} at {self.start_time}"
 
     class Meta:
         db_table = 'crawl_history'
-        verbose_name_plural = 'Crawl histories'
\ No newline at end of file
+        verbose_name_plural = 'Crawl histories'
+        indexes = [
+            models.Index(fields=['start_time', 'id'], name='crawl_history_start_id_idx'),
+        ]
+
+
+class SubredditDailyStats(models.Model):
+    """
+    Daily rollup of a subreddit's posts and comments, materialised by
+    api.analytics. Rows are bucketed by submission date (UTC).
+    """
+    subreddit = models.ForeignKey(Subreddit, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    posts = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+    upvotes_total = models.BigIntegerField(default=0)
+    upvotes_max = models.IntegerField(default=0)
+    # Post counts per upvote bucket: [<= 0, 1, 2-3, 4-7, ...] (see api.analytics.HISTOGRAM_BUCKETS)
+    upvote_histogram = models.JSONField(default=list)
+
+    class Meta:
+        db_table = 'subreddit_daily_stats'
+        constraints = [
+            models.UniqueConstraint(fields=['subreddit', 'day'], name='subreddit_daily_stats_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='subreddit_daily_stats_day_idx'),
+        ]
+
+
+class KeywordDailyStats(models.Model):
+    """
+    Daily rollup of a keyword's matches in a subreddit, by the submission
+    date (UTC) of the matched post or comment
+    """
+    keyword = models.ForeignKey(Keyword, on_delete=models.CASCADE, related_name='daily_stats')
+    subreddit = models.ForeignKey(Subreddit, on_delete=models.CASCADE, related_name='keyword_daily_stats')
+    day = models.DateField()
+    posts = models.IntegerField(default=0)
+    comments = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'keyword_daily_stats'
+        constraints = [
+            models.UniqueConstraint(fields=['keyword', 'subreddit', 'day'], name='keyword_daily_stats_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='keyword_daily_stats_day_idx'),
+        ]
+
+
+class AnalyticsWatermark(models.Model):
+    """
+    Point in time up to which the rows behind a rollup have been processed
+    """
+    name = models.CharField(max_length=100, unique=True)
+    value = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at {self.value}"
+
+    class Meta:
+        db_table = 'analytics_watermark'
@@ -0,0 +1,191 @@
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, Max, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from .models import Notification, User
+from .tasks import defer
+from .realtime import POSTS_CHANNEL, notification_event, post_event, publish, user_channel
+
+NEW_POST_NOTIFICATION = 'New Post'
+
+_pending = threading.local()
+
+
+def new_post_content(titles):
+    if len(titles) == 1:
+        return f'A new post has been added: "{titles[0]}"'
+    return f'{len(titles)} new posts have been added, including "{titles[0]}"'
+
+
+def fan_out_notification(notification_type, content, batch_size=None):
+    """
+    Create one notification per premium user, walking the users in id order
+    and inserting each chunk with a single ``bulk_create``.
+    Returns the number of notifications created.
+    """
+    batch_size = batch_size or settings.NOTIFICATION_FANOUT_BATCH_SIZE
+    premium_users = User.objects.filter(membership_status='Premium').order_by('id')
+
+    created = 0
+    last_id = 0
+    while True:
+        user_ids = list(premium_users.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+        if not user_ids:
+            break
+        notifications = Notification.objects.bulk_create([
+            Notification(user_id=user_id, type=notification_type, content=content, read_status=False)
+            for user_id in user_ids
+        ])
+        add_unread(user_ids)
+        publish((user_channel(notification.user_id), notification_event(notification))
+                for notification in notifications)
+        created += len(user_ids)
+        last_id = user_ids[-1]
+    return created
+
+
+def notify_new_posts(posts):
+    """
+    Schedule a single New Post fan-out covering ``posts`` after the transaction
+    commits, and push the posts to connected realtime clients.
+    """
+    if posts:
+        defer(fan_out_notification, NEW_POST_NOTIFICATION, new_post_content([post.title for post in posts]))
+        publish((POSTS_CHANNEL, post_event(post)) for post in posts)
+
+
+def queue_new_post_notification(post):
+    """
+    Notify premium users about a new post, coalescing it with the other posts
+    created inside an active ``coalesce_post_notifications()`` block.
+    """
+    posts = getattr(_pending, 'posts', None)
+    if posts is None:
+        notify_new_posts([post])
+    else:
+        posts.append(post)
+
+
+@contextmanager
+def coalesce_post_notifications():
+    """Send one notification per premium user for all posts created inside the block"""
+    if getattr(_pending, 'posts', None) is not None:
+        # Already coalescing in an outer block
+        yield
+        return
+
+    _pending.posts = []
+    try:
+        yield
+    finally:
+        posts, _pending.posts = _pending.posts, None
+        notify_new_posts(posts)
+
+
+# Unread state
+#
+# Each user has an ``unread_notifications`` counter that is kept up to date
+# incrementally, and a ``notifications_read_up_to`` watermark: every
+# notification with an id up to the watermark counts as read, whatever its
+# read_status. Marking everything read only moves the watermark.
+
+def state_key(user_id):
+    return f'notifications:{user_id}'
+
+
+def get_notification_state(user_id):
+    """
+    Return ``{'unread', 'latest_id', 'read_up_to'}`` for a user, from the
+    cache when possible. Any change to the user's notifications drops it.
+    """
+    key = state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        user = User.objects.filter(pk=user_id).values('unread_notifications', 'notifications_read_up_to').first()
+        if user is None:
+            return {'unread': 0, 'latest_id': 0, 'read_up_to': 0}
+        latest = Notification.objects.filter(user_id=user_id).aggregate(latest=Max('id'))['latest']
+        state = {
+            'unread': user['unread_notifications'],
+            'latest_id': latest or 0,
+            'read_up_to': user['notifications_read_up_to'],
+        }
+        cache.set(key, state, settings.NOTIFICATION_STATE_CACHE_TIMEOUT)
+    return state
+
+
+def invalidate_notification_state(user_ids):
+    cache.delete_many([state_key(user_id) for user_id in user_ids])
+
+
+def add_unread(user_ids, delta=1):
+    """Adjust the unread counters of ``user_ids`` by ``delta`` in one UPDATE (never below zero)"""
+    if not user_ids:
+        return
+    User.objects.filter(pk__in=user_ids).update(
+        unread_notifications=Greatest(F('unread_notifications') + delta, Value(0)))
+    invalidate_notification_state(user_ids)
+
+
+def is_unread(notification, read_up_to):
+    return not notification.read_status and notification.id > read_up_to
+
+
+def mark_read(notification):
+    """Mark one notification read, decrementing the counter if it was unread"""
+    read_up_to = get_notification_state(notification.user_id)['read_up_to']
+    updated = Notification.objects.filter(pk=notification.pk, read_status=False).update(read_status=True)
+    if updated and notification.id > read_up_to:
+        add_unread([notification.user_id], -1)
+    notification.read_status = True
+
+
+def mark_all_read(user_id):
+    """Mark every current notification of a user read by moving the watermark"""
+    latest = Notification.objects.filter(user_id=user_id).aggregate(latest=Max('id'))['latest'] or 0
+    User.objects.filter(pk=user_id).update(
+        notifications_read_up_to=Greatest(F('notifications_read_up_to'), Value(latest)),
+        # Anything newer than ``latest`` (created meanwhile) stays unread
+        unread_notifications=Coalesce(Subquery(
+            Notification.objects.filter(user_id=user_id, read_status=False, id__gt=latest).order_by()
+            .values('user').annotate(count=Count('id')).values('count'),
+            output_field=IntegerField(),
+        ), 0),
+    )
+    invalidate_notification_state([user_id])
+
+
+def mark_unread(notifications):
+    """
+    Mark notifications unread. Notifications at or below their user's
+    watermark would still count as read, so the watermark is lowered below
+    them; the user's other notifications it covered are marked read first,
+    so that they stay read.
+    """
+    ids = list(notifications.values_list('id', flat=True))
+    lowest = dict(Notification.objects.filter(id__in=ids).order_by().values('user_id')
+                  .annotate(lowest=Min('id')).values_list('user_id', 'lowest'))
+    watermarks = dict(User.objects.filter(pk__in=lowest).values_list('pk', 'notifications_read_up_to'))
+    with transaction.atomic():
+        for user_id, lowest_id in lowest.items():
+            read_up_to = watermarks.get(user_id, 0)
+            if lowest_id <= read_up_to:
+                (Notification.objects.filter(user_id=user_id, id__gte=lowest_id, id__lte=read_up_to, read_status=False)
+                 .exclude(id__in=ids).update(read_status=True))
+                User.objects.filter(pk=user_id).update(notifications_read_up_to=lowest_id - 1)
+        Notification.objects.filter(id__in=ids).update(read_status=False)
+    recount_unread(set(lowest))
+
+
+def recount_unread(user_ids):
+    """Recompute the unread counters of ``user_ids`` from their notifications"""
+    User.objects.filter(pk__in=user_ids).update(unread_notifications=Coalesce(Subquery(
+        Notification.objects.filter(user=OuterRef('pk'), read_status=False,
+                                    id__gt=OuterRef('notifications_read_up_to'))
+        .order_by().values('user').annotate(count=Count('id')).values('count'),
+        output_field=IntegerField(),
+    ), 0))
+    invalidate_notification_state(user_ids)
@@ -0,0 +1,260 @@
+import base64
+import datetime
+import json
+from decimal import Decimal
+from django.conf import settings
+from django.core.paginator import InvalidPage, Paginator
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.utils.functional import cached_property
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CountedQuerySet:
+    """A queryset whose row count is already known, so paginating it does not count again"""
+
+    def __init__(self, queryset, count):
+        self.queryset = queryset
+        self._count = count
+
+    def count(self):
+        return self._count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, key):
+        return self.queryset[key]
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views: counts and fetches the page with the async ORM"""
+        paginator = self.django_paginator_class(CountedQuerySet(queryset, await queryset.acount()),
+                                                self.get_page_size(request))
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [row async for row in self.page.object_list]
+        self.request = request
+        return self.page.object_list
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination that seeks past the last row of the previous page
+    instead of counting and offsetting.
+
+    The page is ordered by the first ordering field already applied to the
+    queryset (e.g. by ``OrderingFilter``) with ``id`` as a tie-breaker, so the
+    cursor is the ``(value, id)`` pair of the last row that was returned.
+    """
+    page_size = 25
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    default_ordering = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self.set_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self.set_page([row async for row in self.get_page_queryset(queryset, request)])
+
+    def get_page_queryset(self, queryset, request):
+        """The ordered, seeked queryset of the requested page plus one row to detect the next page"""
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        self.field = self.ordering.lstrip('-')
+        self.descending = self.ordering.startswith('-')
+        tie_breaker = '-id' if self.descending else 'id'
+
+        if self.field == 'id':
+            queryset = queryset.order_by(tie_breaker)
+        else:
+            queryset = queryset.order_by(self.ordering, tie_breaker)
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self.get_seek_filter(queryset, *cursor))
+
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset):
+        """Return the primary ordering field of the (already filtered) queryset"""
+        for ordering in queryset.query.order_by:
+            if isinstance(ordering, str) and ordering.lstrip('-') not in ('pk', 'id'):
+                return ordering
+            if isinstance(ordering, str):
+                return '-id' if ordering.startswith('-') else 'id'
+        return self.default_ordering
+
+    def get_seek_filter(self, queryset, value, last_id):
+        """Build the condition selecting the rows that come after ``(value, last_id)``"""
+        lookup = 'lt' if self.descending else 'gt'
+        after_id = Q(**{f'id__{lookup}': last_id})
+        if self.field == 'id':
+            return after_id
+
+        # Databases disagree on where NULLs sort, so ask the backend
+        nulls_largest = connections[queryset.db].features.nulls_order_largest
+        nulls_after = nulls_largest != self.descending
+        is_null = Q(**{f'{self.field}__isnull': True})
+
+        if value is None:
+            seek = is_null & after_id
+            if not nulls_after:
+                seek |= ~is_null
+            return seek
+
+        value = self.to_python(queryset.model, value)
+        seek = Q(**{f'{self.field}__{lookup}': value}) | (Q(**{self.field: value}) & after_id)
+        if nulls_after:
+            seek |= is_null
+        return seek
+
+    def to_python(self, model, value):
+        """The cursor value as the ordering field's type; a forged or corrupted value is a 404"""
+        try:
+            field = model._meta.get_field(self.field)
+        except FieldDoesNotExist:
+            # Annotations (e.g. search rank) are numbers, compared as-is
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise NotFound(self.invalid_cursor_message)
+            return value
+        try:
+            return field.to_python(value)
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            cursor = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            ordering, value, last_id = cursor['o'], cursor['v'], int(cursor['i'])
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if ordering != self.ordering:
+            raise NotFound(self.invalid_cursor_message)
+        return value, last_id
+
+    def encode_cursor(self, row):
+        value = getattr(row, self.field)
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+        cursor = json.dumps({'o': self.ordering, 'v': value, 'i': row.id}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+
+class FeedPagination(StandardResultsSetPagination):
+    """
+    Page-number pagination that switches to keyset pagination when the client
+    sends a ``cursor`` parameter (an empty value requests the first page).
+    Plain lists, such as prebuilt comment trees, are always page-numbered.
+    """
+    keyset_pagination_class = KeysetPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        cursor_param = self.keyset_pagination_class.cursor_query_param
+        if isinstance(queryset, QuerySet) and cursor_param in request.query_params:
+            self.keyset = self.get_keyset_pagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_pagination_class.cursor_query_param in request.query_params:
+            self.keyset = self.get_keyset_pagination()
+            return await self.keyset.apaginate_queryset(queryset, request, view)
+        return await super().apaginate_queryset(queryset, request, view)
+
+    def get_keyset_pagination(self):
+        keyset = self.keyset_pagination_class()
+        keyset.page_size = self.page_size
+        keyset.max_page_size = self.max_page_size
+        return keyset
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+def estimated_count(queryset):
+    """
+    PostgreSQL's planner estimate of the number of rows in the queryset's
+    table (``pg_class.reltuples``, kept current by autovacuum), or None when
+    it is unavailable: other databases, or a table never analysed.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)',
+                       [connection.ops.quote_name(queryset.model._meta.db_table)])
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Django paginator that does not ``COUNT(*)`` whole large tables: an
+    unfiltered queryset whose table holds more than
+    ADMIN_ESTIMATED_COUNT_THRESHOLD rows is counted from the planner estimate.
+    Filtered querysets, and small tables, are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            estimate = estimated_count(queryset)
+            if estimate is not None and estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
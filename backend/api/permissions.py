@@ -1,4 +1,5 @@
 from rest_framework import permissions
+from .entitlements import get_entitlement
 
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
@@ -40,7 +41,9 @@ class IsAdminUserOrReadOnly(permissions.BasePermission):
 class IsPremiumUser(permissions.BasePermission):
     """
     Custom permission to only allow premium users to access certain views.
+    Uses the cached entitlement, so expired subscriptions are refused even
+    before the expiry sweep downgrades the user.
     """
 
     def has_permission(self, request, view):
-        return request.user and request.user.is_authenticated and request.user.membership_status == 'Premium'
\ No newline at end of file
+        return bool(request.user and request.user.is_authenticated and get_entitlement(request.user).is_premium)
\ No newline at end of file
@@ -0,0 +1,45 @@
+from django.db import connections
+
+
+def pool_stats(alias):
+    """
+    Usage of a database's connection pool in this process (DATABASE_POOL):
+    connections open, in use and idle, requests waiting for one, and how long
+    acquiring a connection took. Counters cover the pool's whole lifetime.
+    None when the database is not pooled.
+    """
+    pool = getattr(connections[alias], 'pool', None)
+    if pool is None:
+        return None
+    stats = pool.get_stats()
+    requests = stats.get('requests_num', 0)
+    queued = stats.get('requests_queued', 0)
+    wait_ms = stats.get('requests_wait_ms', 0)
+    opened = stats.get('connections_num', 0)
+    return {
+        'min_size': stats['pool_min'],
+        'max_size': stats['pool_max'],
+        'size': stats['pool_size'],
+        'in_use': stats['pool_size'] - stats['pool_available'],
+        'idle': stats['pool_available'],
+        # No longer part of get_stats() in recent psycopg_pool versions
+        'waiting': stats.get('requests_waiting', len(getattr(pool, '_waiting', ()))),
+        'requests': requests,
+        # Requests that found no idle connection and had to wait for one
+        'requests_queued': queued,
+        'acquire_wait_ms_total': wait_ms,
+        'acquire_wait_ms_mean': round(wait_ms / requests, 2) if requests else 0,
+        'acquire_wait_ms_mean_queued': round(wait_ms / queued, 2) if queued else 0,
+        # Timeouts and requests refused by the pool
+        'acquire_errors': stats.get('requests_errors', 0),
+        'connections_opened': opened,
+        'connect_ms_mean': round(stats.get('connections_ms', 0) / opened, 2) if opened else 0,
+        'connection_errors': stats.get('connections_errors', 0),
+        # Connections found broken by the checkout health check, or returned broken
+        'connections_lost': stats.get('connections_lost', 0),
+        'returns_bad': stats.get('returns_bad', 0),
+    }
+
+
+def all_pool_stats():
+    return {alias: pool_stats(alias) for alias in connections}
@@ -0,0 +1,226 @@
+import asyncio
+import json
+import logging
+import threading
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('api')
+
+POSTS_CHANNEL = 'posts'
+
+# Queued in place of an event when a client falls too far behind
+OVERFLOW = object()
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class Subscriber:
+    """
+    One connected client. Events wait in a bounded queue; a client that lets
+    it fill up is cut off with an ``overflow`` event rather than slowing the
+    hub down or growing memory, and is expected to resync and reconnect.
+    """
+
+    def __init__(self, channels, queue_size=None):
+        self.channels = frozenset(channels)
+        self.queue = asyncio.Queue(maxsize=queue_size or settings.REALTIME_QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            # Make room for the marker so the stream notices right away
+            self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+
+
+class Hub:
+    """
+    In-process broadcast hub living on the ASGI event loop.
+
+    Subscribers register for channels (``posts``, ``user:<id>``). Messages
+    reach the hub through the configured backend, which may be fed from any
+    thread or, with the Redis backend, from any process.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self.channels = {}
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def subscribe(self, channels, queue_size=None):
+        subscriber = Subscriber(channels, queue_size)
+        with self.lock:
+            self.loop = asyncio.get_running_loop()
+            self.connections += 1
+            for channel in subscriber.channels:
+                self.channels.setdefault(channel, set()).add(subscriber)
+        get_backend().start(self)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.connections -= 1
+            for channel in subscriber.channels:
+                subscribers = self.channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self.channels[channel]
+
+    def dispatch(self, messages):
+        """Deliver ``(channel, event)`` pairs to local subscribers; must run on the hub's loop"""
+        for channel, event in messages:
+            for subscriber in list(self.channels.get(channel, ())):
+                subscriber.offer(event)
+
+    def dispatch_threadsafe(self, messages):
+        loop = self.loop
+        if loop is None or loop.is_closed() or not self.channels:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self.dispatch(messages)
+        else:
+            loop.call_soon_threadsafe(self.dispatch, messages)
+
+
+class LocalBackend:
+    """Delivers messages to this process's hub only (single worker or development)"""
+
+    def start(self, hub):
+        pass
+
+    def publish(self, messages):
+        hub.dispatch_threadsafe(messages)
+
+
+class RedisBackend:
+    """
+    Fans messages out to every worker through Redis pub/sub
+    (``REALTIME_REDIS_URL``, defaulting to ``REDIS_URL``).
+    """
+
+    def __init__(self):
+        import redis
+
+        self.url = settings.REALTIME_REDIS_URL or settings.REDIS_URL
+        self.channel = f'{settings.RESPONSE_CACHE_PREFIX}:realtime'
+        self.client = redis.Redis.from_url(self.url)
+        self.listener = None
+
+    def start(self, hub):
+        if self.listener is None or self.listener.done():
+            self.listener = asyncio.get_running_loop().create_task(self.listen(hub))
+
+    async def listen(self, hub):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        while True:
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message['type'] == 'message':
+                            hub.dispatch(json.loads(message['data']))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception('Realtime Redis listener failed, reconnecting')
+                await asyncio.sleep(1)
+
+    def publish(self, messages):
+        self.client.publish(self.channel, json.dumps(messages, cls=DjangoJSONEncoder))
+
+
+hub = Hub()
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(settings.REALTIME_BACKEND)()
+    return _backend
+
+
+def publish(messages):
+    """Publish ``(channel, event)`` pairs once the current transaction commits"""
+    messages = [(channel, event) for channel, event in messages]
+    if not messages or not settings.REALTIME_ENABLED:
+        return
+
+    def send():
+        try:
+            get_backend().publish(messages)
+        except Exception:
+            logger.exception('Publishing %d realtime messages failed', len(messages))
+
+    transaction.on_commit(send)
+
+
+def post_event(post):
+    return {
+        'event': 'post',
+        'id': post.id,
+        'reddit_id': post.reddit_id,
+        'title': post.title,
+        'subreddit_name': post.subreddit_name,
+        'upvotes': post.upvotes,
+        'submission_date': post.submission_date,
+    }
+
+
+def notification_event(notification):
+    return {
+        'event': 'notification',
+        'id': notification.id,
+        'type': notification.type,
+        'content': notification.content,
+        'created_at': notification.created_at,
+    }
+
+
+def format_event(event):
+    """Render an event as a Server-Sent Events frame"""
+    data = json.dumps({key: value for key, value in event.items() if key != 'event'}, cls=DjangoJSONEncoder)
+    frame = f"event: {event['event']}\ndata: {data}\n"
+    if event.get('id') is not None:
+        frame = f"id: {event['event']}-{event['id']}\n" + frame
+    return frame + '\n'
+
+
+async def event_stream(subscriber, heartbeat=None):
+    """Yield SSE frames for a subscriber until it disconnects or overflows"""
+    heartbeat = heartbeat or settings.REALTIME_HEARTBEAT
+    try:
+        yield f'retry: {settings.REALTIME_RETRY_MS}\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing idle connections
+                yield ': keepalive\n\n'
+                continue
+            if event is OVERFLOW:
+                yield 'event: overflow\ndata: {}\n\n'
+                return
+            yield format_event(event)
+    finally:
+        hub.unsubscribe(subscriber)
@@ -0,0 +1,88 @@
+import codecs
+import io
+from decimal import Decimal
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the stock JSON renderer and parser are used instead
+    orjson = None
+
+# Values orjson writes exactly like the json module, so containers holding only these need no fallback
+SAFE_TYPES = frozenset((str, int, bool, type(None)))
+
+
+class FastRows(list):
+    """Rows built by the list fast path (see api/fastpath.py), which never hold floats or decimals"""
+
+
+def contains_float(value):
+    """
+    Whether ``value`` holds a float or Decimal anywhere. orjson writes very
+    large and very small floats in another notation than the json module
+    (``1e16`` vs ``1e+16``), and the encoder turns decimals into floats.
+    """
+    if isinstance(value, FastRows):
+        return False
+    if isinstance(value, dict):
+        values = value.values()
+    elif isinstance(value, (list, tuple)):
+        values = value
+    else:
+        return isinstance(value, (float, Decimal))
+    types = set(map(type, values))
+    if float in types or Decimal in types:
+        return True
+    if types <= SAFE_TYPES:
+        return False
+    return any(contains_float(item) for item in values if type(item) not in SAFE_TYPES)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    ``JSONRenderer`` encoding with orjson, whose output is byte-for-byte the
+    same: compact, unescaped UTF-8, U+2028/U+2029 escaped, dates and other
+    types through the DRF encoder. Whatever orjson would write differently is
+    left to ``JSONRenderer``: indented output, non-default JSON settings,
+    data holding floats (see ``contains_float``), non-string keys and
+    integers over 64 bits.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (data is None or orjson is None or not settings.ORJSON_ENABLED or not self.compact
+                or self.ensure_ascii or self.get_indent(accepted_media_type, renderer_context or {})
+                or contains_float(data)):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Valid JSON but not valid JavaScript, escaped as JSONRenderer does
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+def render_json(data):
+    """``data`` encoded as DRF API responses are"""
+    return ORJSONRenderer().render(data)
+
+
+class ORJSONParser(JSONParser):
+    """
+    ``JSONParser`` decoding with orjson. Bodies orjson rejects are parsed by
+    ``JSONParser``, so the same documents are accepted and errors are unchanged.
+    """
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or not settings.ORJSON_ENABLED or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
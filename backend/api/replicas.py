@@ -0,0 +1,233 @@
+import contextvars
+import hashlib
+import logging
+import math
+import random
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger('api')
+
+# Models whose reads may be served by a replica: crawled content, which
+# tolerates a little replication lag. Users, tokens, sessions, subscriptions
+# and notifications are always read from the primary.
+REPLICA_MODELS = {'api.subreddit', 'api.post', 'api.comment', 'api.keyword',
+                  'api.postkeywordmatch', 'api.commentkeywordmatch'}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# The request being handled; a context variable so that it follows sync views
+# run in a worker thread under ASGI and the async ORM's own threads, but not
+# deferred tasks, whose reads and writes therefore go to the primary
+_request = contextvars.ContextVar('replica_request', default=None)
+
+# Lag of a replica in seconds; 0 when it has replayed everything it received
+PG_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def measure_lag(alias):
+    """Replication lag of a replica in seconds; raises DatabaseError when it cannot be reached"""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(PG_LAG_SQL if connection.vendor == 'postgresql' else 'SELECT 0')
+            return float(cursor.fetchone()[0])
+    except DatabaseError:
+        # Reconnect on the next check
+        connection.close()
+        raise
+
+
+class ReplicaHealth:
+    """
+    Reachability and replication lag of each replica, checked at most every
+    REPLICA_HEALTH_CHECK_INTERVAL seconds by whichever thread needs it first.
+    Replicas that cannot be reached or lag more than REPLICA_MAX_LAG_SECONDS
+    are left out until a later check finds them healthy again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked_at = None
+        self.lag = {}
+
+    def refresh(self):
+        lag = {}
+        for alias in settings.DATABASE_REPLICAS:
+            try:
+                lag[alias] = measure_lag(alias)
+            except DatabaseError as exc:
+                lag[alias] = None
+                if self.lag.get(alias) is not None or alias not in self.lag:
+                    logger.warning('Replica %s is unreachable, reading from the primary: %s', alias, exc)
+        self.lag = lag
+        self.checked_at = time.monotonic()
+
+    def check(self):
+        due = self.checked_at is None or time.monotonic() - self.checked_at >= settings.REPLICA_HEALTH_CHECK_INTERVAL
+        # Other threads keep using the previous results while one thread checks
+        if due and self.lock.acquire(blocking=False):
+            try:
+                self.refresh()
+            finally:
+                self.lock.release()
+
+    def healthy(self):
+        self.check()
+        return [alias for alias in settings.DATABASE_REPLICAS
+                if self.lag.get(alias) is not None and self.lag[alias] <= settings.REPLICA_MAX_LAG_SECONDS]
+
+    def max_lag(self):
+        return max((lag for lag in self.lag.values() if lag is not None), default=0)
+
+    def status(self):
+        self.check()
+        healthy = self.healthy()
+        return {alias: {'healthy': alias in healthy, 'lag': self.lag.get(alias)}
+                for alias in settings.DATABASE_REPLICAS}
+
+    def reset(self):
+        self.checked_at = None
+        self.lag = {}
+
+
+replica_health = ReplicaHealth()
+
+
+# Read-your-writes: after a client's write, its reads go to the primary until
+# the replicas have caught up
+
+def client_key(request):
+    """Who is making the request, from the credentials it carries, without touching the database"""
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if credentials:
+        return hashlib.md5(credentials.encode('utf-8')).hexdigest()
+    return None
+
+
+def pin_key(client):
+    return f'replica-pin:{client}'
+
+
+def pin_seconds():
+    """How long a client reads from the primary after writing: the sticky window, or longer while replicas lag"""
+    return max(settings.REPLICA_STICKY_SECONDS, math.ceil(replica_health.max_lag()))
+
+
+def pin_to_primary(request):
+    client = client_key(request)
+    if client is not None:
+        cache.set(pin_key(client), True, pin_seconds())
+
+
+def is_pinned(request):
+    client = client_key(request)
+    return client is not None and cache.get(pin_key(client)) is not None
+
+
+def view_reads_from_replica(view):
+    """Whether a view (a view function or a DRF viewset's) is marked with ``replica_reads``"""
+    return bool(getattr(view, 'replica_reads', False) or getattr(getattr(view, 'cls', None), 'replica_reads', False))
+
+
+def request_replica(request):
+    """
+    The replica serving this request's reads, or None for the primary.
+    Decided once per request, when it first reads a replica model.
+    """
+    if not hasattr(request, 'read_replica'):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            # Not resolved yet (e.g. a middleware reading): decide later
+            return None
+        replica = None
+        if (settings.DATABASE_REPLICAS and request.method in SAFE_METHODS and view_reads_from_replica(match.func)
+                and not is_pinned(request)):
+            healthy = replica_health.healthy()
+            if healthy:
+                replica = random.choice(healthy)
+        request.read_replica = replica
+    return request.read_replica
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of content models made while handling safe-method
+    requests to views marked ``replica_reads = True`` to a healthy replica
+    (DATABASE_REPLICAS), unless the client wrote recently. Everything else,
+    writes included, uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in REPLICA_MODELS:
+            return None
+        request = _request.get()
+        if request is None:
+            return None
+        return request_replica(request)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Makes the request visible to ``ReplicaRouter`` and, after a successful
+    write, pins the client to the primary for ``pin_seconds()``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _request.set(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        if self.is_write(request, response):
+            pin_to_primary(request)
+        return response
+
+    async def __acall__(self, request):
+        token = _request.set(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request.reset(token)
+        if self.is_write(request, response):
+            client = client_key(request)
+            if client is not None:
+                await cache.aset(pin_key(client), True, pin_seconds())
+        return response
+
+    @staticmethod
+    def is_write(request, response):
+        return bool(settings.DATABASE_REPLICAS) and request.method not in SAFE_METHODS and response.status_code < 400
@@ -0,0 +1,382 @@
+import datetime
+import gzip
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from .models import Notification, User
+from .notifications import add_unread
+
+logger = logging.getLogger('api')
+
+ARCHIVE_FIELDS = ('id', 'user_id', 'type', 'content', 'read_status', 'created_at', 'updated_at')
+RUNS_KEY = 'notification-retention:runs'
+# Number of past runs kept for the metrics endpoint
+RUNS_KEPT = 20
+
+# Notification retention:
+#   NOTIFICATION_RETENTION_DAYS            default lifetime of a notification (0 keeps them forever)
+#   NOTIFICATION_RETENTION_DAYS_BY_TYPE    per-type overrides, e.g. {"New Post": 30}
+# `manage.py prune_notifications` deletes expired rows in short batches,
+# optionally archiving them first as gzipped NDJSON. On PostgreSQL the table
+# can be range-partitioned by month (`manage.py partition_notifications`),
+# in which case partitions that have fully expired are dropped whole.
+
+
+def retention_policy():
+    """Return ``({type: days}, default_days)``; 0 days means keep forever"""
+    return dict(settings.NOTIFICATION_RETENTION_DAYS_BY_TYPE), settings.NOTIFICATION_RETENTION_DAYS
+
+
+def expired_filter(now):
+    """Q object matching the notifications that are past their retention period, or None"""
+    by_type, default = retention_policy()
+    conditions = [
+        Q(type=notification_type, created_at__lt=now - datetime.timedelta(days=days))
+        for notification_type, days in by_type.items() if days
+    ]
+    if default:
+        conditions.append(Q(created_at__lt=now - datetime.timedelta(days=default)) & ~Q(type__in=list(by_type)))
+    if not conditions:
+        return None
+    expired = conditions[0]
+    for condition in conditions[1:]:
+        expired |= condition
+    return expired
+
+
+def droppable_before(now):
+    """Cutoff before which every notification has expired whatever its type, or None"""
+    by_type, default = retention_policy()
+    days = [*by_type.values(), default]
+    if not all(days):
+        return None
+    return now - datetime.timedelta(days=max(days))
+
+
+@dataclass
+class RetentionResult:
+    """Counters for one retention run"""
+    started_at: datetime.datetime = None
+    deleted: int = 0
+    archived: int = 0
+    partitions_dropped: list = field(default_factory=list)
+    by_type: dict = field(default_factory=dict)
+    batches: int = 0
+    archive_path: str = None
+    duration: float = 0.0
+
+    def as_dict(self):
+        return {
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'deleted': self.deleted,
+            'archived': self.archived,
+            'partitions_dropped': self.partitions_dropped,
+            'by_type': self.by_type,
+            'batches': self.batches,
+            'archive_path': self.archive_path,
+            'duration': round(self.duration, 3),
+        }
+
+
+class Archive:
+    """Gzipped NDJSON file the pruned notifications are written to, opened on first use"""
+
+    def __init__(self, directory, now):
+        self.path = os.path.join(directory, f'notifications-{now:%Y%m%dT%H%M%S}.ndjson.gz')
+        self.file = None
+
+    def write(self, rows):
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.file = gzip.open(self.path, 'at', encoding='utf-8')
+        for row in rows:
+            self.file.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+        # Flushed per batch so what was deleted is on disk before the next batch
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def release_unread(rows):
+    """Decrement the unread counters for the unread notifications among ``rows`` about to be deleted"""
+    unread = [row for row in rows if not row['read_status']]
+    if not unread:
+        return
+    read_up_to = dict(User.objects.filter(pk__in={row['user_id'] for row in unread})
+                      .values_list('pk', 'notifications_read_up_to'))
+    counts = defaultdict(int)
+    for row in unread:
+        if row['id'] > read_up_to.get(row['user_id'], 0):
+            counts[row['user_id']] += 1
+    by_count = defaultdict(list)
+    for user_id, count in counts.items():
+        by_count[count].append(user_id)
+    for count, user_ids in by_count.items():
+        add_unread(user_ids, -count)
+
+
+def prune_notifications(now=None, batch_size=None, archive_dir=None, dry_run=False):
+    """
+    Delete the notifications that are past their retention period.
+
+    Rows are removed ``batch_size`` at a time, each batch in its own short
+    transaction, so no lock is held for long. With ``archive_dir`` the rows
+    are appended to a gzipped NDJSON file before they are deleted.
+    Unread counters are adjusted for the unread notifications removed.
+    """
+    started = time.perf_counter()
+    now = now or timezone.now()
+    batch_size = batch_size or settings.NOTIFICATION_RETENTION_BATCH_SIZE
+    archive_dir = archive_dir if archive_dir is not None else settings.NOTIFICATION_ARCHIVE_DIR
+    result = RetentionResult(started_at=now)
+    archive = Archive(archive_dir, now) if archive_dir and not dry_run else None
+    expired = expired_filter(now)
+
+    try:
+        if expired is not None and is_partitioned():
+            dropped_until = drop_expired_partitions(now, result, archive, dry_run)
+            if dropped_until is not None:
+                expired &= Q(created_at__gte=dropped_until)
+        last_id = 0
+        while expired is not None:
+            rows = list(Notification.objects.filter(expired, id__gt=last_id).order_by('id')
+                        .values(*ARCHIVE_FIELDS)[:batch_size])
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            result.batches += 1
+            for row in rows:
+                result.by_type[row['type']] = result.by_type.get(row['type'], 0) + 1
+            if dry_run:
+                result.deleted += len(rows)
+                continue
+            if archive is not None:
+                archive.write(rows)
+                result.archived += len(rows)
+            with transaction.atomic():
+                release_unread(rows)
+                result.deleted += delete_rows([row['id'] for row in rows])
+    finally:
+        if archive is not None:
+            archive.close()
+            if archive.file is not None:
+                result.archive_path = archive.path
+
+    result.duration = time.perf_counter() - started
+    if not dry_run:
+        record_run(result)
+    logger.info('Notification retention: %s', result.as_dict())
+    return result
+
+
+def delete_rows(ids):
+    """
+    Delete notifications with a plain DELETE, without the ORM's per-row
+    post_delete signals: their unread bookkeeping is done for the whole batch
+    (``release_unread``). Returns the number of rows deleted.
+    """
+    table = connection.ops.quote_name(Notification._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE id IN ({", ".join(["%s"] * len(ids))})', ids)
+        return cursor.rowcount
+
+
+def record_run(result):
+    runs = cache.get(RUNS_KEY) or []
+    cache.set(RUNS_KEY, [result.as_dict(), *runs][:RUNS_KEPT], None)
+
+
+def retention_metrics():
+    """The most recent retention runs (newest first) and current table statistics"""
+    runs = cache.get(RUNS_KEY) or []
+    return {
+        'runs': runs,
+        'last_run': runs[0] if runs else None,
+        'total_deleted': sum(run['deleted'] for run in runs),
+        'partitioned': is_partitioned(),
+        'partitions': [partition.as_dict() for partition in list_partitions()],
+    }
+
+
+# PostgreSQL monthly range partitioning of the notification table
+
+PARTITION_PREFIX = 'notification_p'
+
+
+@dataclass
+class Partition:
+    name: str
+    start: datetime.datetime
+    end: datetime.datetime
+
+    def as_dict(self):
+        return {'name': self.name, 'start': self.start.isoformat(), 'end': self.end.isoformat()}
+
+
+def month_start(value):
+    return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(value):
+    return month_start(month_start(value) + datetime.timedelta(days=32))
+
+
+def partition_for(month):
+    start = month_start(month)
+    return Partition(f'{PARTITION_PREFIX}{start:%Y_%m}', start, next_month(start))
+
+
+def is_partitioned():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)",
+                       [Notification._meta.db_table])
+        return cursor.fetchone() is not None
+
+
+def list_partitions():
+    """Monthly partitions of the notification table, oldest first (the default partition excluded)"""
+    if not is_partitioned():
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%s) AND c.relname LIKE %s ORDER BY c.relname",
+            [Notification._meta.db_table, f'{PARTITION_PREFIX}%'])
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = []
+    for name in names:
+        month = datetime.datetime.strptime(name[len(PARTITION_PREFIX):], '%Y_%m').replace(tzinfo=datetime.timezone.utc)
+        partitions.append(partition_for(month))
+    return partitions
+
+
+def create_partitions(start, end, cursor):
+    """Create the missing monthly partitions covering ``start`` up to ``end``; returns the ones created"""
+    existing = {partition.name for partition in list_partitions()}
+    created = []
+    month = month_start(start)
+    while month < end:
+        partition = partition_for(month)
+        if partition.name not in existing:
+            cursor.execute(
+                f'CREATE TABLE {connection.ops.quote_name(partition.name)} PARTITION OF '
+                f'{connection.ops.quote_name(Notification._meta.db_table)} FOR VALUES FROM (%s) TO (%s)',
+                [partition.start, partition.end])
+            created.append(partition)
+        month = partition.end
+    return created
+
+
+def ensure_partitions(months_ahead=3, now=None):
+    """Make sure partitions exist from the current month to ``months_ahead`` months ahead"""
+    now = (now or timezone.now()).astimezone(datetime.timezone.utc)
+    end = month_start(now)
+    for _ in range(months_ahead + 1):
+        end = next_month(end)
+    with transaction.atomic(), connection.cursor() as cursor:
+        return create_partitions(now, end, cursor)
+
+
+def partition_table(months_ahead=3, now=None):
+    """
+    Convert the notification table into one range-partitioned by month on
+    created_at. The rows are copied into the new partitions and the old table
+    dropped in a single transaction, which locks notifications for the
+    duration: run it in a maintenance window. The primary key becomes
+    ``(id, created_at)``, as PostgreSQL requires of partitioned tables.
+    """
+    if connection.vendor != 'postgresql':
+        raise ValueError('Partitioning the notification table requires PostgreSQL')
+    if is_partitioned():
+        return ensure_partitions(months_ahead, now)
+
+    now = (now or timezone.now()).astimezone(datetime.timezone.utc)
+    table = connection.ops.quote_name(Notification._meta.db_table)
+    old = connection.ops.quote_name(f'{Notification._meta.db_table}_unpartitioned')
+    user_table = connection.ops.quote_name(User._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'SELECT min(created_at) FROM {table}')
+        oldest = (cursor.fetchone()[0] or now).astimezone(datetime.timezone.utc)
+        cursor.execute(f'ALTER TABLE {table} RENAME TO {old}')
+        cursor.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING IDENTITY) '
+                       f'PARTITION BY RANGE (created_at)')
+        end = month_start(now)
+        for _ in range(months_ahead + 1):
+            end = next_month(end)
+        created = create_partitions(oldest, end, cursor)
+        cursor.execute(f'CREATE TABLE {connection.ops.quote_name(Notification._meta.db_table + "_default")} '
+                       f'PARTITION OF {table} DEFAULT')
+        cursor.execute(f'INSERT INTO {table} OVERRIDING SYSTEM VALUE SELECT * FROM {old}')
+        cursor.execute(f"SELECT setval(pg_get_serial_sequence(%s, 'id'), coalesce(max(id), 0) + 1, false) "
+                       f"FROM {table}", [Notification._meta.db_table])
+        # Fire the deferred foreign key checks still queued against the old table so it can be dropped
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        cursor.execute(f'DROP TABLE {old}')
+        cursor.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, created_at)')
+        cursor.execute(f'ALTER TABLE {table} ADD CONSTRAINT notification_user_id_fk FOREIGN KEY (user_id) '
+                       f'REFERENCES {user_table} (id) DEFERRABLE INITIALLY DEFERRED')
+        cursor.execute(f'CREATE INDEX notification_user_id_idx ON {table} (user_id)')
+        for index in Notification._meta.indexes:
+            columns = ', '.join(connection.ops.quote_name(Notification._meta.get_field(name).column)
+                                for name in index.fields)
+            cursor.execute(f'CREATE INDEX {connection.ops.quote_name(index.name)} ON {table} ({columns})')
+    return created
+
+
+def drop_expired_partitions(now, result, archive=None, dry_run=False):
+    """
+    Drop the partitions whose rows have all expired, archiving them first when
+    asked. Returns the end of the last partition dropped, or None.
+    """
+    cutoff = droppable_before(now)
+    if cutoff is None:
+        return None
+    dropped_until = None
+    for partition in list_partitions():
+        if partition.end > cutoff:
+            break
+        rows = Notification.objects.filter(created_at__gte=partition.start, created_at__lt=partition.end)
+        counts = dict(rows.order_by().values_list('type').annotate(count=Count('id')))
+        dropped_until = partition.end
+        if dry_run:
+            result.deleted += sum(counts.values())
+            result.partitions_dropped.append(partition.name)
+            continue
+        if archive is not None:
+            batch = []
+            for row in rows.order_by('id').values(*ARCHIVE_FIELDS).iterator(chunk_size=2000):
+                batch.append(row)
+                if len(batch) >= 2000:
+                    archive.write(batch)
+                    batch = []
+            if batch:
+                archive.write(batch)
+            result.archived += sum(counts.values())
+        with transaction.atomic():
+            unread = (rows.filter(read_status=False, id__gt=F('user__notifications_read_up_to'))
+                      .order_by().values_list('user_id').annotate(count=Count('id')))
+            by_count = defaultdict(list)
+            for user_id, count in unread:
+                by_count[count].append(user_id)
+            for count, user_ids in by_count.items():
+                add_unread(user_ids, -count)
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {connection.ops.quote_name(partition.name)}')
+        result.partitions_dropped.append(partition.name)
+        result.deleted += sum(counts.values())
+        for notification_type, count in counts.items():
+            result.by_type[notification_type] = result.by_type.get(notification_type, 0) + count
+    return dropped_until
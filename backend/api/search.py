@@ -0,0 +1,112 @@
+import re
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from rest_framework import filters
+
+# Matches either a "quoted phrase" or a single bare term
+TOKEN_RE = re.compile(r'"([^"]*)"|(\S+)')
+WORD_RE = re.compile(r'\w+')
+
+
+def post_search_vector():
+    """Weighted search document for posts; must match the GIN index in the migrations"""
+    return (SearchVector('title', weight='A', config=settings.SEARCH_CONFIG)
+            + SearchVector('body', weight='B', config=settings.SEARCH_CONFIG))
+
+
+def comment_search_vector():
+    """Search document for comments; must match the GIN index in the migrations"""
+    return SearchVector('body', config=settings.SEARCH_CONFIG)
+
+
+def build_tsquery(text):
+    """
+    Translate a user search string into raw ``tsquery`` syntax.
+
+    Bare terms are ANDed together, ``"quoted phrases"`` must appear in order,
+    a trailing ``*`` makes a prefix match, a leading ``-`` excludes the term
+    and ``OR`` between two terms matches either of them. Only word characters
+    are copied from the input, so the result is always a valid query.
+    Returns ``None`` when the input contains no searchable words.
+    """
+    clauses = []
+    pending_or = False
+    for phrase, term in TOKEN_RE.findall(text):
+        if term == 'OR':
+            pending_or = bool(clauses)
+            continue
+
+        negate = prefix = False
+        if term:
+            negate = term.startswith('-')
+            prefix = term.endswith('*')
+            words = WORD_RE.findall(term)
+        else:
+            words = WORD_RE.findall(phrase)
+        if not words:
+            continue
+
+        if prefix:
+            words[-1] += ':*'
+        clause = ' <-> '.join(words)
+        if len(words) > 1:
+            clause = f'({clause})'
+        if negate:
+            clause = f'!{clause}'
+
+        if pending_or:
+            clauses[-1] = f'({clauses[-1]} | {clause})'
+            pending_or = False
+        else:
+            clauses.append(clause)
+
+    if not clauses:
+        return None
+    return ' & '.join(clauses)
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Routes ``?search=`` to PostgreSQL full-text search and orders matches by rank.
+
+    The view declares its search document through ``search_vector`` (a callable
+    returning the expression used by the GIN index) and, optionally, the field
+    used for ``?highlight=true`` snippets through ``search_highlight_field``.
+    On other databases the stock ``SearchFilter`` over ``search_fields`` is used.
+    """
+    highlight_param = 'highlight'
+
+    def filter_queryset(self, request, queryset, view):
+        get_vector = getattr(view, 'search_vector', None)
+        if get_vector is None or connections[queryset.db].vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+
+        text = request.query_params.get(self.search_param, '')
+        if not text.strip():
+            return queryset
+
+        raw_query = build_tsquery(text)
+        if raw_query is None:
+            return queryset.none()
+
+        query = SearchQuery(raw_query, search_type='raw', config=settings.SEARCH_CONFIG)
+        vector = get_vector()
+        queryset = queryset.alias(search_document=vector).filter(search_document=query).annotate(
+            search_rank=SearchRank(vector, query),
+        ).order_by('-search_rank', '-id')
+
+        highlight_field = getattr(view, 'search_highlight_field', None)
+        if highlight_field and self.wants_highlight(request):
+            queryset = queryset.annotate(search_highlight=SearchHeadline(
+                highlight_field,
+                query,
+                config=settings.SEARCH_CONFIG,
+                start_sel='<mark>',
+                stop_sel='</mark>',
+                max_fragments=2,
+            ))
+        return queryset
+
+    def wants_highlight(self, request):
+        return request.query_params.get(self.highlight_param, '').lower() in ('1', 'true', 'yes')
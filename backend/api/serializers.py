@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import User, Subreddit, Post, Comment, Notification, Subscription, Keyword, CrawlHistory
+from .comment_tree import get_comment_tree
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -35,13 +36,46 @@ class SubredditSerializer(serializers.ModelSerializer):
     """Serializer for the Subreddit model"""
     class Meta:
         model = Subreddit
-        fields = ('id', 'name', 'description', 'created_at', 'updated_at')
-        read_only_fields = ('created_at', 'updated_at')
+        fields = ('id', 'name', 'description', 'posts_count', 'last_post_at', 'max_upvotes',
+                  'created_at', 'updated_at')
+        read_only_fields = ('posts_count', 'last_post_at', 'max_upvotes', 'created_at', 'updated_at')
+
+
+class SparseFieldsMixin:
+    """
+    Takes the names of the fields to output as a ``fields`` argument, so that
+    views can serve ``?fields=`` / ``?omit=`` (see api/fieldsets.py). Nested
+    serializers are created without it and keep all their fields.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.selected_fields = fields
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.selected_fields is None:
+            return fields
+        return {name: field for name, field in fields.items() if field.write_only or name in self.selected_fields}
+
 
+class SearchResultMixin:
+    """Adds the rank and highlighted snippet of full-text search results when present"""
+    search_attributes = ('search_rank', 'search_highlight')
 
-class CommentSerializer(serializers.ModelSerializer):
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        for attribute in self.search_attributes:
+            if hasattr(instance, attribute):
+                data[attribute] = getattr(instance, attribute)
+        return data
+
+
+class CommentSerializer(SparseFieldsMixin, SearchResultMixin, serializers.ModelSerializer):
     """Serializer for the Comment model"""
     replies = serializers.SerializerMethodField()
+    # Columns read by fields that are not model fields (see api/fieldsets.py)
+    field_columns = {'replies': ()}
 
     class Meta:
         model = Comment
@@ -50,8 +84,12 @@ class CommentSerializer(serializers.ModelSerializer):
         read_only_fields = ('created_at', 'updated_at')
 
     def get_replies(self, obj):
-        # Only get direct replies, not nested ones
-        replies = Comment.objects.filter(parent_comment=obj.id)
+        # Comments that come from a prebuilt tree carry their nested replies already
+        if hasattr(obj, 'tree_replies'):
+            return CommentSerializer(obj.tree_replies, many=True, context=self.context).data
+
+        # Otherwise only get direct replies, not nested ones
+        replies = obj.replies.all()
         return CommentBasicSerializer(replies, many=True).data
 
 
@@ -64,10 +102,11 @@ class CommentBasicSerializer(serializers.ModelSerializer):
         read_only_fields = ('created_at', 'updated_at')
 
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(SparseFieldsMixin, SearchResultMixin, serializers.ModelSerializer):
     """Serializer for the Post model"""
     comments = serializers.SerializerMethodField()
     subreddit_name = serializers.CharField(read_only=True)
+    field_columns = {'comments': ()}
 
     class Meta:
         model = Post
@@ -77,12 +116,15 @@ class PostSerializer(serializers.ModelSerializer):
         read_only_fields = ('created_at', 'updated_at', 'subreddit_name')
 
     def get_comments(self, obj):
-        # Only get top-level comments (no parent)
-        comments = Comment.objects.filter(post=obj.id, parent_comment=None)
-        return CommentSerializer(comments, many=True).data
+        # Top-level comments with the whole reply tree, fetched in one query
+        # (async views fetch it beforehand and pass it in the context)
+        comments = self.context.get('comment_tree')
+        if comments is None:
+            comments = get_comment_tree(obj)
+        return CommentSerializer(comments, many=True, context=self.context).data
 
 
-class PostListSerializer(serializers.ModelSerializer):
+class PostListSerializer(SparseFieldsMixin, SearchResultMixin, serializers.ModelSerializer):
     """Simplified serializer for Post model for list views"""
     subreddit_name = serializers.CharField(read_only=True)
 
@@ -94,13 +136,23 @@ class PostListSerializer(serializers.ModelSerializer):
         read_only_fields = ('created_at', 'subreddit_name')
 
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for the Notification model"""
     class Meta:
         model = Notification
         fields = ('id', 'user', 'type', 'content', 'read_status', 'created_at', 'updated_at')
         read_only_fields = ('created_at', 'updated_at')
 
+    def to_representation(self, instance):
+        return self.represent_row(super().to_representation(instance), instance)
+
+    def represent_row(self, data, instance):
+        # Notifications under the user's "read up to" watermark are read whatever their read_status
+        read_up_to = self.context.get('notifications_read_up_to')
+        if read_up_to is not None and 'read_status' in data and instance.id <= read_up_to:
+            data['read_status'] = True
+        return data
+
 
 class SubscriptionSerializer(serializers.ModelSerializer):
     """Serializer for the Subscription model"""
@@ -1,9 +1,15 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
 from django.conf import settings
 from rest_framework.authtoken.models import Token
-from .models import Post, Notification, User, Subscription
-import datetime
+from .models import Post, Comment, Subreddit, Subscription, Keyword, Notification
+from .notifications import queue_new_post_notification, add_unread, get_notification_state, is_unread
+from .keywords import matcher_cache, record_model_matches, schedule_keyword_sync
+from .tasks import defer
+from . import caching, counters
+from .entitlements import invalidate_entitlements, refresh_membership
+from .authentication import token_cache
+from .realtime import notification_event, publish, user_channel
 
 # Create authentication token for each new user
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
@@ -11,43 +17,127 @@ def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
         Token.objects.create(user=instance)
 
-# Update subreddit_name when a post is saved/updated
+# Update subreddit_name when a post is saved/updated, or moved to another subreddit
 @receiver(pre_save, sender=Post)
 def set_subreddit_name(sender, instance, **kwargs):
-    if instance.subreddit and not instance.subreddit_name:
+    moved = not instance._state.adding and 'subreddit_id' in instance.changed_fields()
+    if instance.subreddit_id and (not instance.subreddit_name or moved):
         instance.subreddit_name = instance.subreddit.name
 
 # Create notifications for new posts
 @receiver(post_save, sender=Post)
 def create_post_notification(sender, instance, created, **kwargs):
     if created:
-        # Notify premium users about new posts
-        premium_users = User.objects.filter(membership_status='Premium')
-        for user in premium_users:
-            Notification.objects.create(
-                user=user,
-                type='New Post',
-                content=f'A new post has been added: "{instance.title}"',
-                read_status=False
-            )
+        # Notify premium users in bulk once the transaction commits
+        queue_new_post_notification(instance)
+
+# Recompile the keyword matcher and resync stored matches when keywords change
+# (edits that leave the phrase and active flag alone, e.g. to the description, do not)
+@receiver(post_save, sender=Keyword)
+def keyword_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or instance.changed_fields(update_fields):
+        matcher_cache.invalidate()
+        schedule_keyword_sync([instance.pk], instance.active)
+
+@receiver(post_delete, sender=Keyword)
+def keyword_deleted(sender, instance, **kwargs):
+    matcher_cache.invalidate()
+    schedule_keyword_sync([instance.pk], False)
+
+# Match posts and comments saved one by one (crawls record their matches in bulk)
+@receiver(post_save, sender=Post)
+def match_post_keywords(sender, instance, **kwargs):
+    defer(record_model_matches, Post._meta.label, [(instance.pk, instance.title, instance.body)])
+
+@receiver(post_save, sender=Comment)
+def match_comment_keywords(sender, instance, **kwargs):
+    defer(record_model_matches, Comment._meta.label, [(instance.pk, instance.body)])
+
+# Keep unread notification counters up to date and push new notifications
+# (the bulk fan-out does both itself)
+@receiver(post_save, sender=Notification)
+def count_new_notification(sender, instance, created, **kwargs):
+    if created and not instance.read_status:
+        add_unread([instance.user_id])
+    if created:
+        publish([(user_channel(instance.user_id), notification_event(instance))])
+
+@receiver(post_delete, sender=Notification)
+def count_deleted_notification(sender, instance, **kwargs):
+    if is_unread(instance, get_notification_state(instance.user_id)['read_up_to']):
+        add_unread([instance.user_id], -1)
+
+# Keep the denormalised post/comment counters up to date
+# (edits that leave the subreddit, upvotes and submission date alone do not touch them)
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, update_fields=None, **kwargs):
+    changed = {} if created else instance.changed_fields(update_fields)
+    if not created and not changed:
+        return
+    moved = changed.get('subreddit_id') is not None
+    if moved:
+        # The previous subreddit loses the post, as it was stored there
+        previous = Post(subreddit_id=changed['subreddit_id'], upvotes=instance.upvotes,
+                        submission_date=instance.submission_date)
+        for name, value in changed.items():
+            if value is not None and name != 'subreddit_id':
+                setattr(previous, name, value)
+        counters.remove_post(previous)
+    counters.add_posts(instance.subreddit_id, delta=1 if created or moved else 0,
+                       last_post_at=instance.submission_date, max_upvotes=instance.upvotes)
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.remove_post(instance)
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.add_comments({instance.post_id: 1})
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.add_comments({instance.post_id: -1})
+
+# Invalidate cached API responses built from the changed data
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_responses(sender, **kwargs):
+    caching.invalidate_responses(caching.POSTS)
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_responses(sender, **kwargs):
+    caching.invalidate_responses(caching.COMMENTS)
+
+@receiver(post_save, sender=Subreddit)
+@receiver(post_delete, sender=Subreddit)
+def invalidate_subreddit_responses(sender, **kwargs):
+    caching.invalidate_responses(caching.SUBREDDITS)
+
+@receiver(post_save, sender=Keyword)
+@receiver(post_delete, sender=Keyword)
+def invalidate_keyword_responses(sender, **kwargs):
+    caching.invalidate_responses(caching.KEYWORDS)
 
 # Update user membership status when subscription changes
 @receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
 def update_membership_status(sender, instance, **kwargs):
-    user = instance.user
-
-    # Check if the subscription is active
-    if instance.status == 'active' and instance.expires_at and instance.expires_at > datetime.datetime.now(instance.expires_at.tzinfo):
-        user.membership_status = 'Premium'
-    else:
-        # Check if the user has any other active subscriptions
-        active_subs = Subscription.objects.filter(
-            user=user,
-            status='active',
-            expires_at__gt=datetime.datetime.now()
-        ).exclude(id=instance.id)
-
-        if not active_subs.exists():
-            user.membership_status = 'Free'
-
-    user.save()
\ No newline at end of file
+    refresh_membership(instance.user_id)
+
+# Drop the cached entitlement and authenticated user when a user is edited directly
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_user_entitlement(sender, instance, created=False, **kwargs):
+    if not created:
+        invalidate_entitlements([instance.pk])
+        token_cache.invalidate_user(instance.pk)
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.pk)
+
+# Forget revoked tokens
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    token_cache.invalidate_key(instance.key, instance.user_id)
@@ -0,0 +1,80 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+try:
+    from celery import shared_task
+except ImportError:  # pragma: no cover - deferred tasks then run in the web process's thread pool
+    shared_task = None
+
+logger = logging.getLogger('api')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the process-wide worker pool used for deferred tasks"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.DEFERRED_TASKS_WORKERS,
+                thread_name_prefix='deferred-task',
+            )
+    return _executor
+
+
+def run_task(func, *args, **kwargs):
+    """Run a deferred task, logging failures instead of raising them"""
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Deferred task %s failed', getattr(func, '__name__', func))
+    finally:
+        if settings.DEFERRED_TASKS_ASYNC:
+            close_old_connections()
+
+
+def task_path(func):
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def run_deferred(path, args, kwargs):
+    """The Celery task running a deferred function, given by its dotted path"""
+    import_string(path)(*args, **kwargs)
+
+
+if shared_task is not None:
+    # Acknowledged once done, so a task whose worker dies is delivered again
+    run_deferred = shared_task(name='api.tasks.run_deferred', acks_late=True,
+                               reject_on_worker_lost=True)(run_deferred)
+
+
+def uses_celery():
+    return bool(settings.CELERY_BROKER_URL) and shared_task is not None
+
+
+def defer(func, *args, **kwargs):
+    """
+    Run ``func`` once the current transaction commits (immediately in autocommit mode).
+
+    With a Celery broker (CELERY_BROKER_URL) the call is queued for the
+    workers, which run it at least once, even if a worker restarts; its
+    arguments must be JSON-serializable. Otherwise, with ``DEFERRED_TASKS_ASYNC``
+    enabled, it is handed to a background thread of this process and is lost
+    if the process exits first (at most once); without it, it runs inline.
+    Tasks are discarded if the transaction rolls back.
+    """
+    def submit():
+        if uses_celery():
+            run_deferred.delay(task_path(func), args, kwargs)
+        elif settings.DEFERRED_TASKS_ASYNC:
+            get_executor().submit(run_task, func, *args, **kwargs)
+        else:
+            run_task(func, *args, **kwargs)
+
+    transaction.on_commit(submit)
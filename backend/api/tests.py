@@ -1,3 +1,1506 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import tempfile
+import time
+from decimal import Decimal
+from unittest import mock, skipIf, skipUnless
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, connections
+from django.test.utils import CaptureQueriesContext
+from asgiref.sync import async_to_sync
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import resolve
+from django.utils import timezone
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from .models import (
+    Subreddit, Post, Comment, User, Notification, CrawlHistory, Keyword, PostKeywordMatch, CommentKeywordMatch,
+    Subscription, SubredditDailyStats, KeywordDailyStats
+)
+from .comment_tree import build_comment_tree
+from .search import build_tsquery
+from .notifications import coalesce_post_notifications
+from .ingestion import ingest_crawl
+from .crawler import RedditCrawler, RateLimiter, HttpResponse
+from .keywords import KeywordMatcher, get_matcher, prune_keyword_matches
+from .counters import reconcile_post_counts, reconcile_subreddit_counters
+from .entitlements import expire_memberships, get_entitlement
+from .permissions import IsPremiumUser
+from .authentication import CLOCK_SKEW, token_cache
+from . import analytics, benchmarks
+from .retention import partition_table, prune_notifications, list_partitions
+from .instrumentation import QueryBudgetExceeded, request_stats
+from .realtime import POSTS_CHANNEL, Hub, event_stream, format_event, hub
+from . import caching, export, keywords, replicas, tasks
+from .pooling import pool_stats
+from .fastpath import ValuesSerializer
+from .serializers import PostSerializer
+from .renderers import ORJSONParser, ORJSONRenderer
 
-# Create your tests here.
+TESTDATA_DIR = os.path.join(os.path.dirname(__file__), 'testdata')
+
+
+def create_thread(post, size, prefix='c'):
+    """Create a comment thread on a post: a chain of replies plus a few top-level comments"""
+    parent = None
+    for i in range(size):
+        comment = Comment.objects.create(
+            reddit_id=f'{prefix}{post.id}_{i}',
+            post=post,
+            parent_comment=parent if i % 3 else None,
+            body=f'Comment {i}',
+            author='tester',
+        )
+        parent = comment
+
+
+class CommentTreeTests(APITestCase):
+    def setUp(self):
+        self.subreddit = Subreddit.objects.create(name='forhire')
+        self.small_post = Post.objects.create(reddit_id='p1', title='Small', subreddit=self.subreddit)
+        self.large_post = Post.objects.create(reddit_id='p2', title='Large', subreddit=self.subreddit)
+        create_thread(self.small_post, 5)
+        create_thread(self.large_post, 60)
+
+    def test_post_detail_query_count_is_constant(self):
+        for post in (self.small_post, self.large_post):
+            with self.assertNumQueries(2):
+                response = self.client.get(f'/api/posts/{post.id}/')
+            self.assertEqual(response.status_code, 200)
+
+    def test_post_comments_query_count_is_constant(self):
+        for post in (self.small_post, self.large_post):
+            with self.assertNumQueries(2):
+                response = self.client.get(f'/api/posts/{post.id}/comments/')
+            self.assertEqual(response.status_code, 200)
+
+    def test_post_detail_returns_nested_replies(self):
+        response = self.client.get(f'/api/posts/{self.small_post.id}/')
+        comments = response.data['comments']
+        self.assertEqual([c['body'] for c in comments], ['Comment 0', 'Comment 3'])
+        self.assertEqual(comments[0]['replies'][0]['body'], 'Comment 1')
+        self.assertEqual(comments[0]['replies'][0]['replies'][0]['body'], 'Comment 2')
+
+    @override_settings(COMMENT_TREE_MAX_DEPTH=1, COMMENT_TREE_MAX_COMMENTS=4)
+    def test_post_detail_respects_tree_caps(self):
+        response = self.client.get(f'/api/posts/{self.small_post.id}/')
+        comments = response.data['comments']
+        self.assertEqual(len(comments), 2)
+        self.assertEqual(comments[0]['replies'][0]['replies'], [])
+
+
+class BuildCommentTreeTests(TestCase):
+    def test_orphaned_replies_are_dropped(self):
+        root = Comment(id=1, parent_comment_id=None)
+        reply = Comment(id=2, parent_comment_id=1)
+        orphan = Comment(id=3, parent_comment_id=99)
+        roots = build_comment_tree([root, reply, orphan], max_depth=5)
+        self.assertEqual(roots, [root])
+        self.assertEqual(root.tree_replies, [reply])
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        subreddit = Subreddit.objects.create(name='forhire')
+        now = timezone.now()
+        for i in range(7):
+            Post.objects.create(
+                reddit_id=f'p{i}',
+                title=f'Post {i}',
+                subreddit=subreddit,
+                upvotes=i % 3,
+                # Two posts share a date and one has none, to exercise the tie-breaker and NULLs
+                submission_date=None if i == 6 else now - datetime.timedelta(days=min(i, 4)),
+            )
+
+    def collect(self, url):
+        titles = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            titles += [post['title'] for post in response.data['results']]
+            url = response.data['next']
+        return titles
+
+    def test_cursor_walks_every_post_once(self):
+        for ordering in ('-submission_date', 'submission_date', '-upvotes', 'comments_count'):
+            titles = self.collect(f'/api/posts/?cursor=&page_size=2&ordering={ordering}')
+            self.assertEqual(sorted(titles), [f'Post {i}' for i in range(7)], ordering)
+
+    def test_cursor_matches_ordering(self):
+        titles = self.collect('/api/posts/?cursor=&page_size=3&ordering=-upvotes')
+        upvotes = [Post.objects.get(title=title).upvotes for title in titles]
+        self.assertEqual(upvotes, sorted(upvotes, reverse=True))
+
+    def test_page_number_mode_is_unchanged(self):
+        response = self.client.get('/api/posts/?page=2&page_size=5')
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_cursor_for_other_ordering_is_rejected(self):
+        response = self.client.get('/api/posts/?cursor=&page_size=2&ordering=upvotes')
+        next_url = response.data['next'].replace('ordering=upvotes', 'ordering=-upvotes')
+        self.assertEqual(self.client.get(next_url).status_code, 404)
+
+    def test_forged_cursor_is_rejected(self):
+        for ordering, value in [('-submission_date', 'garbage'), ('upvotes', 'many'), ('-upvotes', [1])]:
+            cursor = json.dumps({'o': ordering, 'v': value, 'i': 1}).encode()
+            encoded = base64.urlsafe_b64encode(cursor).decode().rstrip('=')
+            response = self.client.get(f'/api/posts/?cursor={encoded}&ordering={ordering}')
+            self.assertEqual(response.status_code, 404, (ordering, value))
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        subreddit = Subreddit.objects.create(name='forhire')
+        self.app_post = Post.objects.create(
+            reddit_id='p1', title='I would pay for an app', body='A calendar app for my team', subreddit=subreddit)
+        self.macro_post = Post.objects.create(
+            reddit_id='p2', title='Excel macro wanted', body='Someone would pay for this', subreddit=subreddit)
+
+    def search(self, term, **params):
+        response = self.client.get('/api/posts/', {'search': term, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_build_tsquery(self):
+        self.assertEqual(build_tsquery('calendar app'), 'calendar & app')
+        self.assertEqual(build_tsquery('"would pay" calend*'), '(would <-> pay) & calend:*')
+        self.assertEqual(build_tsquery('excel OR calendar -macro'), '(excel | calendar) & !macro')
+        self.assertEqual(build_tsquery("I'd"), '(I <-> d)')
+        self.assertIsNone(build_tsquery('!!! ""'))
+
+    def test_search_matches_title_and_body(self):
+        self.assertEqual([post['id'] for post in self.search('calendar')], [self.app_post.id])
+        self.assertEqual(len(self.search('pay')), 2)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Full-text search requires PostgreSQL')
+    def test_full_text_search_ranks_phrases_and_prefixes(self):
+        results = self.search('"would pay" calend*', highlight='true')
+        self.assertEqual([post['id'] for post in results], [self.app_post.id])
+        self.assertIn('<mark>calendar</mark>', results[0]['search_highlight'])
+        # Title matches are weighted above body matches
+        self.assertEqual([post['id'] for post in self.search('pay')], [self.app_post.id, self.macro_post.id])
+
+
+@override_settings(DEFERRED_TASKS_ASYNC=False, NOTIFICATION_FANOUT_BATCH_SIZE=2)
+class NewPostNotificationTests(TestCase):
+    def setUp(self):
+        self.subreddit = Subreddit.objects.create(name='forhire')
+        for i in range(5):
+            User.objects.create(username=f'premium{i}', membership_status='Premium')
+        User.objects.create(username='free')
+
+    def test_post_insert_does_not_query_premium_users(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            # The insert and the subreddit counter update, nothing about users
+            with self.assertNumQueries(2):
+                Post.objects.create(reddit_id='p1', title='New', subreddit=self.subreddit)
+        self.assertEqual(Notification.objects.count(), 0)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertFalse(Notification.objects.filter(user__username='free').exists())
+        self.assertEqual(Notification.objects.first().content, 'A new post has been added: "New"')
+
+    def test_posts_created_together_are_coalesced(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with coalesce_post_notifications():
+                for i in range(3):
+                    Post.objects.create(reddit_id=f'p{i}', title=f'Post {i}', subreddit=self.subreddit)
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertEqual(Notification.objects.first().content, '3 new posts have been added, including "Post 0"')
+
+    @override_settings(CELERY_BROKER_URL='redis://broker')
+    def test_tasks_are_queued_for_celery_workers(self):
+        Keyword.objects.create(phrase='django', active=True)
+        with mock.patch.object(tasks, 'shared_task', object()), \
+                mock.patch.object(tasks.run_deferred, 'delay', create=True) as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                Post.objects.create(reddit_id='p1', title='Django job', subreddit=self.subreddit)
+        self.assertEqual(Notification.objects.count(), 0)
+        queued = [call.args[0] for call in delay.call_args_list]
+        self.assertIn('api.notifications.fan_out_notification', queued)
+
+        # What a worker receives: the JSON-encoded arguments
+        for call in delay.call_args_list:
+            tasks.run_deferred(*json.loads(json.dumps(call.args)))
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertEqual(PostKeywordMatch.objects.count(), 1)
+
+
+@override_settings(DEFERRED_TASKS_ASYNC=False)
+class IngestionTests(APITestCase):
+    def setUp(self):
+        with open(os.path.join(TESTDATA_DIR, 'reddit_crawl.json'), encoding='utf-8') as handle:
+            self.crawl = json.load(handle)
+        User.objects.create(username='premium', membership_status='Premium')
+
+    def ingest(self, batch_size=2):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ingest_crawl(self.crawl['posts'], self.crawl['comments'],
+                                subreddit=self.crawl['subreddit'], batch_size=batch_size)
+
+    def test_ingest_fixture(self):
+        result = self.ingest()
+        self.assertEqual((result.posts_created, result.comments_created, result.comments_skipped), (3, 4, 1))
+
+        post = Post.objects.get(reddit_id='ing001')
+        self.assertEqual(post.subreddit_name, 'forhire')
+        self.assertEqual(post.upvotes, 42)
+        self.assertEqual(post.post_url, 'https://reddit.com/r/forhire/comments/ing001/id_pay_for_a_tool/')
+        self.assertEqual(Post.objects.get(reddit_id='ing003').subreddit.name, 'freelance')
+
+        # Replies listed before their parents are still linked to them
+        reply = Comment.objects.get(reddit_id='ingc003')
+        self.assertEqual(reply.parent_comment.reddit_id, 'ingc002')
+        self.assertEqual(reply.parent_comment.parent_comment.reddit_id, 'ingc001')
+        self.assertIsNone(Comment.objects.get(reddit_id='ingc001').parent_comment)
+
+        crawl = CrawlHistory.objects.get()
+        self.assertEqual((crawl.status, crawl.posts_found, crawl.comments_found), ('completed', 3, 4))
+        self.assertEqual(crawl.subreddit.name, 'forhire')
+
+        # One coalesced notification per batch of new posts
+        self.assertEqual(Notification.objects.count(), 2)
+
+    def test_reingest_updates_in_place(self):
+        self.ingest()
+        self.crawl['posts'][0]['score'] = 100
+        self.crawl['comments'][1]['body'] = 'Edited'
+        result = self.ingest(batch_size=10)
+
+        self.assertEqual((result.posts_created, result.posts_updated), (0, 3))
+        self.assertEqual((result.comments_created, result.comments_updated), (0, 4))
+        self.assertEqual(Post.objects.count(), 3)
+        self.assertEqual(Post.objects.get(reddit_id='ing001').upvotes, 100)
+        self.assertEqual(Comment.objects.get(reddit_id='ingc001').body, 'Edited')
+        self.assertEqual(Notification.objects.count(), 2)
+
+    def test_ingest_endpoint_requires_admin(self):
+        response = self.client.post('/api/ingest/', self.crawl, format='json')
+        self.assertIn(response.status_code, (401, 403))
+
+        admin = User.objects.create(username='admin', is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.post('/api/ingest/', self.crawl, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['posts_created'], 3)
+
+
+class FakeReddit:
+    """In-process stand-in for the Reddit JSON API, used as a crawler transport"""
+
+    def __init__(self, posts, comments=None, failures=None):
+        self.posts = posts
+        self.comments = comments or {}
+        # path -> list of statuses returned before the real response
+        self.failures = failures or {}
+        self.requests = []
+
+    async def get(self, url, params=None):
+        path = url.split('example.test', 1)[1]
+        self.requests.append((path, dict(params or {})))
+        failures = self.failures.get(path)
+        if failures:
+            return HttpResponse(status=failures.pop(0), headers={'retry-after': '0'})
+
+        headers = {'x-ratelimit-remaining': '100', 'x-ratelimit-reset': '60'}
+        if path.endswith('/new.json'):
+            name = path.split('/')[2]
+            page = int((params or {}).get('after') or 0)
+            posts = self.posts.get(name, [])[page:page + 2]
+            after = str(page + 2) if page + 2 < len(self.posts.get(name, [])) else None
+            children = [{'kind': 't3', 'data': post} for post in posts]
+            return HttpResponse(status=200, headers=headers, data={'data': {'children': children, 'after': after}})
+        if path.startswith('/comments/'):
+            post_id = path.split('/')[2][:-len('.json')]
+            if post_id not in self.comments:
+                return HttpResponse(status=404)
+            return HttpResponse(status=200, headers=headers, data=[{}, self.comments[post_id]])
+        return HttpResponse(status=404)
+
+
+def reddit_post(post_id, created_utc, subreddit='forhire'):
+    return {'id': post_id, 'title': f'Post {post_id}', 'selftext': '', 'score': 1,
+            'created_utc': created_utc, 'subreddit': subreddit}
+
+
+def reddit_comment(comment_id, post_id, parent_id, replies=''):
+    return {'kind': 't1', 'data': {'id': comment_id, 'link_id': f't3_{post_id}', 'parent_id': parent_id,
+                                   'body': f'Comment {comment_id}', 'score': 1, 'replies': replies}}
+
+
+class CrawlerTests(TestCase):
+    def setUp(self):
+        Subreddit.objects.create(name='forhire')
+        Subreddit.objects.create(name='freelance')
+        now = timezone.now().timestamp()
+        self.fake = FakeReddit(
+            posts={
+                'forhire': [reddit_post(f'f{i}', now - i * 600) for i in range(5)],
+                'freelance': [reddit_post('l0', now, subreddit='freelance')],
+            },
+            comments={
+                'f0': {'data': {'children': [
+                    reddit_comment('c1', 'f0', 't3_f0', replies={'data': {'children': [
+                        reddit_comment('c2', 'f0', 't1_c1'),
+                        {'kind': 'more', 'data': {}},
+                    ]}}),
+                ]}},
+            },
+        )
+
+    def crawl(self, **kwargs):
+        crawler = RedditCrawler(transport=self.fake, base_url='https://example.test', requests_per_minute=60000,
+                                backoff_base=0, **kwargs)
+        return async_to_sync(crawler.crawl)()
+
+    def test_crawl_ingests_every_subreddit(self):
+        crawls = self.crawl(crawl_comments=True)
+        self.assertEqual({crawl.status for crawl in crawls}, {'completed'})
+        self.assertEqual(Post.objects.filter(subreddit_name='forhire').count(), 5)
+        self.assertEqual(Post.objects.filter(subreddit_name='freelance').count(), 1)
+        self.assertEqual(Comment.objects.get(reddit_id='c2').parent_comment.reddit_id, 'c1')
+        self.assertEqual(CrawlHistory.objects.filter(status='completed').count(), 2)
+
+    def test_second_crawl_stops_at_cursor(self):
+        self.crawl(crawl_comments=False)
+        CrawlHistory.objects.update(start_time=timezone.now() - datetime.timedelta(minutes=5))
+        self.fake.requests.clear()
+        with override_settings(CRAWLER_CURSOR_OVERLAP=0):
+            self.crawl(crawl_comments=False)
+        # Only the first page is needed: its second post predates the last crawl
+        self.assertEqual([path for path, _ in self.fake.requests].count('/r/forhire/new.json'), 1)
+
+    def test_transient_errors_are_retried(self):
+        self.fake.failures['/r/forhire/new.json'] = [503, 429]
+        crawls = self.crawl(crawl_comments=False, max_retries=2)
+        self.assertEqual({crawl.status for crawl in crawls}, {'completed'})
+
+    def test_persistent_errors_are_recorded(self):
+        self.fake.failures['/r/forhire/new.json'] = [500, 500, 500]
+        crawls = self.crawl(crawl_comments=False, max_retries=1)
+        failed = CrawlHistory.objects.get(subreddit__name='forhire')
+        self.assertEqual(failed.status, 'failed')
+        self.assertIn('HTTP 500', failed.error_message)
+        self.assertIsNotNone(failed.end_time)
+        self.assertEqual(CrawlHistory.objects.get(subreddit__name='freelance').status, 'completed')
+
+    def test_rate_limiter_pauses_when_window_is_exhausted(self):
+        async def exhaust():
+            limiter = RateLimiter(rate=100)
+            loop = asyncio.get_running_loop()
+            limiter.update_from_headers({'x-ratelimit-remaining': '0', 'x-ratelimit-reset': '0.2'})
+            start = loop.time()
+            await limiter.acquire()
+            return loop.time() - start
+        self.assertGreaterEqual(asyncio.run(exhaust()), 0.15)
+
+
+class KeywordMatcherTests(TestCase):
+    def test_matches_overlapping_phrases_with_original_offsets(self):
+        matcher = KeywordMatcher({1: "I'd pay", 2: 'pay for', 3: 'would pay for this'})
+        text = 'Honestly  I’D PAY for this, I would\npay for this tool'
+        matches = matcher.find(text)
+        self.assertEqual(sorted((match.keyword_id, text[match.start:match.end]) for match in matches), [
+            (1, 'I’D PAY'), (2, 'PAY for'), (2, 'pay for'), (3, 'would\npay for this'),
+        ])
+
+    def test_only_whole_words_match(self):
+        matcher = KeywordMatcher({1: 'app', 2: 'pay'})
+        self.assertEqual(matcher.matched_ids('an apple a day, repay it'), set())
+        self.assertEqual(matcher.matched_ids('need an app!', None, ''), {1})
+
+    def test_cache_follows_keyword_changes(self):
+        keyword = Keyword.objects.create(phrase='take my money')
+        self.assertEqual(get_matcher().matched_ids('Shut up and take my money'), {keyword.id})
+        keyword.active = False
+        keyword.save()
+        self.assertEqual(len(get_matcher()), 0)
+
+
+@override_settings(DEFERRED_TASKS_ASYNC=False)
+class KeywordMatchIndexTests(APITestCase):
+    def setUp(self):
+        with open(os.path.join(TESTDATA_DIR, 'reddit_crawl.json'), encoding='utf-8') as handle:
+            self.crawl = json.load(handle)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.keyword = Keyword.objects.create(phrase='would pay for')
+
+    def ingest(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return ingest_crawl(self.crawl['posts'], self.crawl['comments'], subreddit=self.crawl['subreddit'])
+
+    def filter_posts(self, keyword):
+        response = self.client.get('/api/posts/', {'keyword': keyword.id})
+        return [post['reddit_id'] for post in response.data['results']]
+
+    def test_ingestion_records_matches(self):
+        result = self.ingest()
+        self.assertEqual(result.keyword_matches, 2)
+        self.assertEqual(self.filter_posts(self.keyword), ['ing003'])
+        response = self.client.get('/api/comments/', {'keyword': self.keyword.id})
+        self.assertEqual([comment['reddit_id'] for comment in response.data['results']], ['ingc001'])
+
+    def test_new_keyword_is_backfilled_and_counted(self):
+        self.ingest()
+        with self.captureOnCommitCallbacks(execute=True):
+            keyword = Keyword.objects.create(phrase="I'd pay")
+        self.assertEqual(self.filter_posts(keyword), ['ing001'])
+
+        admin = User.objects.create_user(username='admin', password='pass', is_staff=True)
+        self.client.force_authenticate(admin)
+        response = self.client.get('/api/keywords/counts/')
+        self.assertEqual({row['phrase']: (row['posts'], row['comments']) for row in response.data},
+                         {"I'd pay": (1, 0), 'would pay for': (1, 1)})
+
+    def test_deactivated_keyword_is_hidden_then_pruned(self):
+        self.ingest()
+        self.keyword.active = False
+        self.keyword.save()
+        self.assertEqual(self.filter_posts(self.keyword), [])
+        self.assertEqual(PostKeywordMatch.objects.count(), 1)
+        self.assertEqual(prune_keyword_matches(), 2)
+        self.assertFalse(PostKeywordMatch.objects.exists())
+
+    def test_only_phrase_and_active_edits_rescan(self):
+        with mock.patch('api.keywords.rescan_keyword') as rescan_keyword:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.keyword.description = 'Buyers'
+                self.keyword.save()
+                keyword = Keyword.objects.get(pk=self.keyword.pk)
+                keyword.description = 'Buyers with a budget'
+                keyword.save(update_fields=['description'])
+            rescan_keyword.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                keyword.phrase = 'would pay'
+                keyword.save()
+            rescan_keyword.assert_called_once_with(keyword.pk)
+
+    def test_match_keywords_command_scans_each_chunk_once(self):
+        self.ingest()
+        PostKeywordMatch.objects.all().delete()
+        out = io.StringIO()
+        with mock.patch('api.keywords.match_rows', wraps=keywords.match_rows) as match_rows:
+            call_command('match_keywords', '--store', stdout=out)
+        # One chunk of posts and one of comments
+        self.assertEqual(match_rows.call_count, 2)
+        self.assertIn("'would pay for': 1 posts, 1 comments", out.getvalue())
+        self.assertEqual(PostKeywordMatch.objects.count(), 1)
+
+
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.subreddit = Subreddit.objects.create(name='forhire')
+        self.post = Post.objects.create(reddit_id='cache1', title='Cached post', subreddit=self.subreddit)
+
+    def test_responses_are_cached_per_normalised_query(self):
+        first = self.client.get('/api/posts/?ordering=-upvotes&page=1')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        second = self.client.get('/api/posts/?page=1&ordering=-upvotes&search=')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(self.client.get('/api/posts/?ordering=upvotes')['X-Cache'], 'MISS')
+
+    def test_saving_a_model_invalidates_dependent_views(self):
+        self.client.get('/api/posts/')
+        self.client.get('/api/subreddits/')
+        Comment.objects.create(reddit_id='cache1c', post=self.post, body='Nice')
+        # Posts embed comment data, subreddits do not
+        self.assertEqual(self.client.get('/api/posts/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/subreddits/')['X-Cache'], 'HIT')
+
+        Post.objects.create(reddit_id='cache2', title='Another post', subreddit=self.subreddit)
+        response = self.client.get('/api/posts/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['count'], 2)
+
+    def test_etag_revalidation(self):
+        etag = self.client.get(f'/api/posts/{self.post.id}/')['ETag']
+        response = self.client.get(f'/api/posts/{self.post.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.post.title = 'Edited'
+        self.post.save()
+        response = self.client.get(f'/api/posts/{self.post.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.subreddit = Subreddit.objects.create(name='forhire')
+        self.now = timezone.now()
+
+    def create_post(self, reddit_id, upvotes=0, hours_ago=0):
+        return Post.objects.create(reddit_id=reddit_id, title=reddit_id, subreddit=self.subreddit, upvotes=upvotes,
+                                   submission_date=self.now - datetime.timedelta(hours=hours_ago))
+
+    def test_counters_follow_inserts_and_deletes(self):
+        newest = self.create_post('c1', upvotes=5)
+        top = self.create_post('c2', upvotes=50, hours_ago=2)
+        comment = Comment.objects.create(reddit_id='cc1', post=top, body='first')
+        Comment.objects.create(reddit_id='cc2', post=top, parent_comment=comment, body='reply')
+
+        self.subreddit.refresh_from_db()
+        self.assertEqual((self.subreddit.posts_count, self.subreddit.last_post_at, self.subreddit.max_upvotes),
+                         (2, newest.submission_date, 50))
+        top.refresh_from_db()
+        self.assertEqual(top.comments_count, 2)
+
+        # Deleting a comment cascades to its reply
+        comment.delete()
+        top.refresh_from_db()
+        self.assertEqual(top.comments_count, 0)
+
+        top.delete()
+        newest.delete()
+        self.subreddit.refresh_from_db()
+        self.assertEqual((self.subreddit.posts_count, self.subreddit.last_post_at, self.subreddit.max_upvotes),
+                         (0, None, 0))
+
+    def test_moving_a_post_updates_both_subreddits(self):
+        other = Subreddit.objects.create(name='slavelabour')
+        self.create_post('c1', upvotes=5)
+        post = self.create_post('c2', upvotes=50, hours_ago=2)
+
+        # Edits that leave the counted fields alone do not touch the subreddits
+        post.title = 'Edited'
+        with self.assertNumQueries(1):
+            post.save()
+
+        post = Post.objects.get(pk=post.pk)
+        post.subreddit = other
+        post.save()
+        self.subreddit.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.subreddit.posts_count, self.subreddit.max_upvotes), (1, 5))
+        self.assertEqual((other.posts_count, other.max_upvotes, other.last_post_at), (1, 50, post.submission_date))
+        self.assertEqual(Post.objects.get(pk=post.pk).subreddit_name, 'slavelabour')
+        self.assertEqual(reconcile_subreddit_counters(), 0)
+
+    def test_ingestion_counts_stored_comments_and_reconcile_fixes_drift(self):
+        with open(os.path.join(TESTDATA_DIR, 'reddit_crawl.json'), encoding='utf-8') as handle:
+            crawl = json.load(handle)
+        ingest_crawl(crawl['posts'], crawl['comments'], subreddit=crawl['subreddit'], batch_size=2)
+        ingest_crawl(crawl['posts'], crawl['comments'], subreddit=crawl['subreddit'], batch_size=2)
+        self.assertEqual(Post.objects.get(reddit_id='ing001').comments_count, 3)
+        self.subreddit.refresh_from_db()
+        self.assertEqual(self.subreddit.posts_count, 2)
+
+        Post.objects.update(comments_count=99)
+        Subreddit.objects.update(posts_count=0)
+        self.assertEqual(reconcile_post_counts(batch_size=2), 3)
+        self.assertEqual(reconcile_subreddit_counters(batch_size=1), 2)
+        self.assertEqual(Post.objects.get(reddit_id='ing001').comments_count, 3)
+        self.assertEqual(Subreddit.objects.get(name='freelance').posts_count, 1)
+
+    def test_subreddit_serializer_exposes_counters_without_queries(self):
+        self.create_post('c1', upvotes=7)
+        response = self.client.get('/api/subreddits/')
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/subreddits/?page=1&search=for')
+        self.assertEqual(response.data['results'][0]['posts_count'], 1)
+        self.assertEqual(response.data['results'][0]['max_upvotes'], 7)
+
+
+class EntitlementTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='member')
+        self.now = timezone.now()
+
+    def subscribe(self, user, days):
+        return Subscription.objects.create(user=user, status='active',
+                                           expires_at=self.now + datetime.timedelta(days=days))
+
+    def is_premium(self, user):
+        request = type('Request', (), {'user': user})()
+        return IsPremiumUser().has_permission(request, None)
+
+    def test_subscription_changes_update_membership_and_cached_entitlement(self):
+        self.assertFalse(self.is_premium(User.objects.get(pk=self.user.pk)))
+        subscription = self.subscribe(self.user, days=30)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.membership_status, 'Premium')
+        self.assertTrue(self.is_premium(user))
+        # Later requests are answered from the cache
+        with self.assertNumQueries(0):
+            self.assertTrue(self.is_premium(User(pk=self.user.pk, membership_status='Premium')))
+
+        subscription.delete()
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.membership_status, 'Free')
+        self.assertFalse(self.is_premium(user))
+
+    def test_expired_subscription_is_refused_before_the_sweep(self):
+        subscription = self.subscribe(self.user, days=30)
+        Subscription.objects.filter(pk=subscription.pk).update(expires_at=self.now - datetime.timedelta(days=1))
+        cache.clear()
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(user.membership_status, 'Premium')
+        self.assertFalse(get_entitlement(user).is_premium)
+
+    def test_expiry_sweep_downgrades_in_batches(self):
+        lapsed = [User.objects.create(username=f'lapsed{i}') for i in range(3)]
+        for user in lapsed:
+            subscription = self.subscribe(user, days=30)
+            Subscription.objects.filter(pk=subscription.pk).update(expires_at=self.now - datetime.timedelta(days=1))
+        self.subscribe(self.user, days=30)
+        granted = User.objects.create(username='granted', membership_status='Premium')
+
+        self.assertEqual(expire_memberships(batch_size=2), 3)
+        self.assertEqual(set(User.objects.filter(membership_status='Premium').values_list('username', flat=True)),
+                         {'member', 'granted'})
+        self.assertTrue(get_entitlement(granted).is_premium)
+
+    def test_membership_changes_reach_token_authenticated_requests(self):
+        token_cache.clear()
+        headers = {'HTTP_AUTHORIZATION': f'Token {self.user.auth_token.key}'}
+        subscription = self.subscribe(self.user, days=30)
+        self.assertEqual(self.client.get('/api/me/', **headers).data['membership_status'], 'Premium')
+
+        Subscription.objects.filter(pk=subscription.pk).update(expires_at=self.now - datetime.timedelta(days=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(expire_memberships(), 1)
+        self.assertEqual(self.client.get('/api/me/', **headers).data['membership_status'], 'Free')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subscribe(self.user, days=30)
+        self.assertEqual(self.client.get('/api/me/', **headers).data['membership_status'], 'Premium')
+
+
+class TokenCacheTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', password='pass')
+        self.token = self.user.auth_token
+
+    def get_me(self, keyword='Token'):
+        return self.client.get('/api/me/', HTTP_AUTHORIZATION=f'{keyword} {self.token.key}')
+
+    def test_repeat_requests_skip_the_token_query(self):
+        self.assertEqual(self.get_me().status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.get_me(keyword='Bearer')
+        self.assertEqual(response.data['username'], 'reader')
+        self.assertEqual((token_cache.stats()['hits'], token_cache.stats()['misses']), (1, 1))
+
+    def test_revoked_tokens_and_deactivated_users_are_refused(self):
+        self.get_me()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get_me().status_code, 403)
+
+        self.user.is_active = True
+        self.user.save()
+        self.get_me()
+        self.token.delete()
+        self.assertEqual(self.get_me().status_code, 403)
+
+    def test_revocations_reach_other_processes(self):
+        other_process = type(token_cache)(max_size=10, ttl=60)
+        other_process.set(self.token.key, self.token, time.time() - 5)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertIsNone(other_process.get(self.token.key))
+
+        # Entries looked up after the change are served
+        other_process.set(self.token.key, self.token, time.time() + CLOCK_SKEW + 1)
+        self.assertEqual(other_process.get(self.token.key), self.token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assertIsNone(other_process.get(self.token.key))
+
+    def test_lru_eviction(self):
+        cache = type(token_cache)(max_size=2, ttl=60)
+        tokens = [User.objects.create(username=f'lru{i}').auth_token for i in range(3)]
+        for token in tokens:
+            cache.set(token.key, token)
+        self.assertIsNone(cache.get(tokens[0].key))
+        self.assertEqual(cache.get(tokens[2].key), tokens[2])
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+
+@override_settings(DEFERRED_TASKS_ASYNC=False)
+class UnreadNotificationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='reader', membership_status='Premium')
+        self.client.force_authenticate(self.user)
+        subreddit = Subreddit.objects.create(name='forhire')
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                Post.objects.create(reddit_id=f'n{i}', title=f'Post {i}', subreddit=subreddit)
+
+    def unread(self):
+        return self.client.get('/api/notifications/unread-count/').data['unread']
+
+    def test_counter_follows_fan_out_and_reads(self):
+        self.assertEqual(self.unread(), 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.unread(), 3)
+
+        first = Notification.objects.filter(user=self.user).order_by('id').first()
+        self.client.post(f'/api/notifications/{first.id}/mark_read/')
+        self.client.post(f'/api/notifications/{first.id}/mark_read/')
+        self.assertEqual(self.unread(), 2)
+
+        self.client.post('/api/notifications/mark_all_read/')
+        self.assertEqual(self.unread(), 0)
+        # The rows are untouched; the watermark makes them read
+        self.assertEqual(Notification.objects.filter(read_status=False).count(), 2)
+        response = self.client.get('/api/notifications/')
+        self.assertEqual({item['read_status'] for item in response.data['results']}, {True})
+        self.assertEqual(self.client.get('/api/notifications/?unread=true').data['count'], 0)
+
+        Notification.objects.create(user=self.user, type='Test', content='New')
+        self.assertEqual(self.unread(), 1)
+
+    def test_admin_actions_keep_counters_in_sync(self):
+        self.client.force_login(User.objects.create_superuser(username='root', password='x', email='root@example.com'))
+        ids = list(Notification.objects.filter(user=self.user).order_by('id').values_list('id', flat=True))
+
+        def run(action, selected):
+            # From a changelist filtered on read_status, which the update empties
+            response = self.client.post('/admin/api/notification/?read_status__exact=0',
+                                        {'action': action, '_selected_action': selected})
+            self.assertEqual(response.status_code, 302)
+
+        run('mark_as_read', ids[:1])
+        self.assertEqual(self.unread(), 2)
+
+        # Under the watermark, marking unread lowers it without unreading the others
+        self.client.post('/api/notifications/mark_all_read/')
+        run('mark_as_unread', ids[1:2])
+        self.assertEqual(self.unread(), 1)
+        response = self.client.get('/api/notifications/')
+        self.assertEqual({item['id']: item['read_status'] for item in response.data['results']},
+                         {ids[0]: True, ids[1]: False, ids[2]: True})
+
+    def test_poll_returns_only_newer_notifications(self):
+        response = self.client.get('/api/notifications/poll/?since=0')
+        ids = [item['id'] for item in response.data['notifications']]
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(response.data['latest_id'], ids[-1])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/notifications/poll/?since={ids[-1]}')
+        self.assertEqual((response.data['unread'], response.data['notifications']), (3, []))
+
+
+@override_settings(REALTIME_HEARTBEAT=1, REALTIME_RETRY_MS=1000)
+class RealtimeTests(TestCase):
+    def test_format_event(self):
+        frame = format_event({'event': 'post', 'id': 7, 'title': 'Hi'})
+        self.assertEqual(frame, 'id: post-7\nevent: post\ndata: {"id": 7, "title": "Hi"}\n\n')
+
+    def test_dispatch_and_overflow(self):
+        async def scenario():
+            hub = Hub()
+            subscriber = hub.subscribe([POSTS_CHANNEL], queue_size=2)
+            hub.dispatch([('user:1', {'event': 'notification', 'id': 1})])
+            hub.dispatch([(POSTS_CHANNEL, {'event': 'post', 'id': i}) for i in range(3)])
+            return hub, subscriber
+
+        local_hub, subscriber = async_to_sync(scenario)()
+        self.assertTrue(subscriber.overflowed)
+        self.assertEqual(subscriber.queue.qsize(), 2)
+        self.assertEqual(local_hub.connections, 1)
+
+    def test_stream_delivers_published_posts(self):
+        async def scenario():
+            subscriber = hub.subscribe([POSTS_CHANNEL])
+            stream = event_stream(subscriber)
+            frames = [await stream.__anext__()]
+            hub.dispatch_threadsafe([(POSTS_CHANNEL, {'event': 'post', 'id': 1})])
+            frames.append(await stream.__anext__())
+            frames.append(await stream.__anext__())
+            await stream.aclose()
+            return frames
+
+        frames = async_to_sync(scenario)()
+        self.assertEqual(frames[0], 'retry: 1000\n\n')
+        self.assertTrue(frames[1].startswith('id: post-1\nevent: post'))
+        self.assertEqual(frames[2], ': keepalive\n\n')
+        self.assertEqual(hub.connections, 0)
+
+
+@override_settings(NOTIFICATION_RETENTION_DAYS=90, NOTIFICATION_RETENTION_DAYS_BY_TYPE={'New Post': 30},
+                   NOTIFICATION_RETENTION_BATCH_SIZE=2)
+class NotificationRetentionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='keeper')
+        self.now = timezone.now()
+        for days, notification_type in [(10, 'New Post'), (40, 'New Post'), (45, 'New Post'),
+                                        (40, 'Billing'), (130, 'Billing')]:
+            notification = Notification.objects.create(user=self.user, type=notification_type, content=str(days))
+            Notification.objects.filter(pk=notification.pk).update(
+                created_at=self.now - datetime.timedelta(days=days))
+
+    def test_prunes_expired_rows_by_type_and_archives_them(self):
+        self.assertEqual(User.objects.get(pk=self.user.pk).unread_notifications, 5)
+        dry_run = prune_notifications(now=self.now, dry_run=True)
+        self.assertEqual((dry_run.deleted, Notification.objects.count()), (3, 5))
+
+        with tempfile.TemporaryDirectory() as directory:
+            result = prune_notifications(now=self.now, archive_dir=directory)
+            with gzip.open(result.archive_path, 'rt') as archive:
+                archived = [json.loads(line) for line in archive]
+
+        self.assertEqual((result.deleted, result.archived, result.batches), (3, 3, 2))
+        self.assertEqual(result.by_type, {'New Post': 2, 'Billing': 1})
+        self.assertEqual(sorted(row['content'] for row in archived), ['130', '40', '45'])
+        self.assertEqual(sorted(Notification.objects.values_list('content', flat=True)), ['10', '40'])
+        self.assertEqual(User.objects.get(pk=self.user.pk).unread_notifications, 2)
+
+    @skipIf(connection.vendor == 'postgresql', 'Checks the error on other databases')
+    def test_partitioning_requires_postgresql(self):
+        with self.assertRaises(ValueError):
+            partition_table()
+        with self.assertRaises(CommandError):
+            call_command('partition_notifications', '--convert')
+
+    @skipUnless(connection.vendor == 'postgresql', 'Partitioning requires PostgreSQL')
+    def test_partitioned_table_drops_expired_partitions(self):
+        partition_table(months_ahead=1, now=self.now)
+        self.assertEqual(Notification.objects.count(), 5)
+        Notification.objects.create(user=self.user, type='Billing', content='after conversion')
+
+        # Everything older than 90 days has expired whatever its type
+        result = prune_notifications(now=self.now)
+        self.assertEqual(len(result.partitions_dropped), 1)
+        self.assertEqual(result.deleted, 3)
+        self.assertEqual(sorted(Notification.objects.values_list('content', flat=True)),
+                         ['10', '40', 'after conversion'])
+        self.assertTrue(all(partition.end > self.now - datetime.timedelta(days=90)
+                            for partition in list_partitions()))
+
+
+class ExportTests(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create(username='analyst'))
+        forhire = Subreddit.objects.create(name='forhire')
+        other = Subreddit.objects.create(name='other')
+        base = timezone.now() - datetime.timedelta(days=10)
+        self.posts = [
+            Post.objects.create(reddit_id=f'e{i}', title=f'Post {i}', subreddit=forhire if i % 2 else other,
+                                subreddit_name='forhire' if i % 2 else 'other',
+                                submission_date=base + datetime.timedelta(days=i))
+            for i in range(6)
+        ]
+        Comment.objects.create(reddit_id='ec1', post=self.posts[1], body='Hello, "world"\nagain')
+
+    def export(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_ndjson_export_filters_and_resumes(self):
+        body = self.export('/api/export/posts/?subreddit_name=forhire')
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([row['reddit_id'] for row in rows], ['e1', 'e3', 'e5'])
+
+        since = self.posts[2].submission_date.isoformat().replace('+00:00', 'Z')
+        body = self.export(f'/api/export/posts/?since={since}&after_id={self.posts[3].id}')
+        self.assertEqual([json.loads(line)['reddit_id'] for line in body.decode().splitlines()], ['e4', 'e5'])
+
+    def test_gzipped_csv_export(self):
+        body = self.export('/api/export/comments/?output=csv&subreddit_name=forhire', HTTP_ACCEPT_ENCODING='gzip')
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(body).decode())))
+        self.assertEqual([(row['reddit_id'], row['body']) for row in rows], [('ec1', 'Hello, "world"\nagain')])
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_asgi_export_is_streamed(self):
+        token, _ = Token.objects.get_or_create(user=User.objects.create(username='streamer'))
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/api/export/posts/', 'query_string': b'',
+            'headers': [(b'host', b'testserver'), (b'authorization', f'Token {token.key}'.encode())],
+        }
+        rows_read, bodies, messages = [], [], [{'type': 'http.request', 'body': b''}]
+        read_rows = export.iter_rows
+
+        def counted_rows(queryset, chunk_size=None):
+            for row in read_rows(queryset, chunk_size):
+                rows_read.append(row)
+                yield row
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.body' and message.get('body'):
+                bodies.append((len(rows_read), message['body']))
+
+        # As the test client does: closing the connection would end the test's transaction
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        with mock.patch.object(export, 'iter_rows', counted_rows):
+            async_to_sync(ASGIHandler())(scope, receive, send)
+
+        # Each chunk is sent once its rows are read, before the next ones are
+        self.assertEqual([read for read, _ in bodies], [2, 4, 6])
+        lines = b''.join(body for _, body in bodies).decode().splitlines()
+        self.assertEqual([json.loads(line)['reddit_id'] for line in lines], [f'e{i}' for i in range(6)])
+
+    def test_rejects_unknown_dataset_and_output(self):
+        self.assertEqual(self.client.get('/api/export/users/').status_code, 400)
+        self.assertEqual(self.client.get('/api/export/posts/?output=xml').status_code, 400)
+
+
+@override_settings(STATS_WATERMARK_OVERLAP=0)
+class AnalyticsTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        self.subreddit = Subreddit.objects.create(name='forhire')
+        self.keyword = Keyword.objects.create(phrase='would pay')
+        self.day = datetime.datetime(2026, 3, 1, 12, tzinfo=datetime.timezone.utc)
+        self.posts = [
+            Post.objects.create(reddit_id=f'a{i}', title=f'Post {i}', subreddit=self.subreddit, upvotes=upvotes,
+                                submission_date=self.day + datetime.timedelta(days=i // 2))
+            for i, upvotes in enumerate([0, 1, 5, 40])
+        ]
+        Comment.objects.create(reddit_id='ac1', post=self.posts[0], body='Hi', submission_date=self.day)
+        PostKeywordMatch.objects.create(post=self.posts[2], keyword=self.keyword)
+
+    def stats(self, action, **params):
+        params = {'since': '2026-03-01', 'until': '2026-03-02', **params}
+        return self.client.get(f'/api/stats/{action}/', params).data
+
+    def test_refresh_materialises_daily_rollups(self):
+        result = analytics.refresh_rollups()
+        self.assertEqual((result.full, result.days, result.subreddit_rows, result.keyword_rows), (True, 2, 2, 1))
+        first = SubredditDailyStats.objects.get(day=datetime.date(2026, 3, 1))
+        self.assertEqual((first.posts, first.comments, first.upvotes_total, first.upvotes_max), (2, 1, 1, 1))
+        self.assertEqual(first.upvote_histogram[:2], [1, 1])
+        self.assertEqual(KeywordDailyStats.objects.get().day, datetime.date(2026, 3, 2))
+
+        totals = self.stats('subreddits')['subreddits'][0]
+        self.assertEqual((totals['posts'], totals['comments'], totals['upvotes_max']), (4, 1, 40))
+        upvotes = self.stats('upvotes')
+        self.assertEqual((upvotes['posts'], upvotes['percentiles']['p50'], upvotes['percentiles']['p99']), (4, 1, 32))
+        keywords = self.stats('keywords')['keywords']
+        self.assertEqual((keywords[0]['posts'], keywords[0]['hit_rate']), (1, 0.25))
+
+        # Only the day of the changed post is recomputed
+        Post.objects.filter(pk=self.posts[3].pk).update(upvotes=100, updated_at=timezone.now())
+        result = analytics.refresh_rollups()
+        self.assertEqual((result.full, result.days), (False, 1))
+        self.assertEqual(self.stats('subreddits')['subreddits'][0]['upvotes_max'], 100)
+
+    def test_keyword_stats_filter_by_subreddit(self):
+        other = Subreddit.objects.create(name='slavelabour')
+        other_posts = [
+            Post.objects.create(reddit_id=f'b{i}', title=f'Other {i}', subreddit=other, submission_date=self.day)
+            for i in range(3)
+        ]
+        comment = Comment.objects.create(reddit_id='bc1', post=other_posts[0], body='Hi', submission_date=self.day)
+        PostKeywordMatch.objects.bulk_create(PostKeywordMatch(post=post, keyword=self.keyword) for post in other_posts)
+        CommentKeywordMatch.objects.create(comment=comment, keyword=self.keyword)
+        analytics.refresh_rollups()
+        self.assertEqual(KeywordDailyStats.objects.count(), 2)
+
+        for name, posts, comments, hit_rate in [('forhire', 1, 0, 0.25), ('slavelabour', 3, 1, 1.0)]:
+            keyword = self.stats('keywords', subreddit=name)['keywords'][0]
+            self.assertEqual((keyword['posts'], keyword['comments'], keyword['hit_rate']), (posts, comments, hit_rate))
+        keyword = self.stats('keywords')['keywords'][0]
+        self.assertEqual((keyword['posts'], keyword['comments'], keyword['hit_rate']), (4, 1, round(4 / 7, 4)))
+
+    def test_pure_python_aggregation_matches_numpy(self):
+        if analytics.np is None:
+            self.skipTest('NumPy is not installed')
+        rows = [(1, datetime.date(2026, 3, day % 3 + 1), upvotes)
+                for day, upvotes in enumerate([0, -2, 1, 3, 4, 1000, 2 ** 30])]
+        histograms = [[1] * analytics.HISTOGRAM_BUCKETS, list(range(analytics.HISTOGRAM_BUCKETS))]
+        vectorised = (analytics.summarise_posts(rows), analytics.sum_histograms(histograms),
+                      analytics.histogram_percentiles(histograms[1]))
+        with mock.patch.object(analytics, 'np', None):
+            fallback = (analytics.summarise_posts(rows), analytics.sum_histograms(histograms),
+                        analytics.histogram_percentiles(histograms[1]))
+        self.assertEqual(vectorised, fallback)
+
+
+class AdminChangelistTests(TestCase):
+    rows = 100_000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='root', password='x', email='root@example.com')
+        subreddit = Subreddit.objects.create(name='forhire')
+        posts = Post.objects.bulk_create([
+            Post(reddit_id=f'ad{i}', title=f'Post {i}', subreddit=subreddit, subreddit_name='forhire',
+                 author=f'author{i % 50}')
+            for i in range(1000)
+        ])
+        Comment.objects.bulk_create([
+            Comment(reddit_id=f'adc{i}', post=posts[i % len(posts)], body=f'Comment {i}', author=f'author{i % 50}')
+            for i in range(cls.rows)
+        ], batch_size=5000)
+        # Replies on the first changelist page; parent_comment is nullable, so the admin would not join it by itself
+        parent = Comment.objects.order_by('id').first()
+        newest = Comment.objects.order_by('-id').values_list('id', flat=True)[200]
+        Comment.objects.filter(id__gt=newest).update(parent_comment=parent)
+        users = User.objects.bulk_create([User(username=f'reader{i}') for i in range(100)])
+        Notification.objects.bulk_create([
+            Notification(user=users[i % len(users)], type='New Post', content=f'Notification {i}')
+            for i in range(1000)
+        ])
+        CrawlHistory.objects.create(subreddit=None, start_time=timezone.now(), status='completed')
+        CrawlHistory.objects.create(subreddit=subreddit, start_time=timezone.now(), status='completed')
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE comment')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def changelist(self, model, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/admin/api/{model}/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        for model in ['post', 'comment', 'notification', 'crawlhistory', 'subscription']:
+            response, queries = self.changelist(model)
+            # Session, user, count and page queries, plus a few for the filters: no per-row queries
+            self.assertLessEqual(len(queries), 10, (model, queries))
+
+    def test_comment_changelist_avoids_full_count_on_postgresql(self):
+        response, queries = self.changelist('comment')
+        self.assertContains(response, 'Comment by author')
+        if connection.vendor == 'postgresql':
+            self.assertFalse([sql for sql in queries if 'COUNT(*)' in sql.upper()], queries)
+            # The estimate comes from the planner statistics refreshed in setUpTestData
+            self.assertAlmostEqual(response.context['cl'].result_count, self.rows, delta=self.rows // 100)
+
+    @skipUnless(connection.vendor == 'postgresql', 'Indexed admin search requires PostgreSQL')
+    def test_search_uses_indexed_lookups(self):
+        response, queries = self.changelist('comment', '?q=author7')
+        self.assertFalse([sql for sql in queries if 'LIKE' in sql.upper()], queries)
+        self.assertEqual(response.context['cl'].result_count, self.rows // 50)
+
+    def test_crawl_history_without_subreddit(self):
+        crawl = CrawlHistory.objects.get(subreddit=None)
+        self.assertTrue(str(crawl).startswith('Crawl of all subreddits'))
+        response, _ = self.changelist('crawlhistory')
+        self.assertContains(response, 'completed')
+
+    def test_crawl_history_changelist_is_indexed(self):
+        response, queries = self.changelist('crawlhistory', '?q=forhire&status=completed')
+        self.assertIsNone(response.context['cl'].date_hierarchy)
+        self.assertEqual(response.context['cl'].result_count, 1)
+        self.assertFalse([sql for sql in queries if 'LIKE' in sql.upper()], queries)
+        # Only the filtered count: no second count of the whole table
+        self.assertEqual(len([sql for sql in queries if 'COUNT(' in sql.upper()]), 1, queries)
+
+
+class InstrumentationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        request_stats.clear()
+        subreddit = Subreddit.objects.create(name='forhire')
+        self.post = Post.objects.create(reddit_id='m1', title='Measured', subreddit=subreddit)
+
+    @override_settings(SERVER_TIMING_ENABLED=True)
+    def test_server_timing_and_percentiles(self):
+        response = self.client.get('/api/posts/')
+        timing = dict(part.strip().split(';', 1) for part in response['Server-Timing'].split(','))
+        self.assertEqual(set(timing), {'db', 'app', 'serialize', 'render', 'total'})
+        self.assertIn('queries', timing['db'])
+
+        self.client.force_authenticate(User.objects.create(username='ops', is_staff=True))
+        summary = self.client.get('/api/metrics/requests/').data
+        self.assertEqual(summary['post-list']['requests'], 1)
+        self.assertEqual(summary['post-list']['query_budget'], 4)
+        self.assertGreater(summary['post-list']['size_p50'], 0)
+
+    @override_settings(SERVER_TIMING_ENABLED=True)
+    def test_serialization_is_timed_apart_from_the_view(self):
+        represent = PostSerializer.to_representation
+
+        def slow_representation(serializer, instance):
+            time.sleep(0.05)
+            return represent(serializer, instance)
+
+        with mock.patch.object(PostSerializer, 'to_representation', slow_representation):
+            response = self.client.get(f'/api/posts/{self.post.pk}/')
+        timing = {name: float(value.split('dur=')[1].split(';')[0]) for name, value in
+                  (part.strip().split(';', 1) for part in response['Server-Timing'].split(','))}
+        self.assertGreaterEqual(timing['serialize'], 50)
+        self.assertLess(timing['app'], 50)
+
+    def test_exceeding_a_query_budget_fails(self):
+        with override_settings(QUERY_BUDGETS={'post-list': 0}):
+            with self.assertRaisesMessage(QueryBudgetExceeded, 'post-list ran'):
+                self.client.get('/api/posts/')
+
+
+class BenchmarkTests(TestCase):
+    def test_generated_corpus_is_consistent_and_removable(self):
+        volumes = benchmarks.Volumes(subreddits=2, users=4, premium_share=0.5, posts=12,
+                                     comments_per_post=3, notifications_per_user=5)
+        counts = benchmarks.generate(volumes, seed=1)
+        self.assertEqual(counts['posts'], 12)
+        self.assertEqual(counts['comments'], Comment.objects.filter(post__reddit_id__startswith='bench-').count())
+        # The counters written by the generator agree with a reconciliation
+        self.assertEqual(reconcile_post_counts(), 0)
+        self.assertEqual(reconcile_subreddit_counters(), 0)
+        self.assertEqual(User.objects.filter(username__startswith='bench-user-', membership_status='Premium').count(), 2)
+
+        micro = benchmarks.signal_benchmarks(repeat=2)
+        self.assertEqual(micro['create post']['runs'], 2)
+        # The signal benchmarks are rolled back
+        self.assertFalse(Post.objects.filter(reddit_id__startswith='bench-signal').exists())
+
+        benchmarks.cleanup()
+        self.assertFalse(benchmarks.generated_subreddits().exists())
+        self.assertFalse(benchmarks.generated_users().exists())
+        self.assertFalse(Comment.objects.filter(reddit_id__startswith='bench-').exists())
+
+    def test_compare_flags_regressions(self):
+        before = {'http': {'post-list': {'p95_ms': 10.0, 'throughput_rps': 100.0}}}
+        after = {'http': {'post-list': {'p95_ms': 15.0, 'throughput_rps': 120.0}}}
+        rows = benchmarks.compare(before, after)
+        self.assertEqual(rows, [('http', 'post-list', 'p95_ms', 10.0, 15.0, 50.0),
+                                ('http', 'post-list', 'throughput_rps', 100.0, 120.0, 20.0)])
+        self.assertTrue(benchmarks.is_regression('p95_ms', 50.0, threshold=10))
+        self.assertFalse(benchmarks.is_regression('throughput_rps', 20.0, threshold=10))
+
+
+class AsyncReadPathTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.subreddit = Subreddit.objects.create(name='forhire')
+        other = Subreddit.objects.create(name='slavelabour')
+        self.post = Post.objects.create(reddit_id='a1', title='First', upvotes=5, subreddit=self.subreddit)
+        Post.objects.create(reddit_id='a2', title='Second', upvotes=9, subreddit=other)
+        top = Comment.objects.create(reddit_id='ac1', post=self.post, body='Top')
+        Comment.objects.create(reddit_id='ac2', post=self.post, parent_comment=top, body='Reply')
+        Keyword.objects.create(phrase='react', active=True)
+
+    def get_async(self, path, **extra):
+        return async_to_sync(self.async_client.get)(path, **extra)
+
+    def test_responses_match_the_sync_endpoints(self):
+        for path in ['posts/', f'posts/?subreddit={self.subreddit.pk}', 'posts/?ordering=-upvotes&page_size=1',
+                     'posts/?cursor=&page_size=1', f'posts/{self.post.pk}/', f'posts/{self.post.pk}/comments/',
+                     'subreddits/?search=hire']:
+            expected = self.client.get(f'/api/{path}').json()
+            response = self.get_async(f'/api/async/{path}')
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(json.loads(response.content.decode().replace('/api/async/', '/api/')), expected, path)
+
+        self.assertEqual(self.get_async('/api/async/posts/999999/').status_code, 404)
+        self.assertEqual(self.get_async('/api/async/posts/?subreddit=abc').status_code, 400)
+
+    def test_responses_are_cached_and_invalidated(self):
+        first = self.get_async('/api/async/posts/')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        self.assertEqual(self.get_async('/api/async/posts/', headers={'If-None-Match': first['ETag']}).status_code, 304)
+        Post.objects.create(reddit_id='a3', title='Third', subreddit=self.subreddit)
+        response = self.get_async('/api/async/posts/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['count'], 3)
+
+    def test_active_keywords_keep_their_permission(self):
+        self.assertEqual(self.get_async('/api/async/keywords/active/').status_code, 403)
+        self.async_client.force_login(User.objects.create(username='admin', is_staff=True))
+        response = self.get_async('/api/async/keywords/active/')
+        self.assertEqual([keyword['phrase'] for keyword in response.json()], ['react'])
+
+    def test_async_register_and_login(self):
+        post = async_to_sync(self.async_client.post)
+        response = post('/api/async/auth/register/', {'username': 'newbie', 'password': 'Secret-pass-123',
+                                                      'email': 'newbie@example.com'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        token = response.json()['token']
+
+        response = post('/api/async/auth/login/', {'username': 'newbie', 'password': 'Secret-pass-123'},
+                        content_type='application/json')
+        self.assertEqual(response.json()['token'], token)
+        response = post('/api/async/auth/login/', {'username': 'newbie', 'password': 'wrong'},
+                        content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(post('/api/async/auth/register/', {'username': 'newbie'},
+                              content_type='application/json').status_code, 400)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        replicas.replica_health.reset()
+        patcher = mock.patch.object(replicas, 'measure_lag', return_value=0.0)
+        self.measure_lag = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(replicas.replica_health.reset)
+
+    def request(self, method, path, token='reader'):
+        request = RequestFactory().generic(method, path, HTTP_AUTHORIZATION=f'Token {token}')
+        request.resolver_match = resolve(path)
+        return request
+
+    def route(self, request, model=Post):
+        token = replicas._request.set(request)
+        try:
+            return replicas.ReplicaRouter().db_for_read(model)
+        finally:
+            replicas._request.reset(token)
+
+    def test_content_reads_go_to_a_replica(self):
+        self.assertEqual(self.route(self.request('GET', '/api/posts/')), 'replica_0')
+        self.assertEqual(self.route(self.request('GET', '/api/keywords/'), Keyword), 'replica_0')
+        self.assertEqual(self.route(self.request('GET', '/api/async/subreddits/'), Subreddit), 'replica_0')
+        # Users, writes, views not marked replica_reads and code outside requests use the primary
+        self.assertIsNone(self.route(self.request('GET', '/api/posts/'), User))
+        self.assertIsNone(self.route(self.request('POST', '/api/posts/')))
+        self.assertIsNone(self.route(self.request('GET', '/api/notifications/')))
+        self.assertIsNone(replicas.ReplicaRouter().db_for_read(Post))
+        self.assertEqual(replicas.ReplicaRouter().db_for_write(Post), 'default')
+        self.assertFalse(replicas.ReplicaRouter().allow_migrate('replica_0', 'api'))
+
+    def test_writer_reads_from_the_primary_for_a_while(self):
+        replicas.pin_to_primary(self.request('POST', '/api/posts/', token='writer'))
+        self.assertIsNone(self.route(self.request('GET', '/api/posts/', token='writer')))
+        self.assertEqual(self.route(self.request('GET', '/api/posts/', token='reader')), 'replica_0')
+        # A lagging replica makes the pin last until it has caught up
+        self.measure_lag.return_value = 8.2
+        replicas.replica_health.refresh()
+        self.assertEqual(replicas.pin_seconds(), 9)
+
+    def test_unhealthy_replicas_fall_back_to_the_primary(self):
+        self.measure_lag.side_effect = DatabaseError('connection refused')
+        with self.assertLogs('api', 'WARNING'):
+            self.assertIsNone(self.route(self.request('GET', '/api/posts/')))
+        self.assertEqual(replicas.replica_health.status(), {'replica_0': {'healthy': False, 'lag': None}})
+
+        self.measure_lag.side_effect = None
+        self.measure_lag.return_value = 60.0
+        replicas.replica_health.refresh()
+        self.assertIsNone(self.route(self.request('GET', '/api/posts/')))
+
+    def test_replica_responses_are_not_cached_right_after_a_change(self):
+        request = self.request('GET', '/api/posts/')
+        caching.bump_versions(caching.POSTS)
+        self.assertFalse(caching.replica_may_be_stale(request, [caching.POSTS]))
+        request.read_replica = 'replica_0'
+        self.assertTrue(caching.replica_may_be_stale(request, [caching.POSTS]))
+        self.assertFalse(caching.replica_may_be_stale(request, [caching.STATS]))
+
+
+@skipUnless('replica_0' in settings.DATABASES, 'Needs DATABASE_REPLICA_URLS')
+@override_settings(DATABASE_REPLICAS=['replica_0'], QUERY_BUDGETS={}, DEFERRED_TASKS_ASYNC=False)
+class ReplicaIntegrationTests(APITransactionTestCase):
+    # The replica mirrors the test database through its own connection, which only sees committed rows
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        replicas.replica_health.reset()
+        # Lets the test database be dropped; a pooled connection stays open after close() until its pool is closed
+        replica = connections['replica_0']
+        if hasattr(replica, 'close_pool'):
+            self.addCleanup(replica.close_pool)
+        self.addCleanup(replica.close)
+
+    def test_reads_go_through_the_replica(self):
+        subreddit = Subreddit.objects.create(name='forhire')
+        Post.objects.create(reddit_id='r1', title='Replicated', subreddit=subreddit)
+        with CaptureQueriesContext(connections['replica_0']) as replica_queries:
+            response = self.client.get('/api/posts/')
+        self.assertEqual([post['title'] for post in response.json()['results']], ['Replicated'])
+        self.assertTrue(replica_queries.captured_queries)
+
+        # The writer then reads its own writes from the primary
+        token, _ = Token.objects.get_or_create(user=User.objects.create_user(username='writer', password='pass'))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        response = self.client.post('/api/posts/', {'reddit_id': 'r2', 'title': 'Mine', 'subreddit': subreddit.pk})
+        self.assertEqual(response.status_code, 201)
+        with CaptureQueriesContext(connections['replica_0']) as replica_queries:
+            response = self.client.get('/api/posts/')
+        self.assertEqual(response.json()['count'], 2)
+        self.assertFalse(replica_queries.captured_queries)
+
+
+class ConnectionPoolTests(APITestCase):
+    def test_pool_metrics(self):
+        self.assertEqual(self.client.get('/api/metrics/db-pool/').status_code, 403)
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        stats = self.client.get('/api/metrics/db-pool/').json()['default']
+        if settings.DATABASE_POOL and connection.vendor == 'postgresql':
+            self.assertGreaterEqual(stats['in_use'], 1)
+        else:
+            self.assertIsNone(stats)
+
+    def test_pool_stats(self):
+        pool = mock.Mock(_waiting=[object()])
+        pool.get_stats.return_value = {'pool_min': 2, 'pool_max': 10, 'pool_size': 4, 'pool_available': 1,
+                                       'requests_num': 40, 'requests_queued': 4, 'requests_wait_ms': 200,
+                                       'connections_num': 4, 'connections_ms': 20}
+        with mock.patch.object(type(connections['default']), 'pool', pool, create=True):
+            stats = pool_stats('default')
+        self.assertEqual((stats['in_use'], stats['idle'], stats['waiting']), (3, 1, 1))
+        self.assertEqual((stats['acquire_wait_ms_mean'], stats['acquire_wait_ms_mean_queued']), (5, 50))
+        self.assertEqual((stats['connect_ms_mean'], stats['acquire_errors']), (5, 0))
+
+
+class FastListTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='reader', membership_status='Premium')
+        subreddit = Subreddit.objects.create(name='forhire')
+        now = timezone.now()
+        for i in range(5):
+            Post.objects.create(reddit_id=f'f{i}', title=f'Post {i} \u2028 caf\u00e9 \U0001f600', subreddit=subreddit,
+                                upvotes=i % 2, submission_date=None if i == 4 else now - datetime.timedelta(days=i))
+            Notification.objects.create(user=self.user, type='Test', content=f'Notification {i}', read_status=i == 0)
+        for post in Post.objects.all()[:2]:
+            create_thread(post, 4)
+
+    def get(self, path, fast):
+        cache.clear()
+        with override_settings(FAST_LIST_SERIALIZATION=fast, ORJSON_ENABLED=fast):
+            response = self.client.get(f'/api/{path}')
+        self.assertEqual(response.status_code, 200, path)
+        return response.content
+
+    def test_responses_match_the_drf_path(self):
+        paths = ['posts/', 'posts/?ordering=-upvotes', 'posts/?cursor=&page_size=2', 'posts/?cursor=&ordering=upvotes',
+                 'posts/?search=cafe', 'comments/', 'comments/?cursor=&page_size=3']
+        with mock.patch.object(ValuesSerializer, 'rows', autospec=True, side_effect=ValuesSerializer.rows) as rows:
+            for path in paths:
+                self.assertEqual(self.get(path, True), self.get(path, False), path)
+        self.assertTrue(rows.called)
+
+        # The cursor of a fast path page continues where the DRF path would
+        next_url = json.loads(self.get('posts/?cursor=&page_size=2', True))['next']
+        self.assertEqual(self.get(next_url.split('/api/')[1], True), self.get(next_url.split('/api/')[1], False))
+
+        self.client.force_authenticate(self.user)
+        self.client.post('/api/notifications/mark_all_read/')
+        Notification.objects.create(user=self.user, type='Test', content='New')
+        self.assertEqual(self.get('notifications/', True), self.get('notifications/', False))
+        read = [item['read_status'] for item in json.loads(self.get('notifications/', True))['results']]
+        self.assertEqual(read, [False, True, True, True, True, True])
+
+    def test_comment_replies_in_one_query(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/comments/')
+        replies = {comment['id']: [reply['id'] for reply in comment['replies']] for comment in response.json()['results']}
+        for comment in Comment.objects.all():
+            self.assertEqual(replies[comment.id], [reply.id for reply in comment.replies.all()])
+
+    def test_renderer_output_matches_json_renderer(self):
+        for data in [{'float': 1e16, 'small': 0.00001}, [{'nested': [1.5]}], {'price': Decimal('1.10')},
+                     {'line': 'a\u2028b\u2029c', 'date': timezone.now(), 'day': datetime.date(2024, 1, 2)},
+                     {1: 'int key'}, {'big': 2 ** 70}, {'text': 'caf\u00e9 \U0001f600', 'none': None}]:
+            self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data), data)
+
+    def test_parser_falls_back_to_json_parser(self):
+        parse = lambda body: ORJSONParser().parse(io.BytesIO(body), parser_context={})
+        self.assertEqual(parse('{"title": "caf\u00e9", "n": [1, 2.5]}'.encode()), {'title': 'caf\u00e9', 'n': [1, 2.5]})
+        # Lone surrogates are accepted by the json module but not by orjson
+        self.assertEqual(parse(b'{"s": "\\ud800"}'), {'s': '\ud800'})
+        with self.assertRaises(ParseError):
+            parse(b'{"title": ')
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/posts/', '{"title": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='reader')
+        subreddit = Subreddit.objects.create(name='forhire')
+        self.post = Post.objects.create(reddit_id='s1', title='First', body='Long body', upvotes=3, subreddit=subreddit)
+        Post.objects.create(reddit_id='s2', title='Second', upvotes=5, subreddit=subreddit)
+        create_thread(self.post, 4)
+
+    def get(self, path, fast=True):
+        cache.clear()
+        with override_settings(FAST_LIST_SERIALIZATION=fast), CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/{path}')
+        self.assertEqual(response.status_code, 200, path)
+        return response.json(), [query['sql'] for query in queries.captured_queries]
+
+    def test_lists_load_only_the_requested_columns(self):
+        for fast in (True, False):
+            data, queries = self.get('posts/?fields=title,id,unknown&ordering=-upvotes&cursor=', fast)
+            self.assertEqual(data['results'], [{'id': post.id, 'title': post.title}
+                                               for post in Post.objects.order_by('-upvotes')])
+            self.assertNotIn('"reddit_id"', queries[-1])
+
+            # Without a fieldset, lists still leave out the columns their serializer does not output
+            data, queries = self.get('posts/', fast)
+            self.assertNotIn('body', data['results'][0])
+            self.assertNotIn('"body"', queries[-1])
+
+            data, queries = self.get('comments/?omit=replies,body', fast)
+            self.assertEqual(len(queries), 2)
+            self.assertFalse({'replies', 'body'} & set(data['results'][0]))
+
+    def test_detail_skips_the_comment_tree(self):
+        data, queries = self.get(f'posts/{self.post.pk}/?fields=title,body')
+        self.assertEqual(data, {'title': 'First', 'body': 'Long body'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"upvotes"', queries[0])
+
+        data, _ = self.get(f'posts/{self.post.pk}/?omit=comments')
+        self.assertNotIn('comments', data)
+        data, _ = self.get(f'posts/{self.post.pk}/comments/?fields=id,replies')
+        self.assertEqual(set(data['results'][0]), {'id', 'replies'})
+        # Nested comments keep all their fields
+        self.assertIn('body', data['results'][0]['replies'][0])
+
+    def test_notifications_keep_the_read_watermark(self):
+        Notification.objects.create(user=self.user, type='Test', content='Old')
+        self.client.force_authenticate(self.user)
+        self.client.post('/api/notifications/mark_all_read/')
+        for fast in (True, False):
+            data, _ = self.get('notifications/?fields=read_status', fast)
+            self.assertEqual(data['results'], [{'read_status': True}])
+            data, _ = self.get('notifications/?fields=content', fast)
+            self.assertEqual(data['results'], [{'content': 'Old'}])
+
+    def test_async_views_match(self):
+        for path in ['posts/?fields=id,title', 'posts/?omit=subreddit_name&cursor=', f'posts/{self.post.pk}/?omit=comments',
+                     f'posts/{self.post.pk}/?fields=comments', f'posts/{self.post.pk}/comments/?fields=body']:
+            expected, _ = self.get(path)
+            response = async_to_sync(self.async_client.get)(f'/api/async/{path}')
+            self.assertEqual(json.loads(response.content.decode().replace('/api/async/', '/api/')), expected, path)
+
+    @override_settings(QUERY_BUDGETS={})
+    def test_writes_ignore_the_fieldset(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.patch(f'/api/posts/{self.post.pk}/?fields=title', {'body': 'Edited'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['body'], 'Edited')
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.title, self.post.body), ('First', 'Edited'))
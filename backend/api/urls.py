@@ -11,11 +11,33 @@ router.register(r'notifications', views.NotificationViewSet, basename='notificat
 router.register(r'subscriptions', views.SubscriptionViewSet, basename='subscription')
 router.register(r'keywords', views.KeywordViewSet)
 router.register(r'crawl-history', views.CrawlHistoryViewSet)
+router.register(r'stats', views.StatsViewSet, basename='stats')
+
+# Async read path, for the ASGI app (see the async views in views.py)
+async_urlpatterns = [
+    path('posts/', views.async_post_list, name='async-post-list'),
+    path('posts/<int:pk>/', views.async_post_detail, name='async-post-detail'),
+    path('posts/<int:pk>/comments/', views.async_post_comments, name='async-post-comments'),
+    path('keywords/active/', views.async_active_keywords, name='async-keyword-active'),
+    path('subreddits/', views.async_subreddit_list, name='async-subreddit-list'),
+    path('auth/login/', views.async_login_view, name='async-login'),
+    path('auth/register/', views.async_register_view, name='async-register'),
+]
 
 urlpatterns = [
+    path('async/', include(async_urlpatterns)),
     path('', include(router.urls)),
     path('auth/login/', views.login_view, name='login'),
     path('auth/register/', views.register_view, name='register'),
     path('me/', views.current_user, name='current_user'),
     path('notifications/mark-all-read/', views.mark_all_notifications_read, name='mark_all_notifications_read'),
+    path('ingest/', views.ingest_view, name='ingest'),
+    path('metrics/auth-cache/', views.auth_cache_metrics, name='auth_cache_metrics'),
+    path('metrics/requests/', views.request_metrics, name='request_metrics'),
+    path('metrics/replicas/', views.replica_metrics, name='replica_metrics'),
+    path('metrics/db-pool/', views.db_pool_metrics, name='db_pool_metrics'),
+    path('metrics/notification-retention/', views.notification_retention_metrics,
+         name='notification_retention_metrics'),
+    path('export/<str:dataset>/', views.export_view, name='export'),
+    path('stream/', views.event_stream_view, name='event_stream'),
 ]
\ No newline at end of file
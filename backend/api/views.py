@@ -1,60 +1,100 @@
+import datetime
+import functools
+from collections import defaultdict
+from django.utils import timezone
+from django.conf import settings
 from django.shortcuts import get_object_or_404
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import (
+    APIException, AuthenticationFailed, NotAuthenticated, NotFound, PermissionDenied, ValidationError
+)
 from django.contrib.auth import authenticate
 from rest_framework import viewsets, status, permissions, filters
 from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.authtoken.models import Token
-from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import User, Subreddit, Post, Comment, Notification, Subscription, Keyword, CrawlHistory
+from django.db.models import Count, Sum
+from .models import (
+    User, Subreddit, Post, Comment, Notification, Subscription, Keyword, CrawlHistory,
+    PostKeywordMatch, CommentKeywordMatch, SubredditDailyStats, KeywordDailyStats
+)
+from .comment_tree import get_comment_tree, aget_comment_tree
+from .pagination import StandardResultsSetPagination, FeedPagination
+from .search import FullTextSearchFilter, post_search_vector, comment_search_vector
+from .filters import PostFilter, AsyncPostFilter, CommentFilter
+from .caching import CachedResponseMixin, cache_response
+from .fastpath import FastListMixin, get_values_serializer
+from .fieldsets import defer_columns, requested_fields
+from .renderers import render_json
+from . import caching
+from .ingestion import ingest_crawl
+from .authentication import CachedTokenAuthentication, token_cache
+from .retention import retention_metrics
+from .instrumentation import request_stats
+from .replicas import replica_health
+from .pooling import all_pool_stats
+from .export import aiter_chunks, export_stream
+from . import analytics
+from .realtime import POSTS_CHANNEL, event_stream, hub, user_channel
+from .notifications import get_notification_state, recount_unread
+from . import notifications
 from .serializers import (
     UserSerializer, UserCreateSerializer, SubredditSerializer,
-    PostSerializer, PostListSerializer, CommentSerializer,
+    PostSerializer, PostListSerializer, CommentSerializer, CommentBasicSerializer,
     NotificationSerializer, SubscriptionSerializer,
     KeywordSerializer, CrawlHistorySerializer
 )
 
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 25
-    page_size_query_param = 'page_size'
-    max_page_size = 100
+def log_in(data):
+    """Token and profile of the user with the credentials in ``data``, or None"""
+    user = authenticate(username=data.get('username'), password=data.get('password'))
+    if user is None:
+        return None
+    token, created = Token.objects.get_or_create(user=user)
+    return {
+        'token': token.key,
+        'user': UserSerializer(user).data
+    }
+
+
+def register(data):
+    """Create the user described by ``data``; returns ``(token and profile, None)`` or ``(None, errors)``"""
+    serializer = UserCreateSerializer(data=data)
+    if not serializer.is_valid():
+        return None, serializer.errors
+    user = serializer.save()
+    token, created = Token.objects.get_or_create(user=user)
+    return {
+        'token': token.key,
+        'user': UserSerializer(user).data
+    }, None
 
 
 @api_view(['POST'])
 def login_view(request):
     """Custom login view to authenticate users and return token"""
-    username = request.data.get('username')
-    password = request.data.get('password')
-
-    user = authenticate(username=username, password=password)
-
-    if user:
-        token, created = Token.objects.get_or_create(user=user)
-        serializer = UserSerializer(user)
-        return Response({
-            'token': token.key,
-            'user': serializer.data
-        })
-
+    result = log_in(request.data)
+    if result:
+        return Response(result)
     return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
 
 @api_view(['POST'])
 def register_view(request):
     """Register a new user"""
-    serializer = UserCreateSerializer(data=request.data)
-
-    if serializer.is_valid():
-        user = serializer.save()
-        token, created = Token.objects.get_or_create(user=user)
-        return Response({
-            'token': token.key,
-            'user': UserSerializer(user).data
-        }, status=status.HTTP_201_CREATED)
-
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    result, errors = register(request.data)
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result, status=status.HTTP_201_CREATED)
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -82,8 +122,11 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class SubredditViewSet(viewsets.ModelViewSet):
+class SubredditViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """API endpoint for subreddits"""
+    replica_reads = True
+    cache_namespaces = (caching.SUBREDDITS,)
+    cache_timeout = 300
     queryset = Subreddit.objects.all()
     serializer_class = SubredditSerializer
     pagination_class = StandardResultsSetPagination
@@ -98,13 +141,18 @@ class SubredditViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(CachedResponseMixin, FastListMixin, viewsets.ModelViewSet):
     """API endpoint for posts"""
+    replica_reads = True
+    cache_namespaces = (caching.POSTS, caching.COMMENTS, caching.SUBREDDITS, caching.KEYWORDS,
+                        caching.KEYWORD_MATCHES)
     queryset = Post.objects.all().order_by('-submission_date')
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['subreddit', 'author', 'manually_added']
+    pagination_class = FeedPagination
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
+    filterset_class = PostFilter
     search_fields = ['title', 'body']
+    search_vector = staticmethod(post_search_vector)
+    search_highlight_field = 'body'
     ordering_fields = ['submission_date', 'upvotes', 'comments_count']
 
     def get_serializer_class(self):
@@ -131,28 +179,53 @@ class PostViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     @action(detail=True, methods=['get'])
+    @cache_response
     def comments(self, request, pk=None):
         """Get all comments for a specific post"""
         post = self.get_object()
-        comments = Comment.objects.filter(post=post, parent_comment=None)  # Get top-level comments only
+        comments = get_comment_tree(post)  # Top-level comments with their reply trees
+
+        fields = requested_fields(request.query_params, CommentSerializer)
 
         # Apply pagination
         page = self.paginate_queryset(comments)
         if page is not None:
-            serializer = CommentSerializer(page, many=True)
+            serializer = CommentSerializer(page, many=True, context=self.get_serializer_context(), fields=fields)
             return self.get_paginated_response(serializer.data)
 
-        serializer = CommentSerializer(comments, many=True)
+        serializer = CommentSerializer(comments, many=True, context=self.get_serializer_context(), fields=fields)
         return Response(serializer.data)
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(CachedResponseMixin, FastListMixin, viewsets.ModelViewSet):
     """API endpoint for comments"""
+    replica_reads = True
+    cache_namespaces = (caching.COMMENTS, caching.KEYWORDS, caching.KEYWORD_MATCHES)
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter]
-    filterset_fields = ['post', 'author']
+    field_prefetches = {'replies': ['replies']}
+    # Plus the replies, see add_fast_list_relations()
+    fast_list_serializer_class = CommentBasicSerializer
+    pagination_class = FeedPagination
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter]
+    filterset_class = CommentFilter
     search_fields = ['body']
+    search_vector = staticmethod(comment_search_vector)
+    search_highlight_field = 'body'
+
+    def add_fast_list_relations(self, rows):
+        # CommentSerializer.get_replies: each comment's direct replies, fetched in one query like the prefetch
+        fields = self.get_fieldset()
+        if fields is not None and 'replies' not in fields:
+            return rows
+        replies = defaultdict(list)
+        if rows:
+            values_serializer = get_values_serializer(CommentBasicSerializer)
+            queryset = Comment.objects.filter(parent_comment__in=[row['id'] for row in rows])
+            for reply in values_serializer.rows(values_serializer.values(queryset)):
+                replies[reply['parent_comment']].append(reply)
+        for row in rows:
+            row['replies'] = replies.get(row['id'], [])
+        return rows
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -162,33 +235,74 @@ class CommentViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(FastListMixin, viewsets.ModelViewSet):
     """API endpoint for notifications"""
     serializer_class = NotificationSerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = FeedPagination
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         """
         This view should return a list of all notifications
-        for the currently authenticated user.
+        for the currently authenticated user; ``?unread=true`` keeps the unread ones.
         """
         user = self.request.user
-        return Notification.objects.filter(user=user).order_by('-created_at')
+        queryset = Notification.objects.filter(user=user).order_by('-created_at')
+        if self.request.query_params.get('unread', '').lower() in ('1', 'true', 'yes'):
+            read_up_to = get_notification_state(user.pk)['read_up_to']
+            queryset = queryset.filter(read_status=False, id__gt=read_up_to)
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.request.user.is_authenticated:
+            context['notifications_read_up_to'] = get_notification_state(self.request.user.pk)['read_up_to']
+        return context
+
+    def perform_update(self, serializer):
+        previous_user_id = serializer.instance.user_id
+        super().perform_update(serializer)
+        recount_unread({previous_user_id, serializer.instance.user_id})
+
+    @action(detail=False, methods=['get'], url_path='unread-count')
+    def unread_count(self, request):
+        """Number of unread notifications and the id of the latest one, served from cache"""
+        state = get_notification_state(request.user.pk)
+        return Response({'unread': state['unread'], 'latest_id': state['latest_id']})
+
+    @action(detail=False, methods=['get'])
+    def poll(self, request):
+        """
+        Notifications newer than ``?since=<id>`` (oldest first, at most
+        NOTIFICATION_POLL_LIMIT) plus the unread count. When nothing is newer
+        the answer comes from cache without touching the notification table.
+        """
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            return Response({'error': '"since" must be a notification id'}, status=status.HTTP_400_BAD_REQUEST)
+        state = get_notification_state(request.user.pk)
+        results = []
+        if state['latest_id'] > since:
+            results = self.get_serializer(
+                Notification.objects.filter(user=request.user, id__gt=since)
+                .order_by('id')[:settings.NOTIFICATION_POLL_LIMIT],
+                many=True,
+            ).data
+        return Response({'unread': state['unread'], 'latest_id': state['latest_id'],
+                         'notifications': results})
 
     @action(detail=False, methods=['post'])
     def mark_all_read(self, request):
         """Mark all notifications as read"""
-        user = request.user
-        Notification.objects.filter(user=user, read_status=False).update(read_status=True)
+        notifications.mark_all_read(request.user.pk)
         return Response({'status': 'All notifications marked as read'})
 
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
         """Mark a specific notification as read"""
         notification = self.get_object()
-        notification.read_status = True
-        notification.save()
+        notifications.mark_read(notification)
         return Response({'status': 'Notification marked as read'})
 
 
@@ -208,8 +322,11 @@ class SubscriptionViewSet(viewsets.ModelViewSet):
         return Subscription.objects.filter(user=user)
 
 
-class KeywordViewSet(viewsets.ModelViewSet):
+class KeywordViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """API endpoint for keywords"""
+    replica_reads = True
+    cache_namespaces = (caching.KEYWORDS,)
+    cache_timeout = 300
     queryset = Keyword.objects.all()
     serializer_class = KeywordSerializer
     pagination_class = StandardResultsSetPagination
@@ -224,23 +341,116 @@ class KeywordViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
 
     @action(detail=False, methods=['get'])
+    @cache_response
     def active(self, request):
         """Get only active keywords"""
         keywords = self.queryset.filter(active=True)
         serializer = self.get_serializer(keywords, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'])
+    def counts(self, request):
+        """Number of matching posts and comments per active keyword"""
+        keywords = dict(self.queryset.filter(active=True).order_by('phrase').values_list('id', 'phrase'))
+        # One grouped query per table, answered from the (keyword, post/comment) indexes
+        posts = dict(PostKeywordMatch.objects.filter(keyword_id__in=list(keywords))
+                     .values_list('keyword_id').annotate(count=Count('id')).order_by())
+        comments = dict(CommentKeywordMatch.objects.filter(keyword_id__in=list(keywords))
+                        .values_list('keyword_id').annotate(count=Count('id')).order_by())
+        return Response([
+            {'id': keyword_id, 'phrase': phrase,
+             'posts': posts.get(keyword_id, 0), 'comments': comments.get(keyword_id, 0)}
+            for keyword_id, phrase in keywords.items()
+        ])
+
 
 class CrawlHistoryViewSet(viewsets.ModelViewSet):
     """API endpoint for crawl history"""
     queryset = CrawlHistory.objects.all().order_by('-start_time')
     serializer_class = CrawlHistorySerializer
-    pagination_class = StandardResultsSetPagination
+    pagination_class = FeedPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['subreddit', 'status']
     permission_classes = [IsAdminUser]
 
 
+class StatsViewSet(CachedResponseMixin, viewsets.ViewSet):
+    """
+    Dashboard statistics served from the daily rollups (see api.analytics).
+    Every endpoint takes ``since``/``until`` dates (inclusive, defaulting to
+    the last STATS_DEFAULT_DAYS days) and an optional ``subreddit`` name.
+    """
+    cache_namespaces = (caching.STATS,)
+    cache_timeout = 300
+    permission_classes = [IsAdminUser]
+
+    def get_window(self, request):
+        params = request.query_params
+        try:
+            until = datetime.date.fromisoformat(params['until']) if params.get('until') else timezone.now().date()
+            if params.get('since'):
+                since = datetime.date.fromisoformat(params['since'])
+            else:
+                since = until - datetime.timedelta(days=settings.STATS_DEFAULT_DAYS - 1)
+        except ValueError:
+            raise ValidationError({'error': 'since and until must be dates (YYYY-MM-DD)'})
+        return since, until
+
+    def window_stats(self, request, model):
+        """Rows of a daily rollup ``model`` in the window, of the requested subreddit if any"""
+        since, until = self.get_window(request)
+        stats = model.objects.filter(day__gte=since, day__lte=until)
+        if request.query_params.get('subreddit'):
+            stats = stats.filter(subreddit__name__iexact=request.query_params['subreddit'])
+        return since, until, stats
+
+    def subreddit_stats(self, request):
+        return self.window_stats(request, SubredditDailyStats)
+
+    @action(detail=False, methods=['get'])
+    @cache_response
+    def subreddits(self, request):
+        """Posts and comments per subreddit per day, with totals over the window"""
+        since, until, stats = self.subreddit_stats(request)
+        rows = stats.values('subreddit__name', 'day', 'posts', 'comments', 'upvotes_total', 'upvotes_max')
+        return Response({'since': since, 'until': until, 'subreddits': analytics.subreddit_series(rows)})
+
+    @action(detail=False, methods=['get'])
+    @cache_response
+    def upvotes(self, request):
+        """Distribution of post upvotes over the window, as a histogram with approximate percentiles"""
+        since, until, stats = self.subreddit_stats(request)
+        histogram = analytics.sum_histograms(stats.values_list('upvote_histogram', flat=True))
+        return Response({
+            'since': since,
+            'until': until,
+            'posts': sum(histogram),
+            'percentiles': analytics.histogram_percentiles(histogram),
+            'buckets': [{'min': low, 'max': high, 'posts': count}
+                        for (low, high), count in zip(analytics.bucket_bounds(), histogram)],
+        })
+
+    @action(detail=False, methods=['get'])
+    @cache_response
+    def keywords(self, request):
+        """Matches per active keyword over the window, and the share of posts each one hit"""
+        since, until, stats = self.subreddit_stats(request)
+        total_posts = stats.aggregate(total=Sum('posts'))['total'] or 0
+        matches = (self.window_stats(request, KeywordDailyStats)[2].filter(keyword__active=True)
+                   .values('keyword_id', 'keyword__phrase').annotate(posts=Sum('posts'), comments=Sum('comments'))
+                   .order_by('-posts', 'keyword__phrase'))
+        return Response({
+            'since': since,
+            'until': until,
+            'posts': total_posts,
+            'keywords': [
+                {'id': row['keyword_id'], 'phrase': row['keyword__phrase'], 'posts': row['posts'],
+                 'comments': row['comments'], 'hit_rate': round(row['posts'] / total_posts, 4) if total_posts else None}
+                for row in matches
+            ],
+        })
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def current_user(request):
@@ -252,5 +462,268 @@ def current_user(request):
 @permission_classes([IsAuthenticated])
 def mark_all_notifications_read(request):
     """Mark all notifications as read for current user"""
-    Notification.objects.filter(user=request.user, read_status=False).update(read_status=True)
-    return Response({'status': 'All notifications marked as read'})
\ No newline at end of file
+    notifications.mark_all_read(request.user.pk)
+    return Response({'status': 'All notifications marked as read'})
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def ingest_view(request):
+    """Bulk upsert crawled posts and comments and return the run's counters"""
+    posts = request.data.get('posts', [])
+    comments = request.data.get('comments', [])
+    if not isinstance(posts, list) or not isinstance(comments, list):
+        return Response({'error': '"posts" and "comments" must be lists'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        result = ingest_crawl(posts=posts, comments=comments, subreddit=request.data.get('subreddit'))
+    except (KeyError, TypeError, ValueError) as exc:
+        return Response({'error': f'Invalid crawl data: {exc}'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result.as_dict(), status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def auth_cache_metrics(request):
+    """Hit/miss statistics of this process's token authentication cache"""
+    return Response(token_cache.stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def request_metrics(request):
+    """Per-view latency, database time and query count percentiles of this process's recent requests"""
+    return Response(request_stats.summary())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def replica_metrics(request):
+    """Health and replication lag of the read replicas, as last checked by this process"""
+    return Response(replica_health.status())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def db_pool_metrics(request):
+    """Connection pool usage of this process, per database (null when not pooled)"""
+    return Response(all_pool_stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def notification_retention_metrics(request):
+    """Rows pruned by the recent notification retention runs"""
+    return Response(retention_metrics())
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_view(request, dataset):
+    """
+    Stream every post or comment matching the filters as NDJSON or CSV
+    (``?output=``), gzipped when the client accepts it. Rows come in id order;
+    pass the last id received as ``?after_id=`` to resume an interrupted export.
+    """
+    params = request.query_params.copy()
+    output = params.pop('output', ['ndjson'])[-1]
+    after_id = params.pop('after_id', [None])[-1]
+    compress = 'gzip' in request.headers.get('Accept-Encoding', '')
+    try:
+        if after_id is not None:
+            after_id = int(after_id)
+        content_type, chunks = export_stream(dataset, params, output=output, after_id=after_id, compress=compress)
+    except ValueError as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if isinstance(request._request, ASGIRequest):
+        chunks = aiter_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{output}"'
+    response['Vary'] = 'Accept-Encoding'
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    return response
+
+
+async def event_stream_view(request):
+    """
+    Server-Sent Events stream of new posts and, for clients passing their
+    token (``?token=`` since EventSource cannot set headers), their notifications.
+    Needs the ASGI app; under WSGI it would hold a worker thread per client.
+    """
+    channels = [POSTS_CHANNEL]
+    key = request.GET.get('token')
+    if key:
+        try:
+            user, _ = await sync_to_async(CachedTokenAuthentication().authenticate_credentials)(key)
+        except AuthenticationFailed as exc:
+            return JsonResponse({'error': str(exc.detail)}, status=status.HTTP_401_UNAUTHORIZED)
+        channels.append(user_channel(user.pk))
+
+    if hub.connections >= settings.REALTIME_MAX_CONNECTIONS:
+        return JsonResponse({'error': 'Too many open streams, poll instead'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    response = StreamingHttpResponse(event_stream(hub.subscribe(channels)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# Async read path
+#
+# Async counterparts of the hot public endpoints, served under /api/async/
+# with the same response bodies. They use the async ORM and cache API, so
+# under the ASGI app a request waiting on the database or the cache does not
+# hold a worker thread. DRF views cannot be async, hence plain Django views.
+
+def json_response(data, status=status.HTTP_200_OK):
+    # Byte for byte what the DRF views render
+    return HttpResponse(render_json(data), status=status, content_type='application/json')
+
+
+def handle_api_errors(view):
+    """Turn DRF exceptions raised by an async view into JSON error responses, as DRF views do"""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        try:
+            return await view(request, *args, **kwargs)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return json_response(detail, status=exc.status_code)
+    return wrapper
+
+
+def check_permissions(request, permission_classes):
+    """Apply DRF permissions to an async view's request; call it in a worker thread, as authenticating may query"""
+    for permission_class in permission_classes:
+        if not permission_class().has_permission(request, None):
+            if request.user.is_authenticated:
+                raise PermissionDenied()
+            # What DRF answers when the first authenticator (session) has no challenge header
+            raise PermissionDenied(NotAuthenticated.default_detail)
+
+
+def cached_read(*namespaces, timeout=None, permission_classes=()):
+    """
+    Serve an async function returning response data as a GET endpoint through
+    the response cache (ETag, 304 and X-Cache, like ``CachedResponseMixin``).
+    The function is passed a DRF ``Request`` for query params and page links.
+    """
+    def decorator(get_data):
+        @functools.wraps(get_data)
+        async def view(request, *args, **kwargs):
+            api_request = Request(request, authenticators=[
+                authenticator() for authenticator in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+            if permission_classes:
+                await sync_to_async(check_permissions)(api_request, permission_classes)
+            etag, data, cache_status = await caching.acached_data(
+                request, get_data.__name__, namespaces, timeout,
+                lambda: get_data(api_request, *args, **kwargs))
+            if etag is not None and caching.etag_matches(request, etag):
+                response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = json_response(data)
+            if etag is not None:
+                response['ETag'] = etag
+                response['X-Cache'] = cache_status
+            return response
+        view = require_GET(handle_api_errors(view))
+        # Cached reads serve crawled content, which may lag slightly (see api/replicas.py)
+        view.replica_reads = True
+        return view
+    return decorator
+
+
+@cached_read(*PostViewSet.cache_namespaces)
+async def async_post_list(request):
+    """``GET /api/posts/`` with the same filters, ordering and pagination, except full-text search"""
+    if request.query_params.get('search'):
+        raise ValidationError({'search': 'Full-text search is only available on /api/posts/'})
+    filterset = AsyncPostFilter(request.query_params, queryset=PostViewSet.queryset.all())
+    if not filterset.is_valid():
+        raise ValidationError(filterset.errors)
+    queryset = filters.OrderingFilter().filter_queryset(request, filterset.qs, PostViewSet)
+    fields = requested_fields(request.query_params, PostListSerializer)
+    queryset = defer_columns(queryset, PostListSerializer, fields)
+    pagination = FeedPagination()
+    page = await pagination.apaginate_queryset(queryset, request)
+    serializer = PostListSerializer(page, many=True, context={'request': request}, fields=fields)
+    return pagination.get_paginated_response(serializer.data).data
+
+
+async def get_post(pk, queryset=Post.objects):
+    try:
+        return await queryset.aget(pk=pk)
+    except Post.DoesNotExist:
+        raise NotFound()
+
+
+@cached_read(*PostViewSet.cache_namespaces)
+async def async_post_detail(request, pk):
+    """``GET /api/posts/<id>/``"""
+    fields = requested_fields(request.query_params, PostSerializer)
+    post = await get_post(pk, defer_columns(Post.objects.all(), PostSerializer, fields))
+    context = {'request': request}
+    if fields is None or 'comments' in fields:
+        context['comment_tree'] = await aget_comment_tree(post)
+    return PostSerializer(post, context=context, fields=fields).data
+
+
+@cached_read(*PostViewSet.cache_namespaces)
+async def async_post_comments(request, pk):
+    """``GET /api/posts/<id>/comments/``"""
+    if not await Post.objects.filter(pk=pk).aexists():
+        raise NotFound()
+    pagination = FeedPagination()
+    # The tree is a list, so it is paginated in memory
+    page = pagination.paginate_queryset(await aget_comment_tree(pk), request)
+    serializer = CommentSerializer(page, many=True, context={'request': request},
+                                   fields=requested_fields(request.query_params, CommentSerializer))
+    return pagination.get_paginated_response(serializer.data).data
+
+
+@cached_read(*KeywordViewSet.cache_namespaces, timeout=KeywordViewSet.cache_timeout,
+             permission_classes=[IsAdminUser])
+async def async_active_keywords(request):
+    """``GET /api/keywords/active/``"""
+    keywords = [keyword async for keyword in KeywordViewSet.queryset.filter(active=True)]
+    return KeywordSerializer(keywords, many=True, context={'request': request}).data
+
+
+@cached_read(*SubredditViewSet.cache_namespaces, timeout=SubredditViewSet.cache_timeout)
+async def async_subreddit_list(request):
+    """``GET /api/subreddits/``, including ``?search=``"""
+    queryset = filters.SearchFilter().filter_queryset(request, SubredditViewSet.queryset.all(), SubredditViewSet)
+    pagination = StandardResultsSetPagination()
+    page = await pagination.apaginate_queryset(queryset, request)
+    serializer = SubredditSerializer(page, many=True, context={'request': request})
+    return pagination.get_paginated_response(serializer.data).data
+
+
+def request_data(request):
+    return Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES]).data
+
+
+@csrf_exempt
+@require_POST
+@handle_api_errors
+async def async_login_view(request):
+    """``login_view`` for the ASGI app; the password hashing runs in a worker thread"""
+    result = await sync_to_async(log_in)(request_data(request))
+    if result:
+        return json_response(result)
+    return json_response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
+
+
+@csrf_exempt
+@require_POST
+@handle_api_errors
+async def async_register_view(request):
+    """``register_view`` for the ASGI app; validation and password hashing run in a worker thread"""
+    result, errors = await sync_to_async(register)(request_data(request))
+    if errors:
+        return json_response(errors, status=status.HTTP_400_BAD_REQUEST)
+    return json_response(result, status=status.HTTP_201_CREATED)
@@ -0,0 +1,4 @@
+try:
+    from .celery import app as celery_app
+except ImportError:  # pragma: no cover - celery is only needed with CELERY_BROKER_URL (see api/tasks.py)
+    celery_app = None
@@ -0,0 +1,9 @@
+import os
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bountyboard.settings')
+
+# Workers for the deferred tasks of api/tasks.py: celery -A bountyboard worker
+app = Celery('bountyboard')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import json
 import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,6 +51,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so that it measures the whole request (see api/instrumentation.py)
+    'api.instrumentation.InstrumentationMiddleware',
+    # Lets api.replicas.ReplicaRouter see the request and pins writers to the primary
+    'api.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -84,13 +89,55 @@ WSGI_APPLICATION = 'bountyboard.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Persistent connections are per thread. Under ASGI every request runs its sync
+# code in a new thread, so asgi.py turns them off (DATABASE_CONN_MAX_AGE=0)
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', 600))
+# Connection pooling (PostgreSQL with psycopg 3, see api/pooling.py): each process shares
+# DATABASE_POOL_MIN_SIZE to DATABASE_POOL_MAX_SIZE connections between all its threads instead
+# of keeping one per thread, which caps a server's connections at workers * max size.
+# A request waits up to DATABASE_POOL_TIMEOUT seconds for a free connection, then fails
+DATABASE_POOL = os.environ.get('DATABASE_POOL', 'False') == 'True'
+DATABASE_POOL_OPTIONS = {
+    'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+    'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 10)),
+    'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+    # Seconds before an idle connection above min_size, and any connection, is replaced
+    'max_idle': float(os.environ.get('DATABASE_POOL_MAX_IDLE', 300)),
+    'max_lifetime': float(os.environ.get('DATABASE_POOL_MAX_LIFETIME', 3600)),
+}
+
+
+def database_config(url):
+    # Pooled connections are checked (an empty query) each time they are taken from the pool
+    config = dj_database_url.parse(url, conn_max_age=0 if DATABASE_POOL else DATABASE_CONN_MAX_AGE,
+                                   conn_health_checks=DATABASE_POOL)
+    if DATABASE_POOL and config['ENGINE'] == 'django.db.backends.postgresql':
+        config.setdefault('OPTIONS', {})['pool'] = dict(DATABASE_POOL_OPTIONS)
+    return config
+
+
 DATABASES = {
-    'default': dj_database_url.config(
-        default=os.environ.get('DATABASE_URL', 'postgres://postgres:1@postgres:5433/postgres'),
-        conn_max_age=600
-    )
+    'default': database_config(os.environ.get('DATABASE_URL', 'postgres://postgres:1@postgres:5433/postgres')),
 }
 
+# Read replicas (see api/replicas.py), as comma-separated database URLs, e.g.
+# DATABASE_REPLICA_URLS=postgres://reader@replica1/bb,postgres://reader@replica2/bb
+# Safe-method requests to the content views read from them; writes always go to the primary
+DATABASE_REPLICAS = []
+for index, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(','))):
+    alias = f'replica_{index}'
+    DATABASES[alias] = database_config(url.strip())
+    # Tests read the replicas through the primary's connection
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+# Seconds a client reads from the primary after a write (longer while the replicas lag more)
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+# Replicas lagging more than this many seconds are not read from
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 10))
+# Seconds between checks of the replicas' reachability and lag
+REPLICA_HEALTH_CHECK_INTERVAL = float(os.environ.get('REPLICA_HEALTH_CHECK_INTERVAL', 10))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -138,11 +185,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CORS_ALLOW_ALL_ORIGINS = True  # Change for production
 
 # REST Framework settings
+# HTTP Basic auth hashes the password on every request; it is only enabled on demand
+API_BASIC_AUTH = os.environ.get('API_BASIC_AUTH', 'False') == 'True'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
-        'rest_framework.authentication.TokenAuthentication',
+        *(['rest_framework.authentication.BasicAuthentication'] if API_BASIC_AUTH else []),
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -150,14 +200,184 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
 }
 
+# Serialization settings
+# JSON is encoded and decoded with orjson when it is installed, with the same output as DRF's renderer
+ORJSON_ENABLED = os.environ.get('ORJSON_ENABLED', 'True') == 'True'
+# Post, comment and notification listings are serialized from .values() rows instead of model instances
+FAST_LIST_SERIALIZATION = os.environ.get('FAST_LIST_SERIALIZATION', 'True') == 'True'
+
+# Comment tree settings
+# Maximum reply depth and number of comments loaded when rendering a post's comment tree
+COMMENT_TREE_MAX_DEPTH = int(os.environ.get('COMMENT_TREE_MAX_DEPTH', 10))
+COMMENT_TREE_MAX_COMMENTS = int(os.environ.get('COMMENT_TREE_MAX_COMMENTS', 2000))
+
+# Deferred task settings
+# Work such as notification fan-out runs after commit: on Celery workers when a broker is configured
+# (delivered at least once), otherwise in a background thread pool of the web process (lost if it exits first)
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL')
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+# One task at a time per worker process, so that an unacknowledged task is not held back by a busy worker
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+DEFERRED_TASKS_ASYNC = os.environ.get('DEFERRED_TASKS_ASYNC', 'True') == 'True'
+DEFERRED_TASKS_WORKERS = int(os.environ.get('DEFERRED_TASKS_WORKERS', 2))
+
+# Number of premium users notified per bulk insert
+NOTIFICATION_FANOUT_BATCH_SIZE = int(os.environ.get('NOTIFICATION_FANOUT_BATCH_SIZE', 1000))
+# Seconds a user's unread count/latest id stays cached; new or read notifications invalidate it right away
+NOTIFICATION_STATE_CACHE_TIMEOUT = int(os.environ.get('NOTIFICATION_STATE_CACHE_TIMEOUT', 300))
+# Maximum notifications returned by one /notifications/poll/ call
+NOTIFICATION_POLL_LIMIT = int(os.environ.get('NOTIFICATION_POLL_LIMIT', 50))
+# Days notifications are kept before `manage.py prune_notifications` removes them (0 keeps them forever),
+# with per-type overrides given as a JSON object, e.g. '{"New Post": 30}'
+NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 180))
+NOTIFICATION_RETENTION_DAYS_BY_TYPE = json.loads(os.environ.get('NOTIFICATION_RETENTION_DAYS_BY_TYPE',
+                                                                '{"New Post": 30}'))
+# Notifications deleted per transaction
+NOTIFICATION_RETENTION_BATCH_SIZE = int(os.environ.get('NOTIFICATION_RETENTION_BATCH_SIZE', 2000))
+# Directory pruned notifications are archived to as gzipped NDJSON; unset deletes them without a copy
+NOTIFICATION_ARCHIVE_DIR = os.environ.get('NOTIFICATION_ARCHIVE_DIR')
+
+# Crawl ingestion settings
+# Number of posts/comments upserted per bulk statement
+INGESTION_BATCH_SIZE = int(os.environ.get('INGESTION_BATCH_SIZE', 500))
+
+# Seconds a process trusts its compiled keyword matcher before checking the Keyword table for changes
+KEYWORD_MATCHER_CHECK_INTERVAL = int(os.environ.get('KEYWORD_MATCHER_CHECK_INTERVAL', 30))
+# Rows scanned per chunk when (re)building or pruning stored keyword matches
+KEYWORD_SCAN_CHUNK_SIZE = int(os.environ.get('KEYWORD_SCAN_CHUNK_SIZE', 2000))
+
+# Rows fetched per server-side cursor round trip and encoded per chunk by the streaming export
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+
+# Analytics rollup settings (see api/analytics.py)
+# Days recomputed per transaction, and rows fetched per cursor round trip while doing so
+STATS_DAYS_PER_BATCH = int(os.environ.get('STATS_DAYS_PER_BATCH', 7))
+STATS_CHUNK_SIZE = int(os.environ.get('STATS_CHUNK_SIZE', 5000))
+# Seconds before the watermark that a refresh re-reads, for rows that committed late
+STATS_WATERMARK_OVERLAP = int(os.environ.get('STATS_WATERMARK_OVERLAP', 300))
+# Days covered by /api/stats/ when no range is given
+STATS_DEFAULT_DAYS = int(os.environ.get('STATS_DEFAULT_DAYS', 30))
+
+# Admin changelists of tables larger than this many rows show PostgreSQL's row estimate instead of a COUNT(*)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int(os.environ.get('ADMIN_ESTIMATED_COUNT_THRESHOLD', 10000))
+
+# Request instrumentation settings (see api/instrumentation.py)
+# Add Server-Timing headers with query count, DB, serialization, render and total time to every response
+SERVER_TIMING_ENABLED = os.environ.get('SERVER_TIMING_ENABLED', str(DEBUG)) == 'True'
+# Latest requests kept per view for the /api/metrics/requests/ percentiles
+REQUEST_METRICS_SAMPLES = int(os.environ.get('REQUEST_METRICS_SAMPLES', 1000))
+# Maximum SQL queries per request, by URL name. An overrun is logged as a warning,
+# and fails the request under the test runner (QUERY_BUDGETS_STRICT). The budgets leave room for
+# the two queries of session authentication
+QUERY_BUDGETS = {
+    'post-list': 4,
+    'post-detail': 4,
+    'post-comments': 4,
+    'comment-list': 5,
+    'subreddit-list': 4,
+    'keyword-list': 3,
+    'keyword-counts': 5,
+    'notification-list': 5,
+    'notification-unread-count': 4,
+    'notification-poll': 5,
+    'notification-mark-read': 6,
+    'notification-mark-all-read': 4,
+    'current_user': 3,
+    'stats-subreddits': 3,
+    'stats-upvotes': 3,
+    'stats-keywords': 4,
+    'async-post-list': 4,
+    'async-post-detail': 4,
+    'async-post-comments': 4,
+    'async-keyword-active': 4,
+    'async-subreddit-list': 4,
+}
+QUERY_BUDGETS_STRICT = os.environ.get('QUERY_BUDGETS_STRICT', 'False') == 'True'
+TEST_RUNNER = 'api.instrumentation.InstrumentedTestRunner'
+
+# Cache settings
+# A shared Redis cache when REDIS_URL is set, per-process memory otherwise (development and tests)
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# API response cache settings (see api/caching.py)
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'True') == 'True'
+RESPONSE_CACHE_ALIAS = 'default'
+RESPONSE_CACHE_PREFIX = 'api'
+# Default lifetime of a cached response in seconds; views can override it with cache_timeout
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 60))
+
+# Token authentication cache (see api/authentication.py)
+# Tokens cached per process, and seconds before a cached token is checked against the database again
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 60))
+
+# Realtime push settings (see api/realtime.py); the stream needs the ASGI app (bountyboard.asgi)
+REALTIME_ENABLED = os.environ.get('REALTIME_ENABLED', 'True') == 'True'
+# api.realtime.LocalBackend for a single worker, api.realtime.RedisBackend to fan out across workers and
+# processes (the default with Redis: events are published by whichever process handles the write)
+REALTIME_REDIS_URL = os.environ.get('REALTIME_REDIS_URL')
+REALTIME_BACKEND = os.environ.get('REALTIME_BACKEND', 'api.realtime.RedisBackend' if REALTIME_REDIS_URL or REDIS_URL
+                                  else 'api.realtime.LocalBackend')
+# Events buffered per connection before a slow client is cut off
+REALTIME_QUEUE_SIZE = int(os.environ.get('REALTIME_QUEUE_SIZE', 100))
+# Open streams per worker; further clients get a 503 and fall back to polling
+REALTIME_MAX_CONNECTIONS = int(os.environ.get('REALTIME_MAX_CONNECTIONS', 10000))
+# Seconds between keepalive comments, and the reconnect delay suggested to clients
+REALTIME_HEARTBEAT = int(os.environ.get('REALTIME_HEARTBEAT', 15))
+REALTIME_RETRY_MS = int(os.environ.get('REALTIME_RETRY_MS', 5000))
+
+# Membership settings
+# Seconds a user's entitlement stays cached; subscription changes invalidate it right away
+ENTITLEMENT_CACHE_TIMEOUT = int(os.environ.get('ENTITLEMENT_CACHE_TIMEOUT', 300))
+# Users downgraded per UPDATE by `manage.py expire_memberships`
+MEMBERSHIP_EXPIRY_BATCH_SIZE = int(os.environ.get('MEMBERSHIP_EXPIRY_BATCH_SIZE', 1000))
+
+# Full-text search settings
+# Text search configuration used by the PostgreSQL search indexes (see api/search.py)
+SEARCH_CONFIG = 'english'
+
 # Reddit API settings
 # REDDIT_CLIENT_ID = os.environ.get('REDDIT_CLIENT_ID', 'ZdHLafxpZo6OtKIIn0uPOA')
 # REDDIT_CLIENT_SECRET = os.environ.get('REDDIT_CLIENT_SECRET', 'PZRwrx8xwktG1-LZIGrpYZGl2oqNpg')
 # REDDIT_USER_AGENT = os.environ.get('REDDIT_USER_AGENT', 'fr.allaboutfrance:v1.0 (by /u/One-Accountant2011)')
+REDDIT_BASE_URL = os.environ.get('REDDIT_BASE_URL', 'https://www.reddit.com')
+REDDIT_USER_AGENT = os.environ.get('REDDIT_USER_AGENT', 'bountyboard-crawler/1.0')
+
+# Crawler settings
+CRAWLER_MAX_CONNECTIONS = int(os.environ.get('CRAWLER_MAX_CONNECTIONS', 8))
+CRAWLER_REQUESTS_PER_MINUTE = int(os.environ.get('CRAWLER_REQUESTS_PER_MINUTE', 60))
+CRAWLER_MAX_RETRIES = int(os.environ.get('CRAWLER_MAX_RETRIES', 4))
+# Pages of 100 posts fetched per subreddit when it has never been crawled
+CRAWLER_MAX_PAGES = int(os.environ.get('CRAWLER_MAX_PAGES', 5))
+# Seconds re-crawled before the last completed crawl, to catch late-indexed posts
+CRAWLER_CURSOR_OVERLAP = int(os.environ.get('CRAWLER_CURSOR_OVERLAP', 300))
 
 # Logging configuration
 LOGGING = {
@@ -195,6 +415,10 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': True,
         },
+        # One JSON line per request from api.instrumentation, through the api handlers
+        'api.requests': {
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'INFO'),
+        },
     },
 }
 
@@ -0,0 +1,10 @@
+import pytest
+from api.instrumentation import test_settings
+
+
+@pytest.fixture(autouse=True, scope='session')
+def instrumented_test_settings():
+    """The settings InstrumentedTestRunner applies to ``manage.py test`` runs"""
+    test_settings.enable()
+    yield
+    test_settings.disable()